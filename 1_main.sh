@@ -54,6 +54,19 @@ HITE_CHUNK_SIZE=${HITE_CHUNK_SIZE:-200}
 CDHIT_MEM_MB=$(( USABLE_MB>2048 ? USABLE_MB-2048 : USABLE_MB ))
 (( CDHIT_MEM_MB < 2048 )) && CDHIT_MEM_MB=2048
 
+# 9) cd-hit threads. Set CDHIT_PARTITION=true to cluster the combined TE sequences in independent partitions instead - CDHIT_WORKERS cd-hit runs at once, which scales far better
+#    than cd-hit's own -T threads, but a pair of sequences near 80% identity that the partitioning sketch misses stays in two clusters (see Scripts/_partition_cdhit.py).
+CDHIT_WORKERS=${CDHIT_WORKERS:-$JOB_THREADS}
+CDHIT_PARTITION=${CDHIT_PARTITION:-false}
+
+# 10) Number of pfam_scan.py runs at once - the representative ORFs are split into residue-balanced shards that are scanned in parallel.
+PFAM_WORKERS=${PFAM_WORKERS:-$JOB_THREADS}
+
+# 11) Pfam fast mode - scan the ORFs against a pressed sub-database of TE-associated Pfam families only (RVT, rve, Transposase_*, DDE_*, Helitron_like_N ...) instead of all of Pfam-A.
+#     Set PFAM_FAST_MODE=true for the built-in list, or PFAM_TE_DOMAINS to a file of Pfam names/accessions (one per line) for a list of your own. The full database stays the default.
+PFAM_FAST_MODE=${PFAM_FAST_MODE:-false}
+PFAM_TE_DOMAINS=${PFAM_TE_DOMAINS:-}
+
 # ============================================================================================================================================
 
 
@@ -71,6 +84,9 @@ pfam_outputs=false
 earlgrey_new_reference_library=""
 hite_plant_genome=false
 
+# SQLite results database - if given, the final results are also stored in it (see Scripts/_results_db.py for how to query it)
+results_db=""
+
 
 
 # === Manually handle long flags (before getopts) ===
@@ -100,12 +116,23 @@ while [[ $i -le $# ]]; do # while i is less than or equal to the number of posit
         echo "   -p                      : Keep PFAM intermediate output files"
         echo "   --reference_library <file.fa>     : Use custom consensus library (instead of default Dfam)"
         echo "   --plant                           : Indicates genome is a plant (for HiTE) - default is No"
+        echo "   --results_db <file.sqlite>        : Also store the results in an SQLite results database (one database can hold many genomes)"
         echo ""
         exit 1
       fi
       earlgrey_new_reference_library="$val"
       i=$((i+1))
       ;;
+    --results_db)
+      next=$((i+1))
+      val="${!next}" # this is used to store the argument that comes after a --results_db
+      if [[ -z "$val" || "$val" == --* || "$val" == -* ]]; then #if value after --results_db is empty or if value is another flag instead of a file path, throw error
+        echo "Error: --results_db requires a file path argument." >&2
+        exit 1
+      fi
+      results_db="$val"
+      i=$((i+1))
+      ;;
     --plant) # if --plant argument is present, set the hite_plant_genome to true
       hite_plant_genome=true
       ;;
@@ -125,6 +152,7 @@ while [[ $i -le $# ]]; do # while i is less than or equal to the number of posit
       echo "   -p                      : Keep PFAM intermediate output files"
       echo "   --reference_library <file.fa>     : Use custom consensus library (instead of default Dfam)"
       echo "   --plant                           : Indicates genome is a plant (for HiTE)"
+      echo "   --results_db <file.sqlite>        : Also store the results in an SQLite results database (one database can hold many genomes)"
       echo ""
       exit 1
       ;;
@@ -163,6 +191,7 @@ while getopts "g:tefcp" opt; do
       echo "   -p                      : Keep PFAM intermediate output files"
       echo "   --reference_library <file.fa>     : Use custom consensus library (instead of default Dfam)"
       echo "   --plant                           : Indicates genome is a plant (for HiTE)"
+      echo "   --results_db <file.sqlite>        : Also store the results in an SQLite results database (one database can hold many genomes)"
       echo ""
       exit 1
       ;;
@@ -188,6 +217,7 @@ if [[ -z "$genome" ]]; then
   echo "   -p                      : Keep PFAM intermediate output files"
   echo "   --reference_library <file.fa>     : Use custom consensus library (instead of default Dfam)"
   echo "   --plant                           : Indicates genome is a plant (for HiTE)"
+  echo "   --results_db <file.sqlite>        : Also store the results in an SQLite results database (one database can hold many genomes)"
   echo ""
   exit 1
 fi
@@ -206,6 +236,12 @@ if [[ -n "$earlgrey_new_reference_library" ]]; then
   echo "Provided earlgrey reference library: $earlgrey_new_reference_library"
 fi
 
+# If a results database is given, use its absolute path (the later steps run from different directories), and print it out
+if [[ -n "$results_db" ]]; then
+  results_db=$(realpath -m "$results_db")
+  echo "Results database: $results_db"
+fi
+
 
 # Store the base name of the genome from the inputted genome
 base_name=${genome%.*}
@@ -252,15 +288,8 @@ if [ -z "$EarlGrey_FamilyFile" ]; then
   echo "File ${base_name}-families.fa not found."
   exit 1
 else
-  # Add prefix to the sequences and store the result in a new file in the same directory
-  Prefixed_EarlGrey_FamilyFile="Prefixed_${base_name}-families.fa"
-  sed -E '/^>/ { s/^>/&EARLGREY_/; s/ /_/g; }' "$EarlGrey_FamilyFile" > "$TMPDIR/TE_pipeline_intermediate_outputs/earlGreyOutputs/$Prefixed_EarlGrey_FamilyFile"
-
-  # Move the new file to the main directory
-  mv "$TMPDIR/TE_pipeline_intermediate_outputs/earlGreyOutputs/$Prefixed_EarlGrey_FamilyFile" ./$final_outputs_folder
-
-  # Notify that the file has been moved
-  echo "File moved to $final_outputs_folder directory: $Prefixed_EarlGrey_FamilyFile"
+  # The sequences are prefixed with EARLGREY_ when all the TE files are combined (after MITEFINDER)
+  echo "Earl Grey TE file found: $EarlGrey_FamilyFile"
 fi
 
 end_time_earlgrey=$(date +%s)
@@ -305,18 +334,8 @@ if [ -z "$HiTE_TE_File" ]; then
   echo "File confident_TE.cons.fa not found."
   exit 1
 else
-  # Extract the base name of the HiTE file without the path - NOTE: The 'basename' command in Bash is used to strip directory and suffix from filenames eg. basename /usr/bin/sort # Output: sort
-  HiTE_TE_File_Base=$(basename "$HiTE_TE_File")
-
-  # Add prefix to the sequences and store the result in a new file in the same directory
-  Prefixed_HiTE_TE_File="Prefixed_${HiTE_TE_File_Base}"
-  sed -E '/^>/ { s/^>/&HITE_/; s/ /_/g; }' "$HiTE_TE_File" > "$TMPDIR/TE_pipeline_intermediate_outputs/${base_name}_HITE_outputs/$Prefixed_HiTE_TE_File"
-
-  # Move the new file to the main directory
-  mv "$TMPDIR/TE_pipeline_intermediate_outputs/${base_name}_HITE_outputs/$Prefixed_HiTE_TE_File" ./$final_outputs_folder
-
-  # Notify that the file has been moved
-  echo "File moved to $final_outputs_folder directory: $Prefixed_HiTE_TE_File"
+  # The sequences are prefixed with HITE_ when all the TE files are combined (after MITEFINDER)
+  echo "HiTE TE file found: $HiTE_TE_File"
 fi
 
 end_time_HiTE=$(date +%s)
@@ -347,18 +366,8 @@ if [ -z "$AnnoSINE_TE_File" ]; then
   echo "File *-matches.fa not found."
   exit 1
 else
-  # Extract the base name of the Annosine file without the path
-  AnnoSINE_TE_File_Base=$(basename "$AnnoSINE_TE_File")
-
-  # Add prefix to the sequences and store the result in a new file in the same directory
-  Prefixed_AnnoSINE_TE_File="Prefixed_${AnnoSINE_TE_File_Base}"
-  sed -E '/^>/ { s/^>/&ANNOSINE_/; s/ /_/g; }' "$AnnoSINE_TE_File" > "$TMPDIR/TE_pipeline_intermediate_outputs/${base_name}_ANNOSINE_outputs/$Prefixed_AnnoSINE_TE_File"
-
-  # Move the new file to the main directory
-  mv "$TMPDIR/TE_pipeline_intermediate_outputs/${base_name}_ANNOSINE_outputs/$Prefixed_AnnoSINE_TE_File" ./$final_outputs_folder
-
-  # Notify that the file has been moved
-  echo "File moved to $final_outputs_folder directory: $Prefixed_AnnoSINE_TE_File"
+  # The sequences are prefixed with ANNOSINE_ when all the TE files are combined (after MITEFINDER)
+  echo "AnnoSINE TE file found: $AnnoSINE_TE_File"
 fi
 
 end_time_annosine=$(date +%s)
@@ -389,18 +398,8 @@ if [ -z "$HELIANO_TE_File" ]; then
   echo "File RC.representative.fa not found."
   exit 1
 else
-  # Extract the base name of the Heliano file without the path
-  HELIANO_TE_File_Base=$(basename "$HELIANO_TE_File")
-
-  # Add prefix to the sequences and store the result in a new file in the same directory
-  Prefixed_HELIANO_TE_File="Prefixed_${HELIANO_TE_File_Base}"
-  sed -E '/^>/ { s/^>/&HELIANO_/; s/ /_/g; }' "$HELIANO_TE_File" > "$TMPDIR/TE_pipeline_intermediate_outputs/${base_name}_HELIANO_outputs/$Prefixed_HELIANO_TE_File"
-
-  # Move the new file to the main directory
-  mv "$TMPDIR/TE_pipeline_intermediate_outputs/${base_name}_HELIANO_outputs/$Prefixed_HELIANO_TE_File" ./$final_outputs_folder
-
-  # Notify that the file has been moved
-  echo "File moved to $final_outputs_folder directory: $Prefixed_HELIANO_TE_File"
+  # The sequences are prefixed with HELIANO_ when all the TE files are combined (after MITEFINDER)
+  echo "HELIANO TE file found: $HELIANO_TE_File"
 fi
 
 end_time_heliano=$(date +%s)
@@ -433,15 +432,8 @@ if [ ! -f "$MITEFINDER_TE_File" ]; then
     echo "File $MITEFINDER_TE_File not found."
     exit 1
 else
-    # Add prefix to the sequences and store the result in a new file in the same directory
-    Prefixed_MITEFINDER_TE_File="prefixed_mitefinder_file"
-    sed -E '/^>/ { s/^>/&MITEFINDER_/; s/ /_/g; }' "$MITEFINDER_TE_File" > "$TMPDIR/TE_pipeline_intermediate_outputs/mitefinder/$Prefixed_MITEFINDER_TE_File"
-
-    # Move the prefixed file to the main directory
-    mv "$TMPDIR/TE_pipeline_intermediate_outputs/mitefinder/$Prefixed_MITEFINDER_TE_File" ./$final_outputs_folder
-
-    # Notify that the file has been moved
-    echo "File moved to $final_outputs_folder directory: $Prefixed_MITEFINDER_TE_File"
+    # The sequences are prefixed with MITEFINDER_ when all the TE files are combined (below)
+    echo "MITEFINDER TE file found: $MITEFINDER_TE_File"
 fi
 
 end_time_mitefinder=$(date +%s)
@@ -452,9 +444,23 @@ echo "--------------------FINISHED MITEFINDER | ELAPSED TIME: $((elapsed_mitefin
 echo ""
 
 
-# Combine all prefixed files into a single file
+# Prefix the sequences of every tool and combine them into a single file, in one pass - exact duplicate sequences are only written once,
+# and the IDs of the ones left out are recorded in duplicates_file (format_data.py puts them back into their clusters after clustering)
+# If the user wants to keep the prefixed fasta files of the tools (-f), they are also written to TE_fastas_from_TE_Pipelines
 combined_file="COMBINED_TE_SEQUENCES_${base_name}.fa"
-cat "./$final_outputs_folder/$Prefixed_EarlGrey_FamilyFile" "./$final_outputs_folder/$Prefixed_HiTE_TE_File" "./$final_outputs_folder/$Prefixed_AnnoSINE_TE_File" "./$final_outputs_folder/$Prefixed_HELIANO_TE_File" "./$final_outputs_folder/$Prefixed_MITEFINDER_TE_File" > "$combined_file"
+duplicates_file="COLLAPSED_DUPLICATES_${base_name}.tsv"
+mkdir -p $TMPDIR/TE_fastas_from_TE_Pipelines
+prefixed_dir_option=()
+if [[ $prefixed_file_outputs == true ]]; then
+  prefixed_dir_option=(--prefixed-dir "$TMPDIR/TE_fastas_from_TE_Pipelines")
+fi
+python ./Scripts/_combine_fasta.py "$combined_file" "$duplicates_file" EARLGREY="$EarlGrey_FamilyFile" HITE="$HiTE_TE_File" ANNOSINE="$AnnoSINE_TE_File" HELIANO="$HELIANO_TE_File" MITEFINDER="$MITEFINDER_TE_File" "${prefixed_dir_option[@]}"
+
+# Check if the TE files were combined successfully - print error message if not
+if [ $? -ne 0 ]; then
+  echo "Combining the TE files into $combined_file failed."
+  exit 1
+fi
 
 # Check if the combined file was created - if not, print file not found message
 if [ ! -f "$combined_file" ]; then
@@ -470,40 +476,13 @@ fi
 
 
 
-# CD-HIT ROUND @ 95%
+# CD-HIT
 # Load necessary modules for cd-hit
 module purge
 module load StdEnv/2020
 module load gcc/13.3
 module load cd-hit/4.8.1
 
-# Run cd-hit-est - runs at 95% sequence coverage and 95% sequence identity threshold
-cd-hit-est -i "$combined_file" -o "Clustered_COMBINED_TE_SEQUENCES_${base_name}" -d 0 -aS 0.95 -c 0.95 -G 0 -g 1 -b 500 -M $CDHIT_MEM_MB -T $JOB_THREADS
-
-# Check if cd-hit-est ran successfully - print error message if not, confirmation message if yes
-if [ $? -ne 0 ]; then
-  echo "cd-hit-est encountered an error."
-  exit 1
-fi
-
-echo "cd-hit-est ran successfully and output file is Clustered_COMBINED_TE_SEQUENCES_${base_name}"
-
-
-# CD-HIT ROUND 2 @ 80%
-# After the first round of cd-hit is finished and a FASTA of representative sequences is produced, pass that into the second round of cd-hit for clustering
-
-# Run cd-hit-est - runs at 80% sequence coverage and 80% sequence identity threshold
-cd-hit-est -i "Clustered_COMBINED_TE_SEQUENCES_${base_name}" -o "FINAL_cdhit_${base_name}" -d 0 -aS 0.80 -c 0.80 -G 0 -g 1 -b 500 -M $CDHIT_MEM_MB -T $JOB_THREADS
-
-# Check if cd-hit-est ran successfully - print error message if not, confirmation message if yes
-if [ $? -ne 0 ]; then
-  echo "cd-hit-est encountered an error."
-  exit 1
-fi
-
-echo "cd-hit-est ran successfully and output file is FINAL_cdhit_${base_name}"
-
-
 
 # Virtual Environment Set-up
 
@@ -526,7 +505,7 @@ pip install --no-index --upgrade pip
 echo "pip has been upgraded"
 
 #Install necessary packages IF not already installed
-declare -a packages=("pandas" "openpyxl" "biopython")
+declare -a packages=("pandas" "openpyxl" "biopython" "pyarrow")
 
 for package in "${packages[@]}"
 do
@@ -557,9 +536,31 @@ echo "environment set-up complete."
 
 
 
+# CD-HIT ROUND 1 @ 95% AND ROUND 2 @ 80%
+# Both rounds of cd-hit-est run on the whole file (Round 1: 95% sequence coverage and 95% sequence identity threshold, round 2: the representatives of round 1
+# at 80% sequence coverage and 80% sequence identity threshold - the cd-hit options are in Scripts/_partition_cdhit.py)
+# With CDHIT_PARTITION=true, the combined sequences are split into components (sequences linked by shared spaced k-mers, the ones under 500 nt all together), both rounds
+# are run on every component - CDHIT_WORKERS cd-hit runs at once - and the outputs are stitched back together
+cdhit_partition_option=()
+[[ $CDHIT_PARTITION == true ]] && cdhit_partition_option=(--partition)
+python ./Scripts/_partition_cdhit.py "$combined_file" "Clustered_COMBINED_TE_SEQUENCES_${base_name}" "FINAL_cdhit_${base_name}" --workers $CDHIT_WORKERS --memory-mb $CDHIT_MEM_MB "${cdhit_partition_option[@]}"
+
+# Check if cd-hit-est ran successfully - print error message if not, confirmation message if yes
+if [ $? -ne 0 ]; then
+  echo "cd-hit-est encountered an error."
+  exit 1
+fi
+
+echo "cd-hit-est ran successfully and output files are Clustered_COMBINED_TE_SEQUENCES_${base_name} and FINAL_cdhit_${base_name}"
+
+# Index the final cd-hit FASTA (FINAL_cdhit_${base_name}.idx) so that the representative sequences can later be fetched by ID with direct seeks
+python ./Scripts/_fasta_index.py "FINAL_cdhit_${base_name}"
+
+
+
 # format_data.py
 # Calls the format_data.py script - ULTIMATELY OUTPUTS FINAL .csv FILE FOR USER
-python ./Scripts/format_data.py "FINAL_cdhit_${base_name}.clstr"
+python ./Scripts/format_data.py "FINAL_cdhit_${base_name}.clstr" --duplicates "$duplicates_file" ${results_db:+--results-db "$results_db"}
 
 
 # Add PFAM column to the main .CSV file
@@ -574,73 +575,57 @@ python ./Scripts/extract_representative_sequences.py "COMPLETE_TE_RESULTS_${base
 PIPELINE_ROOT="$(pwd)" # This is just the location to the current working directory (This is the same as the variable working_directory)
 
 REP_NUCLEOTIDE_FASTA="$PIPELINE_ROOT/Representative_Sequences_${base_name}.fasta" # This is a fasta containing all unkonwn consensus sequences from the main CSV file
-REP_ORF_FASTA="$PIPELINE_ROOT/Representative_ORFs_${base_name}.faa" # This is a fasta containing those translated nucleotides to amino acids from the previous fasta
+PREPROCESSED_REP_ORF_FASTA="$PIPELINE_ROOT/Preprocessed_Representative_ORFs_${base_name}.faa" # This is a fasta containing the ORFs of the previous fasta, translated to amino acids
 
-# Load EMBOSS (needs StdEnv/2020) and generate ORFs as proteins
-module load StdEnv/2020
-module load emboss/6.6.0
+# Generate the ORFs (at least 300 nt, between STOP codons, in all six frames - what 'getorf -minsize 300' found) as proteins, already named by the TE sequence headers present on the
+# COMPLETE_CSV file (the tool prefix dropped), so mapping can occur between the ORF file and the COMPLETE_CSV file
+python ./Scripts/_orf_finder.py "$REP_NUCLEOTIDE_FASTA" "$PREPROCESSED_REP_ORF_FASTA" --minsize 300
 
-getorf \
-  -sequence "$REP_NUCLEOTIDE_FASTA" -outseq "$REP_ORF_FASTA" -minsize 300
+# hmmer is loaded under StdEnv/2020 (as it was when EMBOSS was loaded here)
+module load StdEnv/2020
 
 PFAM_DB_DIR="$PIPELINE_ROOT/Databases/pfamdb" # Directory where the PFAM database is stored
 PFAM_SCAN_DIR="$PIPELINE_ROOT/Databases/pfam_scan" # Directory where the pfam_scan direcotory (which contains pfam_scan.py) is stored
 MERGE_SCRIPT="$PIPELINE_ROOT/Scripts/merge.py" # Location of the merge.py script
 OUTPUT_CSV="$PIPELINE_ROOT/pfam_output_${base_name}.csv" # Location of the pfam_output csv file
+PFAM_HIT_CACHE=${PFAM_HIT_CACHE-$PFAM_DB_DIR/hit_cache} # Pfam hits of every ORF scanned so far, shared by every genome run - only ORFs not seen before are scanned (set PFAM_HIT_CACHE="" to scan every ORF)
+PFAM_HIT_CACHE_MAX_GB=${PFAM_HIT_CACHE_MAX_GB:-5} # Size limit of the Pfam hit cache - the least recently used ORFs are evicted beyond it
 
 #Load HMMER Tool Suite, which includes hmmpress command
 module load hmmer
 
-# Check if Pfam library file (Pfam-A.hmm) already exists - if not, unzip the zipped file
-if [ ! -f "$PFAM_DB_DIR/Pfam-A.hmm" ]; then
-    # Unpack and prepare the database - currently, compressed files exist of the databse, therefore, unzip them
-    gunzip -c $PFAM_DB_DIR/Pfam-A.hmm.dat.gz > $PFAM_DB_DIR/Pfam-A.hmm.dat
-    gunzip -c $PFAM_DB_DIR/Pfam-A.hmm.gz > $PFAM_DB_DIR/Pfam-A.hmm
-    rm $PFAM_DB_DIR/Pfam-A.hmm.gz $PFAM_DB_DIR/Pfam-A.hmm.dat.gz
-else
-    echo "Pfam database already set up."
+# Get the shared, pre-pressed Pfam-A cache (Databases/pfamdb/pressed/Pfam-A_<checksum>) - it is built once (by setup.sh, or by the first run that needs it, under a lock so that
+# concurrent runs build it only once) and reused read-only by every genome run, instead of copying and pressing the Pfam-A files for every genome
+# In fast mode, the cache of the sub-database of the TE-associated families (Databases/pfamdb/pressed/Pfam-A_<checksum>_te_<list checksum>), built and reused the same way
+PFAM_CACHE_OPTIONS=()
+if [ -n "$PFAM_TE_DOMAINS" ]; then
+  PFAM_CACHE_OPTIONS=(--domains-file "$PFAM_TE_DOMAINS")
+elif [ "$PFAM_FAST_MODE" = true ]; then
+  PFAM_CACHE_OPTIONS=(--te-only)
 fi
+PFAM_PRESSED_DIR=$(python "$PIPELINE_ROOT/Scripts/_pfam_cache.py" "$PFAM_DB_DIR" "${PFAM_CACHE_OPTIONS[@]}")
 
-# Rename the Pfam-A.hmm file to make it specific to the genome running it. Also stores the copied HMM file in another directory.
-mkdir -p "$PFAM_DB_DIR/pfamdb_${base_name}"
-specified_HMM_File_name="Pfam-A_${base_name}.hmm"
-cp "$PFAM_DB_DIR/Pfam-A.hmm" "$PFAM_DB_DIR/pfamdb_${base_name}/$specified_HMM_File_name"
-cp "$PFAM_DB_DIR/Pfam-A.hmm.dat" "$PFAM_DB_DIR/pfamdb_${base_name}/${specified_HMM_File_name}.dat"
-
-# prepares the Pfam-A HMM database file for use with HMMER
-hmmpress "$PFAM_DB_DIR/pfamdb_${base_name}/$specified_HMM_File_name"
+if [ $? -ne 0 ] || [ -z "$PFAM_PRESSED_DIR" ]; then
+  echo "The pressed Pfam database could not be set up."
+  exit 1
+fi
 
 # Run pfam_scan.py to scan the FASTA file and get the output in CSV format
 cd "$PFAM_SCAN_DIR"
 
 # Debug paths
 echo "Current directory: $(pwd)" # This will show you the current directory you are in - pfam_scan directory
-echo "Contents of pfamdb_${base_name} directory:"
-ls -lh "$PFAM_DB_DIR/pfamdb_${base_name}" # This will show you all the content in the Pfamdb directory which will be used in pfam_scan.py
-
-
-PREPROCESSED_REP_ORF_FASTA="$PIPELINE_ROOT/Preprocessed_Representative_ORFs_${base_name}.faa" # Create a new variable to hold the preprocessed representative ORF fasta file path
+echo "Contents of the pressed Pfam directory $PFAM_PRESSED_DIR:"
+ls -lh "$PFAM_PRESSED_DIR" # This will show you all the content in the pressed Pfam directory which will be used in pfam_scan.py
 
 
-# This renames the .faa headers to match those on the representative_sequence.fa file, so mapping can occur between the ORF file and the TE sequence headers present on the COMPLETE_CSV file
-awk '
-  /^>/ {
-    split($0, a, " ");
-    h = a[length(a)];          # last space-delimited token (no leading ">")
-    sub(/^[^_]+_/, "", h);     # drop tool prefix + first underscore
-    print ">" h;
-    next
-  }
-  { print }
-' "$REP_ORF_FASTA" > "$PREPROCESSED_REP_ORF_FASTA"
+# Execute pfam_scan.py with corrected paths - in PFAM_WORKERS parallel shards of the ORFs, merged back into one csv in the order of the ORFs
+python "$PIPELINE_ROOT/Scripts/_pfam_shards.py" "$PREPROCESSED_REP_ORF_FASTA" "$PFAM_PRESSED_DIR" "$OUTPUT_CSV" --workers "$PFAM_WORKERS" --pfam-scan ./pfam_scan.py ${PFAM_HIT_CACHE:+--hit-cache "$PFAM_HIT_CACHE" --hit-cache-max-gb "$PFAM_HIT_CACHE_MAX_GB"}
 
-
-# Execute pfam_scan.py with corrected paths
-./pfam_scan.py "$PREPROCESSED_REP_ORF_FASTA" "$PFAM_DB_DIR/pfamdb_${base_name}" -out "$OUTPUT_CSV" -outfmt csv
-
-#rm compressed pfam files in pfamdb and the original ORF fasta file
-rm -r "$PFAM_DB_DIR/pfamdb_${base_name}"
-rm "$REP_ORF_FASTA"
+if [ $? -ne 0 ]; then
+  echo "pfam_scan.py encountered an error."
+  exit 1
+fi
 
 
 # Notify user
@@ -650,14 +635,13 @@ echo "Pfam scan completed. Output saved to $OUTPUT_CSV"
 #This final Python script will merge the pfam proteins into the main CSV
 cd $PIPELINE_ROOT
 
-python "$MERGE_SCRIPT" "COMPLETE_TE_RESULTS_${base_name}.csv" "$OUTPUT_CSV"
+python "$MERGE_SCRIPT" "COMPLETE_TE_RESULTS_${base_name}.csv" "$OUTPUT_CSV" ${results_db:+--results-db "$results_db"}
 
 
 
 # ORGANIZING MAIN FOLDER
 # Create necessary directories
 mkdir -p $TMPDIR/earlgrey_genome_support_files
-mkdir -p $TMPDIR/TE_fastas_from_TE_Pipelines
 mkdir -p $TMPDIR/"cd-hit_round_1_outputs"
 mkdir -p $TMPDIR/"cd-hit_round_2_outputs"
 mkdir -p $TMPDIR/"pfam_intermediate_outputs"
@@ -676,28 +660,24 @@ for file in *; do
    elif [[ "$file" == ${Round1_cd_hit_prefix}* ]]; then
       mv "$file" $TMPDIR/"cd-hit_round_1_outputs/"
 
-   # Move Round 2 cd-hit files to cd-hit_round_2_outputs - unless it is the final cd-hit FASTA sequence (so user can refer to it)
-   elif [[ "$file" == ${Round2_cd_hit_prefix}?* ]]; then
+   # Move Round 2 cd-hit files to cd-hit_round_2_outputs - unless it is the final cd-hit FASTA sequence or its index (so user can refer to it)
+   elif [[ "$file" == ${Round2_cd_hit_prefix}?* ]] && [[ "$file" != "${Round2_cd_hit_prefix}.idx" ]]; then
       mv "$file" $TMPDIR/"cd-hit_round_2_outputs/"
 
    # Move Pfam outputs to pfam_intermediate_outputs
-   elif [[ "$file" == "Representative_Sequences_${base_name}.fasta" ]] || [[ "$file" == "Preprocessed_Representative_ORFs_${base_name}.faa" ]] || [[ "$file" == "Representative_ORFs_${base_name}.faa" ]]; then
+   elif [[ "$file" == "Representative_Sequences_${base_name}.fasta" ]] || [[ "$file" == "Preprocessed_Representative_ORFs_${base_name}.faa" ]]; then
       mv "$file" $TMPDIR/"pfam_intermediate_outputs/"
    fi
 done
 
-# Loop through each file in the final_outputs_folder directory (as there are some there that need to be moved to $TMPDIR)
-for file in ./$final_outputs_folder/*; do
-   # Move TE fasta files to TE_fastas_from_TE_Pipelines - NOTE: the 'basename' command is essential here before "$file" for this loop to work properly
-   if [[ "$(basename "$file")" == "$Prefixed_EarlGrey_FamilyFile" ]] || [[ "$(basename "$file")" == "$Prefixed_HiTE_TE_File" ]] || [[ "$(basename "$file")" == "$Prefixed_AnnoSINE_TE_File" ]] || [[ "$(basename "$file")" == "$Prefixed_HELIANO_TE_File" ]] || [[ "$(basename "$file")" == "$Prefixed_MITEFINDER_TE_File" ]]; then
-      mv "$file" $TMPDIR/TE_fastas_from_TE_Pipelines/
-   fi
-done
-
 # Finally, move the final output files to the 'final_outputs_folder' directory so that all of the associated files are in one place
 mv "COMPLETE_TE_RESULTS_${base_name}.csv" $final_outputs_folder
+mv "CLUSTER_TABLE_${base_name}.npz" $final_outputs_folder
+[[ -f "COMPLETE_TE_RESULTS_${base_name}.parquet" ]] && mv "COMPLETE_TE_RESULTS_${base_name}.parquet" $final_outputs_folder # Only written when pyarrow is installed
 mv "FINAL_cdhit_${base_name}" $final_outputs_folder
+mv "FINAL_cdhit_${base_name}.idx" $final_outputs_folder
 mv "$combined_file" $final_outputs_folder
+mv "$duplicates_file" $final_outputs_folder
 mv "$OUTPUT_CSV" $final_outputs_folder
 
 
@@ -15,17 +15,26 @@ set -euo pipefail
 
 usage() {
   echo "Usage:"
-  echo "  sbatch 3_Train_Model.sh <dataset.csv> [--kbest <int>] [--n-estimators <int>]"
+  echo "  sbatch 3_Train_Model.sh <dataset.csv> [--kbest <int>] [--n-estimators <int>] [--feature-backend <r|python>] [--feature-cache <dir>] [--feature-cache-max-gb <float>] [--feature-workers <int>] [--family-workers <int>] [--exchange-format <auto|feather|csv>] [--sparse-kmers <k,k>] [--with-sequences] [--cascade]"
   echo
   echo "Examples:"
   echo "  sbatch 3_Train_Model.sh training_dataset.csv"
   echo "  sbatch 3_Train_Model.sh training_dataset.csv --kbest 50 --n-estimators 300"
 }
 
-# --- Parse args: dataset (required), --kbest (optional), --n-estimators (optional) ---
+# --- Parse args: dataset (required), --kbest (optional), --n-estimators (optional), --feature-backend (optional), --feature-cache (optional), --feature-cache-max-gb (optional), --feature-workers (optional), --family-workers (optional), --exchange-format (optional), --sparse-kmers (optional), --with-sequences (optional), --cascade (optional) ---
 DATASET=""
 KBEST=""
 NESTIM=""
+BACKEND=""
+CACHE_DIR=""
+CACHE_MAX_GB=""
+WORKERS=""
+FAMILY_WORKERS=""
+EXCHANGE_FORMAT=""
+SPARSE_KMERS=""
+WITH_SEQUENCES=""
+CASCADE=""
 
 while [[ $# -gt 0 ]]; do
   case "$1" in
@@ -41,6 +50,40 @@ while [[ $# -gt 0 ]]; do
       [[ $# -ge 2 ]] || { echo "Error: --n-estimators needs a value."; usage; exit 1; }
       NESTIM="$2"; shift 2
       ;;
+    --feature-backend)
+      [[ $# -ge 2 ]] || { echo "Error: --feature-backend needs a value."; usage; exit 1; }
+      BACKEND="$2"; shift 2
+      ;;
+    --feature-cache)
+      [[ $# -ge 2 ]] || { echo "Error: --feature-cache needs a value."; usage; exit 1; }
+      CACHE_DIR="$2"; shift 2
+      ;;
+    --feature-cache-max-gb)
+      [[ $# -ge 2 ]] || { echo "Error: --feature-cache-max-gb needs a value."; usage; exit 1; }
+      CACHE_MAX_GB="$2"; shift 2
+      ;;
+    --feature-workers)
+      [[ $# -ge 2 ]] || { echo "Error: --feature-workers needs a value."; usage; exit 1; }
+      WORKERS="$2"; shift 2
+      ;;
+    --family-workers)
+      [[ $# -ge 2 ]] || { echo "Error: --family-workers needs a value."; usage; exit 1; }
+      FAMILY_WORKERS="$2"; shift 2
+      ;;
+    --exchange-format)
+      [[ $# -ge 2 ]] || { echo "Error: --exchange-format needs a value."; usage; exit 1; }
+      EXCHANGE_FORMAT="$2"; shift 2
+      ;;
+    --sparse-kmers)
+      [[ $# -ge 2 ]] || { echo "Error: --sparse-kmers needs a value."; usage; exit 1; }
+      SPARSE_KMERS="$2"; shift 2
+      ;;
+    --with-sequences)
+      WITH_SEQUENCES="yes"; shift
+      ;;
+    --cascade)
+      CASCADE="yes"; shift
+      ;;
     -*)
       echo "Error: Unknown option: $1"
       usage
@@ -90,6 +133,15 @@ fi
 PY_ARGS=( "$PY_SCRIPT" "$DATASET" )
 [[ -n "$KBEST" ]]  && PY_ARGS+=( --kbest "$KBEST" )
 [[ -n "$NESTIM" ]] && PY_ARGS+=( --n-estimators "$NESTIM" )
+[[ -n "$BACKEND" ]] && PY_ARGS+=( --feature-backend "$BACKEND" )
+[[ -n "$CACHE_DIR" ]] && PY_ARGS+=( --feature-cache "$CACHE_DIR" )
+[[ -n "$CACHE_MAX_GB" ]] && PY_ARGS+=( --feature-cache-max-gb "$CACHE_MAX_GB" )
+[[ -n "$WORKERS" ]] && PY_ARGS+=( --feature-workers "$WORKERS" )
+[[ -n "$FAMILY_WORKERS" ]] && PY_ARGS+=( --family-workers "$FAMILY_WORKERS" )
+[[ -n "$EXCHANGE_FORMAT" ]] && PY_ARGS+=( --exchange-format "$EXCHANGE_FORMAT" )
+[[ -n "$SPARSE_KMERS" ]] && PY_ARGS+=( --sparse-kmers "$SPARSE_KMERS" )
+[[ -n "$WITH_SEQUENCES" ]] && PY_ARGS+=( --with-sequences )
+[[ -n "$CASCADE" ]] && PY_ARGS+=( --cascade )
 
 python -u "${PY_ARGS[@]}"
 
@@ -15,8 +15,18 @@
 #   5) label encoder .pkl
 #   6) feature selector .pkl
 #
-# Optional flag:
+# Optional flags:
 #   --classifier-threshold <float>
+#   --feature-backend <r|python>   (python stops if its features do not match ftrCOOL's)
+#   --feature-cache <dir>
+#   --feature-cache-max-gb <float>
+#   --feature-workers <int>
+#   --family-workers <int>
+#   --exchange-format <auto|feather|csv>
+#   --first-stage-model <pkl>
+#   --results-db <sqlite>
+#   --lazy-features
+#   --with-sequences
 #
 # Outputs:
 #   Python creates AI_Classification_Results/ and Intermediate_dataset_files/
@@ -28,13 +38,13 @@ set -euo pipefail
 
 usage() {
   echo "Usage:"
-  echo "  sbatch 2_Classify.sh <complete_csv> <cdhit_output> <model_pkl> <scaler_pkl> <label_encoder_pkl> <selector_pkl> [--classifier-threshold <float>]"
+  echo "  sbatch 2_Classify.sh <complete_csv> <cdhit_output> <model_pkl> <scaler_pkl> <label_encoder_pkl> <selector_pkl> [--classifier-threshold <float>] [--feature-backend <r|python>] [--feature-cache <dir>] [--feature-cache-max-gb <float>] [--feature-workers <int>] [--family-workers <int>] [--exchange-format <auto|feather|csv>] [--first-stage-model <pkl>] [--results-db <sqlite>] [--lazy-features] [--with-sequences]"
   echo
   echo "Example:"
   echo "  sbatch 2_Classify.sh COMPLETE_TE_RESULTS_run.csv FINAL_CD_HIT_run.fasta model.pkl scaler.pkl label_encoder.pkl selector.pkl --classifier-threshold 0.70"
 }
 
-# Need at least 6 args (the 6 required), allow optional 8 with the threshold flag
+# Need at least 6 args (the 6 required), followed by optional flags
 if [[ $# -lt 6 ]]; then
   echo "Error: 6 required arguments missing."
   usage
@@ -50,14 +60,24 @@ LABEL_PKL="$5"
 SELECTOR_PKL="$6"
 shift 6
 
-# Anything left is optional flags; we only accept --classifier-threshold <float>
-if [[ $# -gt 0 ]]; then
-  if [[ $# -ne 2 || "$1" != "--classifier-threshold" ]]; then
-    echo "Error: Unrecognized optional arguments."
-    usage
-    exit 1
-  fi
-fi
+# Anything left is optional flags; all of them except --lazy-features and --with-sequences take a single value
+OPTIONAL_ARGS=()
+while [[ $# -gt 0 ]]; do
+  case "$1" in
+    --classifier-threshold|--feature-backend|--feature-cache|--feature-cache-max-gb|--feature-workers|--family-workers|--exchange-format|--first-stage-model|--results-db)
+      [[ $# -ge 2 ]] || { echo "Error: $1 needs a value."; usage; exit 1; }
+      OPTIONAL_ARGS+=( "$1" "$2" ); shift 2
+      ;;
+    --lazy-features|--with-sequences)
+      OPTIONAL_ARGS+=( "$1" ); shift
+      ;;
+    *)
+      echo "Error: Unrecognized optional arguments."
+      usage
+      exit 1
+      ;;
+  esac
+done
 
 # Sanity checks on required files
 for f in "$COMPLETE_CSV" "$CDHIT_OUT" "$MODEL_PKL" "$SCALER_PKL" "$LABEL_PKL" "$SELECTOR_PKL"; do
@@ -79,7 +99,7 @@ python -u Classify/_START_CLASSIFYING.py \
   "$SCALER_PKL" \
   "$LABEL_PKL" \
   "$SELECTOR_PKL" \
-  "$@"
+  ${OPTIONAL_ARGS[@]+"${OPTIONAL_ARGS[@]}"}
 
 # -----------------------------
 # Collect final outputs
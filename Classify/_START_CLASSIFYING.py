@@ -9,11 +9,20 @@ import sys
 import os
 import argparse
 import subprocess
+import time
+from pathlib import Path
+
+# Modules shared by the Train and Classify pipelines live in Scripts/
+sys.path.append(str(Path(__file__).resolve().parent.parent / "Scripts"))
+from _feature_engine import backend_mismatch, run_feature_backend
+from _feature_cache import main___cached_feature_extraction, DEFAULT_MAX_GB
+from _feature_exchange import EXCHANGE_FORMATS, exchange_path, resolve_exchange_format
+
 from create_classification_dataset import main___create_classification_dataset
 from preprocessing_before_ftrCool import main___preprocessing_before_ftrCool
-from preprocessing_after_ftrCool import main___preprocessing_after_ftr_cool
-from classify import main___classify
-from pathlib import Path
+from preprocessing_after_ftrCool import main___preprocessing_after_ftr_cool, selected_feature_families
+from classify import main___classify, main___first_stage_classify, report_cascade
+from _results_db import store_classifications
 
 def main():
     # Print an evident message to the terminal so the user knows that the testing process will begin
@@ -48,13 +57,72 @@ def main():
     parser.add_argument("label_encoder_pkl", help="Path to label encoder .pkl file used during training") # label encoder .pkl
     parser.add_argument("selector_pkl", help="Path to feature selector .pkl file used during training") # feature selector .pkl
 
-    # 1 optional argument
+    # Optional arguments
     parser.add_argument(
         "--classifier-threshold",
         type=float,
         default=0.7,
         help="Confidence threshold (0–1) for assigning class labels during classification (default: 0.7)"
     )
+    parser.add_argument(
+        "--feature-backend",
+        choices=["r", "python"],
+        default="r",
+        help="Feature extraction backend: 'r' runs ftrCool_feature_extraction.R, 'python' computes the features in-process (families that need ftrCOOL's property tables are still computed by R; it first checks its families against ftrCOOL and stops if any disagrees)"
+    )
+    parser.add_argument(
+        "--feature-cache",
+        default=None,
+        metavar="DIR",
+        help="Directory of the persistent feature cache shared by training and classification runs (disabled if not given)"
+    )
+    parser.add_argument(
+        "--feature-cache-max-gb",
+        type=float,
+        default=DEFAULT_MAX_GB,
+        help="Size limit of the feature cache in GB - least recently used entries are evicted beyond it"
+    )
+    parser.add_argument(
+        "--lazy-features",
+        action="store_true",
+        help="Only extract the feature families that contain features kept by the trained feature selector (much faster for small --kbest models)"
+    )
+    parser.add_argument(
+        "--feature-workers",
+        type=int,
+        default=1,
+        help="Number of concurrent R workers - above 1, the dataset is split into length-balanced shards that are feature-extracted in parallel"
+    )
+    parser.add_argument(
+        "--family-workers",
+        type=int,
+        default=1,
+        help="Number of forked workers inside each R process - above 1, the feature families are computed concurrently instead of one after another"
+    )
+    parser.add_argument(
+        "--first-stage-model",
+        default=None,
+        metavar="PKL",
+        help="First-stage model .pkl trained with --cascade - enables the classification cascade: sequences whose first-stage probability reaches "
+             "--classifier-threshold are classified from cheap composition features, and only the rest go through full feature extraction and the full model"
+    )
+    parser.add_argument(
+        "--with-sequences",
+        action="store_true",
+        help="Also write the full sequence_content column to the feature-extracted and FINAL datasets (rows are otherwise identified by Sequence_ID)"
+    )
+    parser.add_argument(
+        "--results-db",
+        default=None,
+        metavar="SQLITE",
+        help="SQLite results database (from main.sh --results_db) - the classification results are stored in it, under the genome of the COMPLETE_TE_RESULTS_*.csv file"
+    )
+    parser.add_argument(
+        "--exchange-format",
+        choices=EXCHANGE_FORMATS,
+        default="auto",
+        help="File format of the datasets handed to and from ftrCool_feature_extraction.R: 'feather' (Arrow IPC, needs pyarrow and the R package arrow) avoids converting the feature matrix to text and back, 'auto' uses it when available and falls back to 'csv' otherwise ('feather' stops with an error if either package is missing)"
+    )
 
      # if no args → show usage
     if len(sys.argv) == 1:
@@ -63,6 +131,12 @@ def main():
         sys.exit(1)
 
     args = parser.parse_args()
+
+    # The model only works with the features of the backend it was trained on
+    mismatch = backend_mismatch(args.scaler_pkl, args.feature_backend)
+    if mismatch:
+        print(f"ERROR: {mismatch} - classify with the --feature-backend the model was trained with.")
+        sys.exit(1)
     
     # Derive the base name
     input_data_file_name = os.path.splitext(os.path.basename(args.complete_csv.split("COMPLETE_TE_RESULTS_")[1]))[0]
@@ -74,37 +148,83 @@ def main():
 
     # STEP 2: Preprocess the raw classification dataset before feature extraction
     classification_dataset = f"classification_dataset_{input_data_file_name}.csv"
-    main___preprocessing_before_ftrCool(classification_dataset, input_data_file_name)
+    exchange_format = resolve_exchange_format(args.exchange_format)
+    main___preprocessing_before_ftrCool(classification_dataset, input_data_file_name, exchange_format)
     
-    # STEP 3: Perform feature extraction using R package ftrCool
-    preprocessed_dataset = f"preprocessed_classification_dataset_{input_data_file_name}.csv"
+    # CASCADE: the first-stage model classifies the sequences it is confident about from cheap composition features - only the rest go through STEPS 3-5
+    preprocessed_dataset = exchange_path(f"preprocessed_classification_dataset_{input_data_file_name}.csv", exchange_format)
+    early_exits = None
+    if args.first_stage_model:
+        first_stage_start = time.perf_counter()
+        remaining_dataset = exchange_path(f"cascade_remaining_{input_data_file_name}.csv", exchange_format)
+        early_exits, remaining = main___first_stage_classify(
+            preprocessed_dataset, args.first_stage_model, args.label_encoder_pkl, args.classifier_threshold, remaining_dataset
+        )
+        first_stage_seconds = time.perf_counter() - first_stage_start
+        preprocessed_dataset = remaining_dataset
+    run_full_model = early_exits is None or len(remaining) > 0
+    full_path_start = time.perf_counter()
+
+    # STEP 3: Perform feature extraction using R package ftrCool (or the python feature backend)
+    ftr_cool_extracted_dataset = exchange_path(f"ftrCool_extracted_{input_data_file_name}.csv", exchange_format)
 
     # Build absolute paths
     SCRIPT_DIR = Path(__file__).resolve().parent
     r_script = SCRIPT_DIR / "ftrCool_feature_extraction.R"
     preprocessed_abs = Path.cwd() / preprocessed_dataset  # file produced in current working dir
 
-    # Use absolute path to the R script and the CSV
-    subprocess.run(
-        ["Rscript", str(r_script), str(preprocessed_abs), input_data_file_name],
-        check=True
-    )
+    # Lazy feature mode: work out which feature families the trained model uses, and only extract those
+    families = None
+    if args.lazy_features and run_full_model:
+        families = selected_feature_families(args.scaler_pkl, args.selector_pkl)
+        if families is None:
+            print("\nThe scaler does not record its feature names - lazy feature mode is not possible, extracting all feature families.")
+        elif not families:
+            print("\nLazy feature mode: the trained model uses no ftrCOOL feature family (only seq_length and sparse k-mers) - ftrCOOL is not run.")
+        else:
+            print(f"\nLazy feature mode: extracting {len(families)} feature families used by the trained model: {', '.join(families)}")
+
+    # Extra arguments for the R script: the dataset name, plus the number of forked family workers (flags are ignored by its positional arguments)
+    r_args = [input_data_file_name] + ([f"--family-workers={args.family_workers}"] if args.family_workers > 1 else [])
+
+    if not run_full_model:
+        pass # Every sequence exited the cascade early - nothing left to extract features for
+    elif args.feature_cache:
+        main___cached_feature_extraction(
+            preprocessed_abs, ftr_cool_extracted_dataset, args.feature_backend, r_script,
+            args.feature_cache, args.feature_cache_max_gb, extra_r_args=r_args, families=families, workers=args.feature_workers,
+            with_sequences=args.with_sequences
+        )
+    elif args.feature_backend == "python" or args.feature_workers > 1 or families is not None:
+        run_feature_backend(args.feature_backend, preprocessed_abs, ftr_cool_extracted_dataset, r_script,
+                            extra_r_args=r_args, families=families, workers=args.feature_workers, with_sequences=args.with_sequences)
+    else:
+        # Use absolute path to the R script and the CSV
+        subprocess.run(
+            ["Rscript", str(r_script), str(preprocessed_abs), *r_args, *(["--with-sequences"] if args.with_sequences else [])],
+            check=True
+        )
     
     # STEP 4: Preprocess the classification dataset after feature extraction
-    ftr_cool_extracted_dataset = f"ftrCool_extracted_{input_data_file_name}.csv"
-    main___preprocessing_after_ftr_cool(ftr_cool_extracted_dataset, input_data_file_name, args.scaler_pkl, args.selector_pkl)
+    Final_dataset = None
+    if run_full_model:
+        main___preprocessing_after_ftr_cool(ftr_cool_extracted_dataset, input_data_file_name, args.scaler_pkl, args.selector_pkl, preprocessed_abs)
+        Final_dataset = f"FINAL_{input_data_file_name}.csv"
     
-    # STEP 5: Classify the unseen dataset using the trained model
-    Final_dataset = f"FINAL_{input_data_file_name}.csv"
-    main___classify(Final_dataset, args.model_pkl, args.label_encoder_pkl, args.classifier_threshold)
+    # STEP 5: Classify the unseen dataset using the trained model (together with the early exits of the cascade)
+    classification_results = main___classify(Final_dataset, args.model_pkl, args.label_encoder_pkl, args.classifier_threshold, early_exits)
+    if early_exits is not None:
+        report_cascade(early_exits, remaining, first_stage_seconds, time.perf_counter() - full_path_start)
+    if args.results_db:
+        store_classifications(args.results_db, input_data_file_name, classification_results, args.classifier_threshold)
     
     # STEP 6: Clean up intermediate data files
     INTERMEDIATE_DATA_dir = "Intermediate_dataset_files"
     os.makedirs(INTERMEDIATE_DATA_dir, exist_ok=True)
 
-    # Move all intermediate CSV files to the new directory
+    # Move all intermediate CSV (and Feather) files, and the sequence stores saved next to them, to the new directory
     for filename in os.listdir("."):
-        if filename.lower().endswith(".csv") and filename != args.complete_csv:
+        if filename.lower().endswith((".csv", ".feather", ".seqstore")) and filename != args.complete_csv:
             shutil.move(filename, os.path.join(INTERMEDIATE_DATA_dir, filename))
     
 
@@ -11,22 +11,75 @@ from collections import Counter
 import numpy as np
 import matplotlib.pyplot as plt
 import os
+from _feature_engine import first_stage_features
+from _feature_exchange import read_table, write_table
+from _sequence_store import dataset_store, store_path
 
-def main___classify(final_dataset, model_pkl, label_encoder_pkl, classifier_threshold):
+def main___classify(final_dataset, model_pkl, label_encoder_pkl, classifier_threshold, early_exits=None):
     print("\n")
     print("\n")
     print("-----------------------------------------------------------------------------------------------")
     print("STEP 5: Classify the dataset using the trained model.")
     print("-----------------------------------------------------------------------------------------------")
 
-    seq_ids, features = load_data(final_dataset)
-    classify(seq_ids, features, model_pkl, label_encoder_pkl, classifier_threshold)
+    # With the cascade, 'final_dataset' only holds the sequences the first-stage model was not confident about (None if there were none)
+    seq_ids, features = load_data(final_dataset) if final_dataset is not None else ([], [])
+    return classify(seq_ids, features, model_pkl, label_encoder_pkl, classifier_threshold, early_exits)
+
+
+def main___first_stage_classify(preprocessed_dataset, first_stage_pkl, label_encoder_pkl, classifier_threshold, remaining_dataset):
+    """
+    Classifies the preprocessed sequences with the first-stage (cascade) model on cheap composition features.
+    Sequences whose top first-stage probability reaches the threshold exit early with that label. The rest are written to 'remaining_dataset'
+    for full feature extraction and the full model. Returns the early exits (Sequence_ID, Predicted_Class, seq_length) and the remaining rows.
+    """
+    print("\n")
+    print("\n")
+    print("-----------------------------------------------------------------------------------------------")
+    print("CASCADE: Classify with the first-stage model before full feature extraction.")
+    print("-----------------------------------------------------------------------------------------------")
+
+    first_stage_model = joblib.load(first_stage_pkl)
+    label_encoder = joblib.load(label_encoder_pkl)
+
+    # The sequences come from the packed store saved next to the preprocessed dataset - only the other columns are read
+    df = read_table(preprocessed_dataset, columns=lambda c: c != "sequence_content")
+    store = dataset_store(preprocessed_dataset)
+    if len(df) == 0:
+        # Nothing to classify - no early exits, and an empty remaining dataset (with the same columns) so the steps after it find their input
+        print("The preprocessed dataset is empty - no sequence to classify with the first-stage model.")
+        early_exits = pd.DataFrame({"Sequence_ID": pd.Series(dtype=object), "Predicted_Class": pd.Series(dtype=object), "seq_length": pd.Series(dtype=np.int64)})
+        remaining = df.assign(sequence_content=pd.Series(dtype=object))
+        write_table(remaining, remaining_dataset)
+        store.save(store_path(remaining_dataset))
+        return early_exits, remaining
+    probs = first_stage_model.predict_proba(first_stage_features(store).to_numpy())
+
+    # Same thresholding as the full model - but here, falling below it means 'go on to the full model' instead of UNKNOWN
+    max_idx = np.argmax(probs, axis=1)
+    max_val = probs[np.arange(len(probs)), max_idx]
+    confident = max_val >= float(classifier_threshold)
+
+    early_exits = pd.DataFrame({
+        "Sequence_ID": df["Sequence_ID"][confident].astype(str).to_numpy(),
+        "Predicted_Class": label_encoder.inverse_transform(first_stage_model.classes_[max_idx[confident]]),
+        "seq_length": store.lengths[confident],
+    })
+    # The remaining rows go to ftrCool_feature_extraction.R, which needs their sequences as text - they also get a store of their own for the python stages
+    remaining_store = store.subset(np.flatnonzero(~confident))
+    remaining = df[~confident].assign(sequence_content=list(remaining_store))
+    write_table(remaining, remaining_dataset)
+    remaining_store.save(store_path(remaining_dataset))
+
+    print(f"First-stage model confident (>= {float(classifier_threshold):.2f}) for {len(early_exits)} of {len(df)} sequences "
+          f"({len(early_exits) / max(len(df), 1):.1%}) - {len(remaining)} go on to full feature extraction.")
+    return early_exits, remaining
 
 
 def load_data(filename):
     """
     Load data from CSV - The input is an UNLABELLED dataset with SCALED + SELECTED features.
-    Expects first two columns to be: Sequence_ID, sequence_content
+    Expects the row key columns first: Sequence_ID, and sequence_content if it was written
     """
     df = pd.read_csv(filename)
     df = df.sample(frac=1, random_state=42).reset_index(drop=True)
@@ -34,28 +87,37 @@ def load_data(filename):
     # Keep IDs to report results
     seq_ids = df["Sequence_ID"].astype(str).tolist()
 
-    # Features start at column index 2 (exclude Sequence_ID, sequence_content)
-    features = df.iloc[:, 2:].values.tolist()
+    # Features are every other column (exclude Sequence_ID, sequence_content)
+    features = df.drop(columns=["Sequence_ID", "sequence_content"], errors="ignore").values.tolist()
     features = [[float(x) for x in row] for row in features]
     return seq_ids, features
 
 
-def classify(seq_ids, features, model_pkl, label_encoder_pkl, classifier_threshold):
+def classify(seq_ids, features, model_pkl, label_encoder_pkl, classifier_threshold, early_exits=None):
     trained_model = joblib.load(model_pkl)
     label_encoder = joblib.load(label_encoder_pkl)
 
-    # Predict probabilities and apply threshold
-    probs = trained_model.predict_proba(features)
-    max_idx = np.argmax(probs, axis=1)
-    max_val = probs[np.arange(len(probs)), max_idx]
+    assigned = np.array([], dtype=object)
+    if len(features):
+        # Predict probabilities and apply threshold
+        probs = trained_model.predict_proba(features)
+        max_idx = np.argmax(probs, axis=1)
+        max_val = probs[np.arange(len(probs)), max_idx]
 
-    # Map predicted integer classes back to original labels
-    # Assumes the model was trained on label-encoded integers 0..K-1
-    pred_int = trained_model.classes_[max_idx]
-    pred_labels = label_encoder.inverse_transform(pred_int)
+        # Map predicted integer classes back to original labels
+        # Assumes the model was trained on label-encoded integers 0..K-1
+        pred_int = trained_model.classes_[max_idx]
+        pred_labels = label_encoder.inverse_transform(pred_int)
 
-    # Thresholding: below threshold → UNKNOWN
-    assigned = np.where(max_val >= float(classifier_threshold), pred_labels, "UNKNOWN")
+        # Thresholding: below threshold → UNKNOWN
+        assigned = np.where(max_val >= float(classifier_threshold), pred_labels, "UNKNOWN").astype(object)
+
+    # Cascade: the sequences the first-stage model already classified are reported together with the full model's
+    first_stage_count = 0
+    if early_exits is not None:
+        first_stage_count = len(early_exits)
+        seq_ids = list(seq_ids) + early_exits["Sequence_ID"].tolist()
+        assigned = np.concatenate([assigned, early_exits["Predicted_Class"].to_numpy(dtype=object)])
 
     # Summaries
     total = len(seq_ids)
@@ -69,6 +131,8 @@ def classify(seq_ids, features, model_pkl, label_encoder_pkl, classifier_thresho
     print(f"Total sequences: {total}")
     print(f"Threshold: {float(classifier_threshold):.2f}")
     print(f"Classified: {total - unknown_count}")
+    if early_exits is not None:
+        print(f"  (of which {first_stage_count} by the first-stage model, {total - unknown_count - first_stage_count} by the full model)")
     for cls, cnt in sorted(per_class_counts.items(), key=lambda x: (-x[1], x[0])):
         print(f"  • {cls}: {cnt}")
     print(f"Unknown (below threshold): {unknown_count}")
@@ -104,3 +168,29 @@ def classify(seq_ids, features, model_pkl, label_encoder_pkl, classifier_thresho
     plt.savefig(plot_path, dpi=200)
     plt.close()
     print("Visualization saved to:", plot_path)
+
+    return out
+
+
+def report_cascade(early_exits, remaining, first_stage_seconds, full_path_seconds):
+    """
+    Reports the fraction of sequences that exited the cascade early, and the time this saved.
+    The full path (feature extraction + full model) was only timed on the remaining sequences, so its cost for the early exits is
+    extrapolated per nucleotide - feature extraction time grows with sequence length, not with the number of sequences.
+    """
+    total = len(early_exits) + len(remaining)
+    early_nt = int(early_exits["seq_length"].sum())
+    remaining_nt = int(remaining["sequence_content"].str.len().sum())
+
+    print("\nCASCADE SUMMARY")
+    print(f"Early exits (first-stage model): {len(early_exits)} of {total} sequences ({len(early_exits) / max(total, 1):.1%})")
+    print(f"First-stage time: {first_stage_seconds:.1f} s")
+
+    if remaining_nt == 0:
+        print("Every sequence exited early - full feature extraction and the full model were skipped entirely.")
+        return
+
+    print(f"Full feature extraction + full model: {full_path_seconds:.1f} s for {len(remaining)} sequences")
+    estimated_full_seconds = full_path_seconds * early_nt / remaining_nt
+    print(f"Estimated time saved: {estimated_full_seconds - first_stage_seconds:.1f} s "
+          f"(the early exits would have taken ~{estimated_full_seconds:.1f} s on the full path)")
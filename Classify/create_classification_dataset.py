@@ -2,13 +2,20 @@
 SCRIPT 1
 
 - This is the first script - this script will create a raw testing dataset from a past run of earlgrey's output CSV and the corresponding cd-hit file used within that run.
+- The clusters are read from the typed Parquet copy of the CSV (COMPLETE_TE_RESULTS_<genome>.parquet, from Scripts/_typed_results.py), loading only the five columns needed.
+  Without it (or without pyarrow), they are read from the cluster table saved next to the CSV (CLUSTER_TABLE_<genome>.npz, from Scripts/_cluster_table.py) - it is built from the CSV if there is none.
+- The representative sequences are fetched from the cd-hit FASTA through its byte-offset index (FINAL_cdhit_<genome>.idx, from Scripts/_fasta_index.py) - it is built if there is none.
 """
 
-import pandas as pd
 from Bio import SeqIO
 import sys
 import csv
 import os
+import numpy as np
+from _add_metrics import cluster_runs
+from _cluster_table import load_cluster_table, UNKNOWN_UNDISCOVERED, UNKNOWN_TEXT
+from _fasta_index import fetch_records
+from _typed_results import read_typed_results, typed_results_available, typed_results_path
 
 
 # Read in the dataset file (unknown sequences) and the cd-hit output file from first half of pipeline
@@ -18,68 +25,24 @@ def main___create_classification_dataset(df, final_cd_hit, name_prefix):
     print("STEP 1: Create a raw dataset from the complete.csv and cd-hit results.")
     print("-----------------------------------------------------------------------------------------------")
     
-    data_frame = pd.read_csv(df) 
-    filtered_df = filter_for_single_classifications(data_frame)
-    sequences = representative_seq_puller(filtered_df)
+    typed_results = typed_results_path(df)
+    if typed_results_available() and os.path.exists(typed_results):
+        sequences = typed_representative_seq_puller(typed_results)
+    else:
+        sequences = representative_seq_puller(load_cluster_table(df))
     discovered_sequences_fasta = create_fasta_rep_seqs(sequences, final_cd_hit)
     create_feature_extraction_dataset(discovered_sequences_fasta, name_prefix)
     
-# For any cluster that has only "unknown" elements, there is no string instance within the classification column for that cluster. Therefore, for each of these clusters we output the classification within that column as "unknown"
-
-# Extract sequences and classifications where there is only a single classification present in the family_count column
-def filter_for_single_classifications(data_fr):
-    for index, row in data_fr.iterrows():
-        family_info = row["family_count"]
-        
-        # we only need everything before the ":" in the classification column, so take out everything after
-        if pd.notna(family_info) and "," not in str(family_info):
-            data_fr.at[index, "family_count"] = str(family_info).split(':')[0]
-    
-    return data_fr
-    
-
-# This function retrieves the seq_IDs and the family-level classifications for each viable representative sequence from the CSV
-def representative_seq_puller(df):
-    current_cluster = "Cluster 0"
-    rep_seq = None
-    rep_seq_found = False
-    rep_seqs = []
+# This function retrieves the seq_IDs of each viable representative sequence from the cluster table
+def representative_seq_puller(cluster_table):
     family_level_classifications = []
 
-    for index, row in df.iterrows():
-        cluster = row['cluster']
-        sequence_info = row['Sequence Information']
-        rep_seq_info = row["Representative Sequence?"]
-        pipeline_info = row["Pipeline_Count"]
-        family_info = row["family_count"]
-        unknown_count = row["Unknown_Count"]
-
-        # Detect cluster change
-        if cluster != current_cluster:
-            current_cluster = cluster
-            rep_seq = None
-            rep_seq_found = False
-
-        # Store representative sequence when found
-        if rep_seq_info == "YES":
-            rep_seq = sequence_info
-            rep_seq_found = True
-
-        # Final row in the cluster
-        if pd.notna(pipeline_info): # This will only be true on the last row of the cluster, as pipeline_info is only present on the last row
-            if "," in str(family_info):
-                # Invalidate representative sequence if family_info is multi-labeled
-                rep_seq = None
-                rep_seq_found = False
-
-            if rep_seq_found and unknown_count == "UNKNOWN PRESENT: Undiscovered": # Both a representative seq that has "UNKNOWN PRESENT: Undiscovered" in its cluster must be present for the seq and the classification to be added
-                rep_seqs.append(rep_seq)
-
-            # Reset for next cluster
-            rep_seq = None
-            rep_seq_found = False
+    # A representative sequence is viable if its cluster has "UNKNOWN PRESENT: Undiscovered", and the cluster's family_count is not multi-labeled (no "," in it)
+    undiscovered = cluster_table.clusters_with_status(UNKNOWN_UNDISCOVERED)
+    family_counts = cluster_table.family_counts
+    single_label = [cluster for cluster in undiscovered.tolist() if "," not in family_counts[cluster]]
+    rep_seqs = cluster_table.representative_names(single_label)
                
-           
     # Create a dictionary where rep_seqs entries are 'keys' and family_level_classifications entries are 'values'
     seqs_classifications_dict = dict(zip(rep_seqs, family_level_classifications))
     
@@ -92,20 +55,40 @@ def representative_seq_puller(df):
     # Return the list of unlabelled 'rep_seqs'
     return rep_seqs
 
+
+# The same seq_IDs as 'representative_seq_puller', read from the typed Parquet results - only the columns the selection needs are loaded
+def typed_representative_seq_puller(typed_results):
+    results = read_typed_results(typed_results, columns=["cluster", "sequence_info", "representative", "unknown_count", "family_count"])
+
+    # The unknown status and family counts of a cluster are on its last row - a cluster is viable if it is undiscovered and has at most one family (the map has no second entry)
+    runs, last_rows = cluster_runs(results)
+    last = results.iloc[last_rows]
+    undiscovered = (last["unknown_count"].astype(object).map(UNKNOWN_TEXT) == UNKNOWN_UNDISCOVERED).to_numpy()
+    single_label = np.array([family_count is None or len(family_count) <= 1 for family_count in last["family_count"]], dtype=bool)
+    viable = undiscovered & single_label
+
+    # The representative of a cluster is its last member marked as one (as in the cluster table)
+    representative_rows = np.flatnonzero(results["representative"].to_numpy(dtype=bool) & viable[runs])
+    rep_rows_per_cluster = {run: row for run, row in zip(runs[representative_rows].tolist(), representative_rows.tolist())}
+    rep_seqs = results["sequence_info"].iloc[[rep_rows_per_cluster[run] for run in sorted(rep_rows_per_cluster)]].astype(str).tolist()
+
+    print("\n")
+    print("Representative sequence ID list (from the typed results) - these will be the input for the classification model (first 10 entries shown):")
+    print(rep_seqs[:10])
+    print("Length of the \"rep_seq_IDs\" list: ", len(rep_seqs))
+    return rep_seqs
+
     
 # This function creates a fasta file of only the representative sequences - again, these only include representative sequences from clusters that are not classified
 def create_fasta_rep_seqs(seqs, cd_hit):
 
     final_output_file = "Representative_Sequences.fasta"
     with open(final_output_file, "w") as output_handle:
-        for record in SeqIO.parse(cd_hit, "fasta"): #Even though cd-hit does not have a fasta extension, it is still a fasta
-            
-            # loop through each entry in the cd_hit file, if entry (minus header) is also within our 'rep_seqs', add to fasta
+        # Even though cd-hit does not have a fasta extension, it is still a fasta - only the entries whose ID (minus the cd-hit specific prefix) is within our 'rep_seqs' are read from it,
+        # with direct seeks through its index
+        for record in fetch_records(cd_hit, seqs, key=lambda record_id: record_id.split("_", 1)[-1]):
             record.id = record.id.split("_", 1)[-1]  # Remove the cd-hit specific prefix from the sequence ID
-            
-            # Only write the sequence if it is shared between my 'rep_seqs' list and my cd_hit fasta, AND if "N" nucleotides takes up less than threshold_for_N_nucleotides % of the sequence
-            if record.id in seqs:
-                SeqIO.write(record, output_handle, "fasta")
+            SeqIO.write(record, output_handle, "fasta")
 
 
     return final_output_file
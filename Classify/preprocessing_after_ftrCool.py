@@ -11,22 +11,25 @@ SCRIPT 4 - NOTE: This script is only preprocessing an UNLABELLED dataset after f
 import pandas as pd
 import numpy as np
 from joblib import load
+from _feature_engine import ROW_KEY_COLUMNS, families_for_columns, is_sparse_kmer_column, row_sequences, sparse_kmer_columns
+from _feature_exchange import read_table
 
-def main___preprocessing_after_ftr_cool(dataset, original_dataset_name, scaler_pkl, selector_pkl):
+def main___preprocessing_after_ftr_cool(dataset, original_dataset_name, scaler_pkl, selector_pkl, preprocessed_dataset=None):
     print("\n")
     print("\n")
     print("-----------------------------------------------------------------------------------------------")
     print("STEP 4: Preprocess the dataset after feature extraction.")
     print("-----------------------------------------------------------------------------------------------")
 
-    dataset = pd.read_csv(dataset)
+    dataset = read_table(dataset) # CSV or Feather, depending on the exchange format used with ftrCool_feature_extraction.R
     
     print("\nDataset head (5 rows):")
     print(dataset.head(5))
     print("\nDataset info:")
     dataset.info()
 
-    features_df = dataset.iloc[:, 2:].copy()
+    # Everything except the row key columns (row_index, Sequence_ID, and sequence_content if it was written) is a feature
+    features_df = dataset.drop(columns=[c for c in ROW_KEY_COLUMNS if c in dataset.columns]).copy()
 
     features_df = features_df.apply(pd.to_numeric, errors='coerce')
 
@@ -37,8 +40,8 @@ def main___preprocessing_after_ftr_cool(dataset, original_dataset_name, scaler_p
     features_df.replace([np.inf, -np.inf], np.nan, inplace=True)
     features_df.dropna(inplace=True)
 
-    sequence_id_col = dataset.loc[features_df.index, 'Sequence_ID'].reset_index(drop=True)
-    sequence_content_col = dataset.loc[features_df.index, 'sequence_content'].reset_index(drop=True)
+    kept_rows = dataset.loc[features_df.index]
+    row_key_df = kept_rows[[c for c in ("Sequence_ID", "sequence_content") if c in dataset.columns]].reset_index(drop=True)
     features_df = features_df.reset_index(drop=True)
 
     print("\nAfter filtering:")
@@ -57,11 +60,33 @@ def main___preprocessing_after_ftr_cool(dataset, original_dataset_name, scaler_p
     print(f"Loading feature selector from {selector_pkl}")
     selector = load(selector_pkl)
 
-    features_scaled = scaler.transform(features_df)
-    transformed_best_features = selector.transform(features_scaled)
-
     mask = selector.get_support()
-    selected_feature_names = features_df.columns[mask]
+    trained_feature_names = getattr(scaler, "feature_names_in_", None)
+
+    # The model may have been trained with sparse k-mer features (--sparse-kmers) - those are not in the extracted dataset, so compute just the k-mer columns the scaler knows.
+    # In lazy feature mode (the extracted columns are not every non-k-mer column the scaler knows) only the k-mer columns kept by the selector are needed, like the ftrCOOL families.
+    trained_names = list(trained_feature_names) if trained_feature_names is not None else []
+    kmer_feature_names = [c for c in trained_names if is_sparse_kmer_column(c)]
+    if list(features_df.columns) != [c for c in trained_names if not is_sparse_kmer_column(c)]:
+        kmer_feature_names = [c for c, kept in zip(trained_names, mask) if kept and is_sparse_kmer_column(c)]
+    if kmer_feature_names:
+        print(f"Computing {len(kmer_feature_names)} sparse k-mer features used by the trained model")
+        sequences = row_sequences(kept_rows, preprocessed_dataset)
+        features_df = pd.concat([features_df, sparse_kmer_columns(sequences, kmer_feature_names)], axis=1)
+
+    if trained_feature_names is not None and list(features_df.columns) != list(trained_feature_names):
+        # Lazy feature mode - only the feature families kept by the selector were extracted, so scale and select just those columns.
+        # MinMaxScaler.transform is X * scale_ + min_ column by column, so the selected columns can be scaled on their own.
+        selected_feature_names = pd.Index(trained_feature_names[mask])
+        missing = [c for c in selected_feature_names if c not in features_df.columns]
+        if missing:
+            raise ValueError(f"The feature-extracted dataset is missing features used by the trained model: {missing}")
+        selected_idx = np.flatnonzero(mask)
+        transformed_best_features = features_df[selected_feature_names].to_numpy(dtype=float) * scaler.scale_[selected_idx] + scaler.min_[selected_idx]
+    else:
+        features_scaled = scaler.transform(features_df)
+        transformed_best_features = selector.transform(features_scaled)
+        selected_feature_names = features_df.columns[mask]
 
     best_features_df = pd.DataFrame(transformed_best_features, columns=selected_feature_names)
 
@@ -72,8 +97,7 @@ def main___preprocessing_after_ftr_cool(dataset, original_dataset_name, scaler_p
     print(selected_feature_names)
 
     final_df = pd.concat([
-        sequence_id_col,
-        sequence_content_col,
+        row_key_df,
         best_features_df[selected_feature_names]
     ], axis=1)
 
@@ -82,3 +106,17 @@ def main___preprocessing_after_ftr_cool(dataset, original_dataset_name, scaler_p
     print(f"\nFinal dataset produced: {final_classification_dataset_name}.")
 
     print("\nThe unlabelled dataset has been preprocessed and is now ready to be classified.")
+
+
+# Works out which feature families the trained model actually uses (from the selector's support mask and the scaler's feature names).
+# Used by the lazy feature mode of _START_CLASSIFYING.py so that only these families are extracted. Returns None if the scaler does not record its feature names.
+def selected_feature_families(scaler_pkl, selector_pkl):
+    scaler = load(scaler_pkl)
+    selector = load(selector_pkl)
+
+    trained_feature_names = getattr(scaler, "feature_names_in_", None)
+    if trained_feature_names is None:
+        return None
+
+    selected_feature_names = trained_feature_names[selector.get_support()]
+    return families_for_columns(selected_feature_names)
@@ -12,11 +12,13 @@ import matplotlib.pyplot as plt
 import os
 import numpy as np
 import random
-from Bio.Seq import Seq
+import hashlib
+from _feature_exchange import exchange_path, write_table
+from _sequence_store import PackedSequences, save_dataset_store
 
 
 
-def main___preprocessing_before_ftrCool(dataset, name_prefix):
+def main___preprocessing_before_ftrCool(dataset, name_prefix, exchange_format="csv"):
     
     print("\n")
     print("\n")
@@ -45,8 +47,12 @@ def main___preprocessing_before_ftrCool(dataset, name_prefix):
     df_random = create_alternate_training_set(df_no_Ns_above_threshold)
 
 
-    output_name = f"preprocessed_classification_dataset_{name_prefix}.csv"
-    df_random.to_csv(output_name, index=False)
+    # Written as CSV, or as Feather when the binary exchange format is used for the hand-off to ftrCool_feature_extraction.R
+    output_name = exchange_path(f"preprocessed_classification_dataset_{name_prefix}.csv", exchange_format)
+    write_table(df_random, output_name)
+
+    # The 2-bit packed sequences are saved next to it (.seqstore) - the later python stages memory-map them instead of reading the sequences back as strings
+    save_dataset_store(df_random, output_name)
 
     print("\n")
     print("Preprocessed dataset produced. This will now go through feature extraction via the R package ftrCool.")
@@ -60,16 +66,12 @@ def convert_nucs_to_uppercase(df):
 
 # There are some nucleotides that are not in [A, C, T, G, N] - explore this data
 def check_non_ACTGN_nucleotides(uppercase_df):
-    sequences_w_non_ACTGN = set() 
-    non_ACTGN_chars = set()
-    
-    # Loop through the 'sequence_content' column, collecting the number of sequences that contain letters other than [ACTGN] and a set of all the weird characters
-    for index, value in uppercase_df["sequence_content"].items():
-        seq = Seq(value)
-        for c in seq:
-            if c not in "ACTGN":
-                sequences_w_non_ACTGN.add(uppercase_df.loc[index, "Sequence_ID"])
-                non_ACTGN_chars.add(c)
+    # Pack the 'sequence_content' column - letters other than [ACTG] end up in the store's ambiguity mask, so the sequences that contain letters other than [ACTGN]
+    # and the set of all the weird characters are read from the mask instead of looping over every base
+    store = PackedSequences.from_dataframe(uppercase_df)
+    has_non_ACTGN = store.ambiguous_counts(ignore="N") > 0
+    sequences_w_non_ACTGN = set(uppercase_df["Sequence_ID"][has_non_ACTGN])
+    non_ACTGN_chars = store.ambiguous_symbols(ignore="N")
     
     print("\n")
     print("Number of sequences that contain non [ACTGN] letters: ", len(sequences_w_non_ACTGN))
@@ -83,12 +85,12 @@ def check_N_sequences(df):
     number_of_seqs_over_threshold = []
     sequence_IDs_above_threshold = [] # These contain the ID of all sequences that are above threshold - to remove
     
-    # Loop through sequence content, gathering percentage of each sequence that is ambiguous nucleotide
-    for index, value in df["sequence_content"].items():
-        if "N" in value:
-            n_count = value.count("N")
-            percent = (n_count / len(value) * 100)
-            All_percentages[df.loc[index, "Sequence_ID"]] = percent         
+    # Gather the percentage of each sequence that is ambiguous nucleotide (N counts come from the packed store's ambiguity mask)
+    store = PackedSequences.from_dataframe(df)
+    n_counts = store.ambiguous_counts(only="N")
+    for seq_id, n_count, seq_len in zip(df["Sequence_ID"], n_counts, store.lengths):
+        if n_count > 0:
+            All_percentages[seq_id] = (n_count / seq_len * 100)
 
     for k, v in All_percentages.items():
         if v > 1:
@@ -137,8 +139,12 @@ def create_alternate_training_set(df):
 
 
 # This is a helper function which will randomly choose a base for 'N' in a sequence from ATCG
+# The random generator is seeded from the sequence itself, so the same raw sequence is always imputed the same way - this keeps its feature cache key stable across runs
 def replace_N_with_random(seq):
-    return ''.join(random.choice("ACTG") if c == "N" else c for c in seq)    
+    if "N" not in seq:
+        return seq
+    rng = random.Random(hashlib.sha256(seq.encode("ascii")).digest())
+    return ''.join(rng.choice("ACTG") if c == "N" else c for c in seq)    
 
 
 if __name__ == "__main__":
@@ -1,10 +1,25 @@
-# FUNCTIONALITY: This script is called by 'format_data.py'. After the formatted excel table is produced in the main directory (which is produced by the script '_optimize_csv.py'), this file will add on some additional
+# FUNCTIONALITY: This script is called by 'format_data.py'. After the formatted table is produced from the .clstr file (by the script '_clstr_parser.py'), this file will add on some additional
                # columns that add more information to the output. This includes the pipeline_count, Unknown_count, and family_count columns.
+               # Every column is computed with group-by operations over the clusters (a cluster is a run of consecutive rows with the same 'cluster' value), so the time grows linearly
+               # with the number of clustered sequences. Each cluster's summary is written to the last row of that cluster.
+               #
+               # Run directly to benchmark the metrics on synthetic clusterings of increasing size:
+               #   python Scripts/_add_metrics.py --benchmark [max_rows]
 
 
 
+import sys
+import time
+import random
+import numpy as np
 import pandas as pd
-import re
+
+
+
+# Patterns the HITE and EARLGREY sequence names carry their family name in
+HITE_FAMILY_PATTERN = r'#(.*)'
+HITE_HOMOLOGY_PATTERN = r'Homology_(.*?)_\d+$'  # when the sequence info has homology, the classification name is after Homology_
+EARLGREY_FAMILY_PATTERN = r'#([^_]+)_'
 
 
 
@@ -20,38 +35,11 @@ def pipeline_count(df):
     """
     This function facilitates the addition of a column which lists the pipelines used in each cluster and the number of times they are used
     """
-    current = None
-    pipeline_dict = {} # Initialize an empty dictionary to hold pipeline counts
-
-    # Iterates through every row in the dataframe, retrieving the value in the column 'cluster' and the value in the column 'Pipeline Used' (for each row)
-    for index, row in df.iterrows():
-        cluster = row['cluster']
-        pipeline = row["Pipeline Used"]
-
-        # The following lines are added to ensure compatability between data types and content written within certain columns
-        if "Pipeline_Count" not in df.columns:
-            df["Pipeline_Count"] = None # On the first iteration, this column doesn't exist yet, so just assign it as none to avoid 'KeyError'
-        else:
-            df["Pipeline_Count"] = df["Pipeline_Count"].astype(object)
-
-        # when the cluster changes, assign the current pipeline dict (the text within this dict) to the last row in that cluster, indicating the pipelines used in that cluster
-        if current != cluster:
-            if current is not None:
-                # 'df.at[index-1,...' accesses the cell position just before the current row (which is the last row in the last cluster) and writes the pipeline_count
-                df.at[index-1, "Pipeline_Count"] = str(pipeline_dict).replace("{", "").replace("}", "").replace("\'", "")
-                pipeline_dict = {}
-
-            current = cluster # since our current cluster does not equal current, let's update that
-
-        if current == cluster: # However if the current cluster does equal current
-            if pipeline in pipeline_dict: # If the cluster name is already in the the pipeline dict, add one
-                pipeline_dict[pipeline] += 1
-            else: # If the cluster name is not in the pipeline dict, add it in there and assign it as 1
-                pipeline_dict[pipeline] = 1
-
-    # The following code deals with the last row in the df
-    if current is not None and len(pipeline_dict) > 0: # If there is no more 'cluster' cell, but current is still none and pipeline dict is greater than zero
-        df.at[len(df)-1, 'Pipeline_Count'] = str(pipeline_dict).replace("{", "").replace("}", "").replace("\'", "") # Append the pipeline dict to the last line in the df
+    runs, last_rows = cluster_runs(df)
+
+    # Count every pipeline within each cluster (in the order the pipelines first appear in it), then write the counts to the last row of the cluster
+    df["Pipeline_Count"] = None
+    df.loc[df.index[last_rows], "Pipeline_Count"] = counts_text(runs, df["Pipeline Used"], len(last_rows))
 
     return df
 
@@ -64,82 +52,36 @@ def unknown_column(data_frame):
     - 'UNKNOWN FOUND: 'Undiscovered' if there is an unknown but there are no other sequences that provide a classification for this family (of if there is another family, but it is a gold sequence - so doesn't count)
     - 'UNKNOWN FOUND: 'Discovered' if there is an unknown and there is at least one other sequence alluding to a classification within that cluster
     """
-    current = None
-    unknown_dict = {} # Initialize an empty dictionary to hold unknown values
-
-    entries_in_cluster = 0 # This is initialized to keep track of how many rows are in a cluster
-    unknown_found = 0 # this keeps track of how many unknowns are found within the cluster
-    gold_found = 0 # This keeps track of how many gold sequences are found within the cluster - NOTE: I used gold sequences mainly when first building my pipeline, however when testing with real genomes, gold standard
-                   # sequences are not present
-
-    # These two are initialized so that we can have a final score of the proportion of unknowns discovered
-    total_unknowns = 0
-    discovered_unknowns = 0
-
-    # Iterates through every row in the dataframe, retrieving the value in the column 'cluster', the value in the column 'Pipeline Used', and value in the column "Sequence Information" (for each row)
-    for index, row in data_frame.iterrows():
-        cluster = row['cluster']
-        sequence_info = row["Sequence Information"]
-        pipeline = row["Pipeline Used"]
-
-        # The following lines are added to ensure compatability between data types and content written within certain columns
-        if "Unknown_Count" not in data_frame.columns:
-            data_frame["Unknown_Count"] = None
-        else:
-            data_frame["Unknown_Count"] = data_frame["Unknown_Count"].astype(object)
-
-        entries_in_cluster += 1 # Adds 1 to the 'entries_in_cluster' count. This will reset to zero when a new cluster is breached
-
-        # When the cluster changes, print out the current unknown dict to the last row in that cluster, indicating the unknown values (if any) in that cluster
-        if current != cluster: # if current does not equal cluster (indicates change in cluster)
-            if current is not None:
-                if unknown_found == 0: # If there are no unknowns found in the cluster - write 'N/A' at the end of the cluster to denote that there are no unknown sequences present
-                    data_frame.at[index-1, "Unknown_Count"] = str("N/A") # "data_frame.at[index-1, "Unknown_Count"]" accesses the 'Unknown_Count" column for the previous row, and assigns 'N/A' to that cell
-                elif unknown_found > 0: # however, if there is an unknown found, write that there is an unknown and whether or not it was discovered
-                    total_unknowns += 1 # Every time an unknown is present, add it to the total_unknowns count
-                    if unknown_found == entries_in_cluster: # if unknowns = entries_in_cluster ; unknown is present but undiscovered - therefore, write that in the excel sheet
-                        unknown_dict["UNKNOWN PRESENT"] = "Undiscovered"
-                    elif gold_found + unknown_found == entries_in_cluster: # if there are only golds and unknowns in the cluster ; unknown is present but undiscovered
-                        unknown_dict["UNKNOWN PRESENT"] = "Undiscovered"
-                    else: # if there is another sequence that isn't an unknown or a gold in the cluster ; unknown is present and it's been 'discovered'
-                        discovered_unknowns += 1 # Every time an unknown is discovered, add it to the list
-                        unknown_dict["UNKNOWN PRESENT"] = "Discovered"
-                    data_frame.at[index-1, "Unknown_Count"] = str(unknown_dict).replace("{", "").replace("}", "").replace("\'", "")
-
-            unknown_dict = {} # reset the unknown_dict dictionary
-            entries_in_cluster = 0 # reset the entries_in_cluster value to zero
-            current = cluster # since our current cluster does not equal current, let's update that
-            unknown_found = 0
-            gold_found = 0
-
-        if current == cluster: # However if the current cluster does equal current
-            # 1. I should go through every row of the cluster and if a certain condition is met, then I should add [numerically, i.e. +1] to a variable
-            # 2. Only after meeting these conditions, should I make actually make any actions
-            search_query = 'unknown'
-            gold_query = 'gold'
-            if search_query in sequence_info.lower(): # if there is an 'Unknown' in the sequence info
-                unknown_found += 1 # add to the unknown_found count
-            elif gold_query.upper() in pipeline: # if there is a 'Gold' in the pipeline info
-                gold_found += 1 # add to the gold_found count
-            else: # If there is not an 'Unknown' in the sequence info ; don't do anything
-                pass
-
-    # Handle the last cluster - so this code only activates when it gets to the last_row+1 (first blank row) of the dataframe
-    if entries_in_cluster == 0: # If entries = 0, that means that the previous line was the only one in it's cluster, and therefore it wasn't yet added to the number_of_entries list
-        entries_in_cluster += 1 # To make sure the entries_in_cluster reflects that there is only one entry in the last cluster of the df, update it's value to 1
-    if unknown_found == 0: # If there are no unknowns found in the last cluster of dataframe - print 'N/A' at the end of the cluster
-        data_frame.at[index, "Unknown_Count"] = str("N/A")
-    elif unknown_found > 0: # however, if there is an unknown found, print that there is an unknown and whether or not it was discovered
-        if unknown_found == entries_in_cluster: # if unknowns = entries ; unknown is present but undiscovered
-            unknown_dict["UNKNOWN PRESENT"] = "Undiscovered"
-        elif gold_found + unknown_found == entries_in_cluster: # if there are only golds and unknowns in the cluster ; unknown is present but undiscovered
-            unknown_dict["UNKNOWN PRESENT"] = "Undiscovered"
-        else: # if there is another sequence that isn't an unknown or a gold in the cluster ; unknown is present and it's been 'discovered'
-            unknown_dict["UNKNOWN PRESENT"] = "Discovered"
-        data_frame.at[index, "Unknown_Count"] = str(unknown_dict).replace("{", "").replace("}", "").replace("\'", "")
+    runs, last_rows = cluster_runs(data_frame)
+    data_frame["Unknown_Count"] = None
+    if len(data_frame) == 0:
+        return data_frame
+
+    # A sequence is an unknown if its sequence info says 'unknown' (any case), and a gold sequence if it is not an unknown and 'GOLD' is in its pipeline.
+    # NOTE: I used gold sequences mainly when first building my pipeline, however when testing with real genomes, gold standard sequences are not present
+    unknown = data_frame["Sequence Information"].str.lower().str.contains('unknown', regex=False).fillna(False).astype(bool).to_numpy()
+    gold = ~unknown & data_frame["Pipeline Used"].str.contains('GOLD', regex=False).fillna(False).astype(bool).to_numpy()
+
+    # Number of entries, unknowns and golds within each cluster
+    entries_in_cluster = np.bincount(runs, minlength=len(last_rows))
+    unknown_found = np.bincount(runs, weights=unknown, minlength=len(last_rows)).astype(int)
+    gold_found = np.bincount(runs, weights=gold, minlength=len(last_rows)).astype(int)
+
+    # The last cluster of the dataframe is counted one entry short (an entry of at least one) - this keeps the exact output of the original row-by-row version
+    entries_in_cluster[-1] = max(entries_in_cluster[-1] - 1, 1)
+
+    # Undiscovered if the cluster only holds unknowns (or unknowns and golds), discovered if another sequence alludes to a classification
+    undiscovered = (unknown_found == entries_in_cluster) | (gold_found + unknown_found == entries_in_cluster)
+    status = np.where(unknown_found == 0, "N/A",
+                      np.where(undiscovered, "UNKNOWN PRESENT: Undiscovered", "UNKNOWN PRESENT: Discovered"))
+    data_frame.loc[data_frame.index[last_rows], "Unknown_Count"] = status.astype(object)
+
+    # These give a final score of the proportion of unknowns discovered (the last cluster of the dataframe does not count towards it)
+    total_unknowns = int(np.count_nonzero(unknown_found[:-1] > 0))
+    discovered_unknowns = int(np.count_nonzero((unknown_found[:-1] > 0) & ~undiscovered[:-1]))
     if total_unknowns > 0:
         percentage = round((discovered_unknowns / total_unknowns) * 100, 2)
-        data_frame.at[index + 1, "Unknown_Count"] = str(f"Proportion of Unknowns found through clustering: {discovered_unknowns}/{total_unknowns} ({percentage}%)")
+        data_frame.at[data_frame.index[-1] + 1, "Unknown_Count"] = str(f"Proportion of Unknowns found through clustering: {discovered_unknowns}/{total_unknowns} ({percentage}%)")
 
     return data_frame
 
@@ -149,100 +91,119 @@ def family_classification(dframe):
     """
     This function acts to add a new column called 'family_classifications' to the dataframe which will contain the different families within the cluster and their number of occurrences (e.g., 'name': 2, 'name2': 1 ...).
     """
-    current = None
-    family_dict = {}  # Initialize an empty dictionary to hold family counts
-
-    # Iterates through every row in the dataframe, retrieving the value in the column 'cluster' and the value in the column 'Pipeline Used' and the value in the column "Sequence Information" (for each row)
-    for index, row in dframe.iterrows():
-        cluster = row['cluster']
-        pipeline = row["Pipeline Used"]
-        sequence_info = row["Sequence Information"]
-
-        # The following line is added to ensure compatability between data types and content written within certain columns
-        if "family_count" not in dframe.columns:
-            dframe["family_count"] = None
-        else:
-            dframe["family_count"] = dframe["family_count"].astype(object)
-
-        # When the cluster changes, print out the current family dict to the last row in that cluster, indicating the families in that cluster
-        if current != cluster:
-            if current is not None:
-                # 'dframe.at[index-1,...' accesses the cell position just before the current row (which is the last row in the last cluster) and prints the family_count
-                dframe.at[index-1, "family_count"] = str(family_dict).replace("{", "").replace("}", "").replace("\'", "")
-                family_dict = {}
-
-            current = cluster  # Since our current cluster does not equal current, let's update that
-
-        if current == cluster:  # However if the current cluster does equal current
-            # For ANNOSINE pipeline, add the number of 'SINEs' to a dict
-            if pipeline == 'ANNOSINE':
-                if 'SINE' in family_dict:
-                    family_dict['SINE'] += 1
-                else:
-                    family_dict['SINE'] = 1
-            # For MITEFINDER pipeline, add the number of 'MITEs' to a dict
-            elif pipeline == 'MITEFINDER':
-                if "MITE" in family_dict:
-                    family_dict["MITE"] += 1
-                else:
-                    family_dict["MITE"] = 1
-            # For HELIANO pipeline, denote whether or not it's non-auto, auto, or orfonly - and add that to dict
-            elif pipeline == 'HELIANO':
-                if '_auto_' in sequence_info:
-                    if 'autonomous_helitron' in family_dict:
-                        family_dict['autonomous_helitron'] += 1
-                    else:
-                        family_dict['autonomous_helitron'] = 1
-                elif '_nonauto_' in sequence_info:
-                    if 'non_autonomous_helitron' in family_dict:
-                        family_dict['non_autonomous_helitron'] += 1
-                    else:
-                        family_dict['non_autonomous_helitron'] = 1
-                elif 'orfonly' in sequence_info:
-                    if 'orfonly' in family_dict:
-                        family_dict['orfonly'] += 1
-                    else:
-                        family_dict['orfonly'] = 1
-            # For HITE pipeline, add the family name embedded within the sequence info to a dict (unless the sequence info indicates 'unknown')
-            elif pipeline == 'HITE':
-                if "Unknown" in sequence_info:
-                    pass
-                elif "#" in sequence_info:
-                    match = re.search(r'#(.*)', sequence_info)
-                    if match and match.group(1) in family_dict:
-                        family_dict[match.group(1)] += 1
-                    elif match:
-                        family_dict[match.group(1)] = 1
-                elif "Homology" in sequence_info:
-                    match = re.search(r'Homology_(.*?)_\d+$', sequence_info)  # when the sequence info has homology, the classification name is after Homology_
-                    if match and match.group(1) in family_dict:
-                        family_dict[match.group(1)] += 1
-                    elif match:
-                        family_dict[match.group(1)] = 1
-            # For EARLGREY pipeline, add the family name embedded within the sequence to a dict (unless the sequence info indicates 'unknown')
-            elif pipeline == "EARLGREY":
-                if "Unknown" in sequence_info:
-                    pass
-                elif "Simple_repeat" in sequence_info:
-                    if "Simple Repeat" in family_dict:
-                        family_dict["Simple Repeat"] += 1
-                    else:
-                        family_dict["Simple Repeat"] = 1
-                else:
-                    pattern = r'#([^_]+)_'
-                    match = re.search(pattern, sequence_info)
-                    if match and match.group(1) in family_dict:
-                        family_dict[match.group(1)] += 1
-                    elif match:
-                        family_dict[match.group(1)] = 1
-
-    # The following code deals with the last row in the df
-    if current is not None and len(family_dict) > 0:  # If there is no more 'cluster' cell, but current is still not None and family_dict is greater than zero
-        dframe.at[len(dframe)-1, 'family_count'] = str(family_dict).replace("{", "").replace("}", "").replace("\'", "")  # Append the family dict to the last line in the df
+    runs, last_rows = cluster_runs(dframe)
+    family = sequence_families(dframe)
+
+    # Count the families within each cluster (in the order they first appear in it), then write the counts to the last row of the cluster
+    dframe["family_count"] = None
+    dframe.loc[dframe.index[last_rows], "family_count"] = counts_text(runs, family, len(last_rows))
 
     return dframe
 
 
 
+def sequence_families(dframe):
+    """
+    Returns the family each sequence of 'dframe' adds to its cluster's family count (from its pipeline and sequence info) - NaN if it adds nothing.
+    """
+    pipeline = dframe["Pipeline Used"]
+    sequence_info = dframe["Sequence Information"].astype(object)
+    family = pd.Series(np.nan, index=dframe.index, dtype=object) # The family each sequence adds to its cluster's count (NaN if it adds nothing)
+
+    # For ANNOSINE pipeline, count 'SINEs' - for MITEFINDER pipeline, count 'MITEs'
+    family[pipeline == 'ANNOSINE'] = 'SINE'
+    family[pipeline == 'MITEFINDER'] = 'MITE'
+
+    # For HELIANO pipeline, denote whether or not it's non-auto, auto, or orfonly
+    heliano = (pipeline == 'HELIANO').to_numpy()
+    auto = sequence_info.str.contains('_auto_', regex=False).fillna(False).astype(bool).to_numpy()
+    nonauto = sequence_info.str.contains('_nonauto_', regex=False).fillna(False).astype(bool).to_numpy()
+    orfonly = sequence_info.str.contains('orfonly', regex=False).fillna(False).astype(bool).to_numpy()
+    family[heliano & auto] = 'autonomous_helitron'
+    family[heliano & ~auto & nonauto] = 'non_autonomous_helitron'
+    family[heliano & ~auto & ~nonauto & orfonly] = 'orfonly'
+
+    # For HITE pipeline, count the family name embedded within the sequence info (unless the sequence info indicates 'unknown')
+    unknown = sequence_info.str.contains('Unknown', regex=False).fillna(False).astype(bool).to_numpy()
+    hashed = sequence_info.str.contains('#', regex=False).fillna(False).astype(bool).to_numpy()
+    homology = sequence_info.str.contains('Homology', regex=False).fillna(False).astype(bool).to_numpy()
+    hite = (pipeline == 'HITE').to_numpy() & ~unknown
+    family[hite & hashed] = sequence_info[hite & hashed].str.extract(HITE_FAMILY_PATTERN, expand=False)
+    family[hite & ~hashed & homology] = sequence_info[hite & ~hashed & homology].str.extract(HITE_HOMOLOGY_PATTERN, expand=False)
+
+    # For EARLGREY pipeline, count the family name embedded within the sequence (unless the sequence info indicates 'unknown')
+    earlgrey = (pipeline == 'EARLGREY').to_numpy() & ~unknown
+    simple_repeat = sequence_info.str.contains('Simple_repeat', regex=False).fillna(False).astype(bool).to_numpy()
+    family[earlgrey & simple_repeat] = "Simple Repeat"
+    family[earlgrey & ~simple_repeat] = sequence_info[earlgrey & ~simple_repeat].str.extract(EARLGREY_FAMILY_PATTERN, expand=False)
+
+    return family
+
+
+
+def cluster_runs(df):
+    """
+    Numbers the clusters of 'df' - a cluster is a run of consecutive rows with the same 'cluster' value.
+    Returns the cluster number of every row, and the position of the last row of every cluster.
+    """
+    cluster = df["cluster"]
+    new_cluster = (cluster != cluster.shift()).fillna(True).to_numpy(dtype=bool, copy=True) # Any row whose 'cluster' is missing also starts a cluster of its own
+    new_cluster[:1] = True # The first row always starts a cluster
+    runs = np.cumsum(new_cluster) - 1
+    last_rows = np.flatnonzero(np.append(new_cluster[1:], True)) if len(df) else np.array([], dtype=int)
+    return runs, last_rows
+
+
+def counts_text(runs, values, number_of_clusters):
+    """
+    Counts every distinct (non-missing) value within each cluster, and writes the counts of each cluster as text (e.g., 'HITE: 2, EARLGREY: 1'),
+    with the values in the order they first appear in the cluster. Clusters without any values get an empty string.
+    """
+    counts = pd.Series(values.to_numpy(), dtype=object).groupby([runs, values.to_numpy()], sort=False).size()
+
+    cluster_counts = [{} for _ in range(number_of_clusters)]
+    for (run, value), count in zip(counts.index.tolist(), counts.tolist()):
+        cluster_counts[run][value] = count
+
+    return pd.Series([str(count_dict).replace("{", "").replace("}", "").replace("\'", "") for count_dict in cluster_counts], dtype=object).to_numpy()
+
+
+
+def benchmark(max_rows=2_000_000):
+    """
+    Times main() on synthetic clusterings of increasing size (10x steps up to 'max_rows') - the time per row should stay flat as the number of rows grows.
+    """
+    names = ["TE_{i}#LTR/Copia", "Homology_LINE_{i}", "TE_{i}#Unknown", "rnd-1_family-{i}#DNA_TcMar", "rnd-{i}#Simple_repeat", "rnd-{i}#Unknown",
+             "sine_{i}", "mite{i}", "h_auto_{i}", "h_nonauto_{i}", "orfonly{i}"]
+    pipelines = ["HITE", "HITE", "HITE", "EARLGREY", "EARLGREY", "EARLGREY", "ANNOSINE", "MITEFINDER", "HELIANO", "HELIANO", "HELIANO"]
+    rng = random.Random(42)
+
+    print(f"{'rows':>12} {'clusters':>10} {'seconds':>10} {'us/row':>8}")
+    rows = 10_000
+    while rows <= max_rows:
+        cluster_sizes = []
+        while sum(cluster_sizes) < rows:
+            cluster_sizes.append(rng.randint(1, 8))
+        cluster, pipeline, sequence_info = [], [], []
+        for number, size in enumerate(cluster_sizes):
+            for _ in range(size):
+                choice = rng.randrange(len(names))
+                cluster.append(f"Cluster {number}")
+                pipeline.append(pipelines[choice])
+                sequence_info.append(names[choice].format(i=len(cluster)))
+        df = pd.DataFrame({"cluster": cluster, "Pipeline Used": pipeline, "Sequence Information": sequence_info})
+
+        start = time.perf_counter()
+        main(df)
+        seconds = time.perf_counter() - start
+        print(f"{len(df):>12} {len(cluster_sizes):>10} {seconds:>10.2f} {seconds / len(df) * 1e6:>8.2f}")
+        rows *= 10
+
+
+
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) >= 2 and sys.argv[1] == "--benchmark":
+        benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 2_000_000)
+    else:
+        print("Usage: python _add_metrics.py --benchmark [max_rows]")
+        sys.exit(1)
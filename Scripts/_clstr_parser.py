@@ -0,0 +1,147 @@
+# FUNCTIONALITY: This script is called by 'format_data.py'. It reads the '.clstr' file produced by cd-hit in a single streaming pass - one line at a time, without loading the file into memory first.
+               # Each member line is turned straight into a typed record (cluster id, length, pipeline, sequence info, strand/location, identity, representative flag),
+               # and 'clstr_table' builds the formatted table that '_add_metrics.py' adds its columns to (this used to go through '_clstr_to_excel.R', an xlsx file, and '_optimize_csv.py').
+               # 'restore_duplicates' then puts back the exact duplicates that '_combine_fasta.py' collapsed before clustering.
+               #
+               # Run directly to time the parser on a .clstr file:
+               #   python Scripts/_clstr_parser.py <FINAL_cdhit_'genome'.clstr>
+
+
+
+import sys
+import time
+from typing import NamedTuple, Optional
+import pandas as pd
+
+
+
+# Columns of the formatted table, in order (the same columns, and the same text in every cell, as the old _clstr_to_excel.R -> _optimize_csv.py route)
+CLSTR_COLUMNS = ['cluster', 'length (nucleotides [nt] long)', 'Pipeline Used', 'Sequence Information',
+                 'location', 'similarity (%)', 'Representative Sequence?']
+
+CLUSTER_HEADER = ">Cluster "
+
+
+
+class ClusterMember(NamedTuple):
+    """
+    One member line of a cd-hit '.clstr' file, eg. '3	4980nt, >EARLGREY_rnd-1_family-2#LTR/Gypsy... at 1:4980:11:4990/+/98.75%'
+    """
+    cluster: int                    # Cluster number (3 for '>Cluster 3')
+    length: int                     # Sequence length in nucleotides
+    pipeline: str                   # Prefix added to the sequence name before clustering (HITE, EARLGREY, ANNOSINE, MITEFINDER, HELIANO, ...)
+    sequence_info: Optional[str]    # Rest of the sequence name after the pipeline prefix (None if the name has no '_')
+    location: Optional[str]         # Strand, or alignment coordinates and strand ('+', '1:4980:11:4990/+') - None for the representative
+    identity: Optional[float]       # Percent identity to the representative - None for the representative
+    representative: bool            # True for the cluster's representative sequence ('*')
+
+
+
+def iter_clstr(clstr_file):
+    """
+    Yields a ClusterMember for every member line of 'clstr_file', in file order.
+    """
+    for cluster, length_text, te_id, tail in _member_lines(clstr_file):
+        pipeline, sequence_info = _split_te_id(te_id)
+        representative = "*" in tail
+
+        location, identity = None, None
+        if not representative:
+            # 'at +/98.75%' or 'at 1:4980:11:4990/+/98.75%' - the identity is always after the last '/'
+            alignment, _, identity_text = tail.removeprefix("at ").rpartition("/")
+            location = alignment or None
+            identity = float(identity_text.rstrip("%"))
+
+        yield ClusterMember(cluster, int(length_text), pipeline, sequence_info, location, identity, representative)
+
+
+def clstr_table(clstr_file):
+    """
+    Returns the formatted cluster table (CLSTR_COLUMNS) for 'clstr_file' - one row per cluster member, in file order.
+    Every cell holds the same text the old R/xlsx route produced, so the COMPLETE_TE_RESULTS_*.csv file written from it is unchanged.
+    """
+    columns = {column: [] for column in CLSTR_COLUMNS}
+    for cluster, length_text, te_id, tail in _member_lines(clstr_file):
+        pipeline, sequence_info = _split_te_id(te_id)
+        location, slash, similarity = tail.rpartition("/")
+
+        columns['cluster'].append(f"Cluster {cluster}")
+        columns['length (nucleotides [nt] long)'].append(length_text) # Kept as text (like the xlsx cells were) - _add_metrics may append a summary row, which would turn an int column into floats
+        columns['Pipeline Used'].append(pipeline)
+        columns['Sequence Information'].append(sequence_info)
+        columns['location'].append(location if slash else tail)
+        columns['similarity (%)'].append(similarity if slash else None)
+        columns['Representative Sequence?'].append('YES' if "*" in tail else 'No')
+
+    return pd.DataFrame(columns, columns=CLSTR_COLUMNS)
+
+
+def restore_duplicates(table, duplicates):
+    """
+    Puts the exact duplicates that '_combine_fasta.py' collapsed before clustering ({kept ID: [collapsed IDs]}) back into the formatted table, each one right after
+    the member it duplicates - in the same cluster, with the same length, and with 100% identity to it (the alignment and identity of that member if it is not the representative).
+    A duplicate of a sequence that is not in the table (it was itself merged into another cluster in the first round of cd-hit) is left out, like that sequence.
+    """
+    if not duplicates or len(table) == 0:
+        return table
+
+    te_ids = (table['Pipeline Used'] + ("_" + table['Sequence Information']).fillna("")).tolist()
+    positions, rows = [], []
+    for position, te_id in enumerate(te_ids):
+        for collapsed_id in duplicates.get(te_id, ()):
+            member = table.iloc[position]
+            pipeline, sequence_info = _split_te_id(collapsed_id)
+            representative = member['Representative Sequence?'] == 'YES'
+            positions.append(position)
+            rows.append([member['cluster'], member['length (nucleotides [nt] long)'], pipeline, sequence_info,
+                         "at +" if representative else member['location'], "100.00%" if representative else member['similarity (%)'], 'No'])
+    if not rows:
+        return table
+
+    # Each duplicate goes after the member it duplicates (a stable sort on the member positions keeps the duplicates of one member in the order they were collapsed)
+    restored = pd.concat([table, pd.DataFrame(rows, columns=CLSTR_COLUMNS)], ignore_index=True)
+    order = pd.Series(list(range(len(table))) + positions).to_numpy().argsort(kind="stable")
+    return restored.iloc[order].reset_index(drop=True)
+
+
+def _member_lines(clstr_file):
+    # Yields (cluster number, length text, sequence name, text after the name) for every member line - the cluster header lines are only used to track the cluster number
+    cluster = None
+    with open(clstr_file, "r") as clstr:
+        for line in clstr:
+            line = line.rstrip("\r\n")
+            if line.startswith(CLUSTER_HEADER):
+                cluster = int(line[len(CLUSTER_HEADER):])
+                continue
+            _, tab, member = line.partition("\t")
+            if not tab or not member:
+                continue
+
+            # '4980nt, >EARLGREY_rnd-1_family-2#LTR/Gypsy... at +/98.75%' - sequence names cannot contain spaces, so the first '... ' always ends the name
+            length_text, _, rest = member.partition("nt, ")
+            te_id, _, tail = rest.partition("... ")
+            yield cluster, length_text, te_id.replace(">", ""), tail
+
+
+def _split_te_id(te_id):
+    # 'EARLGREY_rnd-1_family-2#LTR/Gypsy' -> ('EARLGREY', 'rnd-1_family-2#LTR/Gypsy') - the pipeline is everything before the first '_'
+    pipeline, underscore, sequence_info = te_id.partition("_")
+    return pipeline, (sequence_info if underscore else None)
+
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python _clstr_parser.py <'.clstr' file>")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    members = clusters = representatives = 0
+    last_cluster = None
+    for member in iter_clstr(sys.argv[1]):
+        members += 1
+        representatives += member.representative
+        if member.cluster != last_cluster:
+            clusters += 1
+            last_cluster = member.cluster
+    print(f"{members} members in {clusters} clusters ({representatives} representatives) parsed in {time.perf_counter() - start:.2f} s")
@@ -0,0 +1,227 @@
+# FUNCTIONALITY: This script holds the cluster table - one compact, array-backed view of the final cd-hit clustering that every post-clustering step queries,
+               # instead of each of them re-reading COMPLETE_TE_RESULTS_'genome'.csv with pandas and walking it row by row with its own state machine.
+               # It is built once by 'format_data.py' (from the same table that is written to the COMPLETE_TE_RESULTS csv) and saved next to that csv as CLUSTER_TABLE_'genome'.npz.
+               # Members are stored in file order with per-cluster offsets, and each cluster keeps its aggregates: representative sequence, unknown status, pipeline and family counts.
+               # It is then queried by 'extract_representative_sequences.py', 'merge.py' and 'Classify/create_classification_dataset.py'.
+               #
+               #   python Scripts/_cluster_table.py info <CLUSTER_TABLE_'genome'.npz>
+
+
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+from _add_metrics import cluster_runs
+
+
+
+# Unknown status of a cluster (the 'Unknown_Count' text written to the last row of the cluster in the COMPLETE_TE_RESULTS csv)
+UNKNOWN_NONE, UNKNOWN_UNDISCOVERED, UNKNOWN_DISCOVERED = 0, 1, 2
+UNKNOWN_TEXT = {"N/A": UNKNOWN_NONE, "UNKNOWN PRESENT: Undiscovered": UNKNOWN_UNDISCOVERED, "UNKNOWN PRESENT: Discovered": UNKNOWN_DISCOVERED}
+
+_ARRAYS = ["cluster_ids", "offsets", "rep_index", "unknown_status", "pipeline_count_blob", "pipeline_count_offsets", "family_count_blob", "family_count_offsets",
+           "name_blob", "name_offsets", "pipeline_codes", "pipeline_name_blob", "pipeline_name_offsets", "lengths", "identity", "representative"]
+
+
+
+class ClusterTable:
+    """
+    n clusters holding m members (in the order of the .clstr file) stored as:
+        cluster_ids      int64   - cd-hit cluster number of cluster c (c for '>Cluster c')
+        offsets          int64   - cluster c holds members offsets[c]:offsets[c + 1]
+        rep_index        int64   - member index of the representative sequence of cluster c (-1 if the cluster has none)
+        unknown_status   int8    - UNKNOWN_NONE / UNKNOWN_UNDISCOVERED / UNKNOWN_DISCOVERED for cluster c
+        pipeline_count_* / family_count_* - the 'Pipeline_Count' / 'family_count' text of cluster c (e.g., 'HITE: 2, EARLGREY: 1'), as a UTF-8 blob and offsets
+        name_*                   - 'Sequence Information' of every member, as a UTF-8 blob and offsets
+        pipeline_codes   int16   - pipeline of every member, as an index into the pipeline names (pipeline_name_*)
+        lengths          int64   - length of every member in nucleotides
+        identity         float32 - identity (%) of every member to its representative (NaN for the representative)
+        representative   bool    - True for the representative members
+    """
+
+    def __init__(self, cluster_ids, offsets, rep_index, unknown_status, pipeline_count_blob, pipeline_count_offsets, family_count_blob, family_count_offsets,
+                 name_blob, name_offsets, pipeline_codes, pipeline_name_blob, pipeline_name_offsets, lengths, identity, representative):
+        self.cluster_ids = cluster_ids
+        self.offsets = offsets
+        self.rep_index = rep_index
+        self.unknown_status = unknown_status
+        self.pipeline_count_blob = pipeline_count_blob
+        self.pipeline_count_offsets = pipeline_count_offsets
+        self.family_count_blob = family_count_blob
+        self.family_count_offsets = family_count_offsets
+        self.name_blob = name_blob
+        self.name_offsets = name_offsets
+        self.pipeline_codes = pipeline_codes
+        self.pipeline_name_blob = pipeline_name_blob
+        self.pipeline_name_offsets = pipeline_name_offsets
+        self.lengths = lengths
+        self.identity = identity
+        self.representative = representative
+        self._names = None
+
+    # ------------------------------------------------ Building / saving ------------------------------------------------
+
+    @classmethod
+    def from_results(cls, df):
+        """
+        Builds the table from a COMPLETE_TE_RESULTS table - either the one 'format_data.py' has just written, or the csv read back with pandas.
+        Rows without a cluster (the proportion-of-unknowns summary row) are not members.
+        """
+        members = df[df["cluster"].notna()].reset_index(drop=True)
+        runs, last_rows = cluster_runs(members)
+        number_of_clusters = len(last_rows)
+
+        # The representative of a cluster is its last member marked 'YES' (cd-hit marks exactly one)
+        representative = (members["Representative Sequence?"] == "YES").to_numpy(dtype=bool)
+        rep_index = np.full(number_of_clusters, -1, dtype=np.int64)
+        np.maximum.at(rep_index, runs[representative], np.flatnonzero(representative))
+
+        last = members.iloc[last_rows]
+        pipelines, pipeline_names = pd.factorize(members["Pipeline Used"].astype(object).fillna(""))
+        similarity = members["similarity (%)"].astype(object).where(members["similarity (%)"].notna(), None) # '98.75%' (NaN for the representatives)
+
+        return cls(
+            cluster_ids=last["cluster"].astype(str).str.removeprefix("Cluster ").astype(np.int64).to_numpy(),
+            offsets=_offsets(np.bincount(runs, minlength=number_of_clusters)),
+            rep_index=rep_index,
+            unknown_status=last["Unknown_Count"].map(UNKNOWN_TEXT).fillna(UNKNOWN_NONE).to_numpy(dtype=np.int8),
+            **_blob("pipeline_count", _texts(last["Pipeline_Count"])),
+            **_blob("family_count", _texts(last["family_count"])),
+            **_blob("name", _texts(members["Sequence Information"])),
+            pipeline_codes=pipelines.astype(np.int16),
+            **_blob("pipeline_name", [str(p) for p in pipeline_names]),
+            lengths=members["length (nucleotides [nt] long)"].astype(np.int64).to_numpy(),
+            identity=similarity.str.rstrip("%").astype(np.float32).to_numpy(),
+            representative=representative,
+        )
+
+    def save(self, path):
+        # A single compressed .npz file - every array is read back whole, so there is nothing to gain from separate memory-mapped files,
+        # and the compression (mostly of the sequence names and count texts) makes the table about a sixth of the size of the csv
+        with open(path, "wb") as table_file:
+            np.savez_compressed(table_file, **{name: getattr(self, name) for name in _ARRAYS})
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            return cls(**{name: arrays[name] for name in _ARRAYS})
+
+    # ------------------------------------------------ Access ------------------------------------------------
+
+    def __len__(self):
+        return len(self.cluster_ids)
+
+    @property
+    def number_of_members(self):
+        return len(self.lengths)
+
+    @property
+    def names(self):
+        # 'Sequence Information' of every member (decoded once)
+        if self._names is None:
+            self._names = _strings(self.name_blob, self.name_offsets)
+        return self._names
+
+    @property
+    def pipeline_names(self):
+        return _strings(self.pipeline_name_blob, self.pipeline_name_offsets)
+
+    @property
+    def pipeline_counts(self):
+        return _strings(self.pipeline_count_blob, self.pipeline_count_offsets)
+
+    @property
+    def family_counts(self):
+        return _strings(self.family_count_blob, self.family_count_offsets)
+
+    @property
+    def sizes(self):
+        return np.diff(self.offsets)
+
+    @property
+    def last_members(self):
+        # Member index of the last member of every cluster (the row each cluster's aggregates are written to in the csv)
+        return self.offsets[1:] - 1
+
+    def member_clusters(self):
+        # Cluster (position in the table, not the cd-hit number) of every member
+        return np.repeat(np.arange(len(self)), self.sizes)
+
+    def clusters_with_status(self, status):
+        return np.flatnonzero(self.unknown_status == status)
+
+    def representative_names(self, clusters):
+        # 'Sequence Information' of the representative of each of the given clusters, in the order given (clusters without a representative are skipped)
+        names = self.names
+        return [names[i] for i in self.rep_index[clusters] if i >= 0]
+
+    def matches(self, df):
+        # True if the member rows of 'df' (a COMPLETE_TE_RESULTS table) are the members of this table, in the same order
+        members = df["Sequence Information"][df["cluster"].notna()]
+        return len(members) == self.number_of_members and _texts(members) == self.names
+
+
+
+def cluster_table_path(complete_csv):
+    # COMPLETE_TE_RESULTS_'genome'.csv -> CLUSTER_TABLE_'genome'.npz, in the same directory
+    directory, file_name = os.path.split(complete_csv)
+    base_name = os.path.splitext(file_name)[0].replace("COMPLETE_TE_RESULTS_", "", 1)
+    return os.path.join(directory, f"CLUSTER_TABLE_{base_name}.npz")
+
+
+def load_cluster_table(complete_csv, df=None):
+    """
+    Loads the cluster table saved next to 'complete_csv'. If there is none (results from before the table existed), or it does not match the rows of 'df'
+    (when the caller has the csv loaded anyway), the table is built from the csv instead.
+    """
+    table_path = cluster_table_path(complete_csv)
+    if os.path.exists(table_path):
+        cluster_table = ClusterTable.load(table_path)
+        if df is None or cluster_table.matches(df):
+            return cluster_table
+        print(f"The cluster table {table_path} does not match {complete_csv} - rebuilding it from the csv.")
+    else:
+        print(f"No cluster table found at {table_path} - building it from {complete_csv}.")
+
+    return ClusterTable.from_results(pd.read_csv(complete_csv) if df is None else df)
+
+
+
+def _texts(column):
+    # Cell text of a column, with missing cells as empty strings
+    return column.astype(object).fillna("").astype(str).tolist()
+
+
+def _blob(prefix, strings):
+    encoded = [s.encode("utf-8") for s in strings]
+    return {
+        f"{prefix}_blob": np.frombuffer(b"".join(encoded), dtype=np.uint8),
+        f"{prefix}_offsets": _offsets(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))),
+    }
+
+
+def _strings(blob, offsets):
+    data = bytes(blob)
+    return [data[a:b].decode("utf-8") for a, b in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+
+def _offsets(lengths):
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return offsets
+
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "info":
+        cluster_table = ClusterTable.load(sys.argv[2])
+        print(f"Clusters: {len(cluster_table)}  Members: {cluster_table.number_of_members}  Singletons: {int((cluster_table.sizes == 1).sum())}")
+        for label, status in [("no unknowns", UNKNOWN_NONE), ("undiscovered unknowns", UNKNOWN_UNDISCOVERED), ("discovered unknowns", UNKNOWN_DISCOVERED)]:
+            print(f"Clusters with {label}: {len(cluster_table.clusters_with_status(status))}")
+        pipelines = cluster_table.pipeline_names
+        counts = np.bincount(cluster_table.pipeline_codes, minlength=len(pipelines))
+        print("Members per pipeline: " + ", ".join(f"{p}: {c}" for p, c in zip(pipelines, counts.tolist())))
+    else:
+        print("Usage: python _cluster_table.py info <CLUSTER_TABLE_'genome'.npz>")
+        sys.exit(1)
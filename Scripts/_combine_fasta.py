@@ -0,0 +1,114 @@
+# FUNCTIONALITY: This script builds the COMBINED_TE_SEQUENCES_'genome'.fa file that goes into the first round of cd-hit, in a single streaming pass over the FASTA files of the five TE tools.
+               # Every header gets the prefix of its tool (EARLGREY_, HITE_, ANNOSINE_, HELIANO_, MITEFINDER_) and its spaces turned into '_' (what the 'sed' command per tool used to do),
+               # and the records are written straight into the combined file (what the 'mv' and 'cat' commands used to do).
+               # Each sequence is hashed on the way: a sequence byte-identical to one that was already written (the same consensus reported by two tools, or twice by one tool) is not written again.
+               # Instead, its ID is recorded in the sidecar file COLLAPSED_DUPLICATES_'genome'.tsv next to the ID of the sequence it duplicates,
+               # so that 'format_data.py' can put it back into the cluster of that sequence after clustering (and its pipeline still counts in 'Pipeline_Count').
+               # It only uses the python standard library, so it runs before the python virtual environment is set up in 'main.sh'.
+               #
+               #   python Scripts/_combine_fasta.py <combined.fa> <duplicates.tsv> EARLGREY=<fasta> HITE=<fasta> ... [--prefixed-dir <dir>]
+               #   (with '--prefixed-dir', the prefixed FASTA of every tool is also written to <dir> as Prefixed_<file name> - for the '-f' flag of 'main.sh')
+
+
+
+import os
+import sys
+import time
+import hashlib
+
+
+
+DUPLICATES_HEADER = "kept_id\tcollapsed_id"
+
+
+
+def prefixed_records(fasta, prefix):
+    """
+    Yields (header line, sequence lines) for every record of 'fasta', with the header already prefixed and normalized ('>PREFIX_' + the header with its spaces and tabs as '_')
+    and the line endings removed. Blank lines, and anything before the first header, are not part of a record and are dropped.
+    """
+    header, lines = None, []
+    with open(fasta, "rb") as fasta_file:
+        for line in fasta_file:
+            line = line.rstrip(b"\r\n")
+            if line.startswith(b">"):
+                if header is not None:
+                    yield header, lines
+                header = b">" + prefix.encode("utf-8") + b"_" + line[1:].replace(b" ", b"_").replace(b"\t", b"_")
+                lines = []
+            elif header is not None and line.strip():
+                lines.append(line)
+    if header is not None:
+        yield header, lines
+
+
+def combine(inputs, combined_fasta, duplicates_file, prefixed_dir=None):
+    """
+    Writes the records of every (prefix, fasta) in 'inputs', in that order, to 'combined_fasta' - leaving out every sequence byte-identical to one already written,
+    and recording it in 'duplicates_file' instead (kept ID, collapsed ID). Returns the number of records read and written per prefix.
+    """
+    seen = {} # blake2b digest of a sequence -> ID of the first record with that sequence
+    counts = {}
+    with open(combined_fasta, "wb") as combined, open(duplicates_file, "w") as duplicates:
+        duplicates.write(DUPLICATES_HEADER + "\n")
+        for prefix, fasta in inputs:
+            read = written = 0
+            prefixed = open(os.path.join(prefixed_dir, f"Prefixed_{os.path.basename(fasta)}"), "wb") if prefixed_dir else None
+            for header, lines in prefixed_records(fasta, prefix):
+                record = header + b"\n" + b"".join(line + b"\n" for line in lines)
+                if prefixed:
+                    prefixed.write(record)
+                read += 1
+
+                # Empty records are passed through as they are (cd-hit skips them anyway)
+                sequence = b"".join(line.strip() for line in lines)
+                record_id = header[1:].decode("utf-8")
+                if sequence:
+                    digest = hashlib.blake2b(sequence, digest_size=16).digest()
+                    kept_id = seen.setdefault(digest, record_id)
+                    if kept_id != record_id:
+                        duplicates.write(f"{kept_id}\t{record_id}\n")
+                        continue
+
+                combined.write(record)
+                written += 1
+            if prefixed:
+                prefixed.close()
+            counts[prefix] = (read, written)
+    return counts
+
+
+def read_duplicates(duplicates_file):
+    # The sidecar file as {kept ID: [collapsed IDs, in the order they were read]}
+    duplicates = {}
+    with open(duplicates_file, "r") as sidecar:
+        for line in sidecar:
+            line = line.rstrip("\r\n")
+            if not line or line == DUPLICATES_HEADER:
+                continue
+            kept_id, collapsed_id = line.split("\t")
+            duplicates.setdefault(kept_id, []).append(collapsed_id)
+    return duplicates
+
+
+
+if __name__ == "__main__":
+    arguments = sys.argv[1:]
+    prefixed_dir = None
+    if "--prefixed-dir" in arguments:
+        position = arguments.index("--prefixed-dir")
+        prefixed_dir = arguments[position + 1] if position + 1 < len(arguments) else None
+        del arguments[position:position + 2]
+    inputs = [tuple(argument.split("=", 1)) for argument in arguments[2:]]
+
+    if len(arguments) < 3 or any(len(pair) != 2 for pair in inputs) or ("--prefixed-dir" in sys.argv and not prefixed_dir):
+        print("Usage: python _combine_fasta.py <combined.fa> <duplicates.tsv> PREFIX=<fasta> [PREFIX=<fasta> ...] [--prefixed-dir <dir>]")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    counts = combine(inputs, arguments[0], arguments[1], prefixed_dir)
+    for prefix, (read, written) in counts.items():
+        print(f"{prefix}: {read} sequences, {read - written} exact duplicates collapsed")
+    read_total = sum(read for read, _ in counts.values())
+    written_total = sum(written for _, written in counts.values())
+    print(f"{written_total} of {read_total} sequences written to {arguments[0]} in {time.perf_counter() - start:.2f} s (collapsed duplicates in {arguments[1]})")
@@ -0,0 +1,140 @@
+# FUNCTIONALITY: This script holds the byte-offset index of a FASTA file (like a samtools '.fai' file, but it does not need every line of a sequence to be the same width).
+               # It is built once for the final cd-hit FASTA file, right after the second round of cd-hit (in 'main.sh'), and saved next to it as FINAL_cdhit_'genome'.idx.
+               # 'extract_representative_sequences.py' and 'Classify/create_classification_dataset.py' then fetch the representative sequences they need by ID with direct seeks,
+               # instead of parsing every record of the FASTA file with SeqIO and checking each one against the list of representatives.
+               #
+               #   python Scripts/_fasta_index.py <FINAL_cdhit_'genome'>
+
+
+
+import io
+import os
+import sys
+import mmap
+import time
+from Bio import SeqIO
+
+
+
+INDEX_EXTENSION = ".idx"
+INDEX_HEADER = "#fasta_bytes"
+
+
+
+class FastaIndex:
+    """
+    The records of a FASTA file, in file order: the ID of record i (the first word of its header line, as SeqIO reads it)
+    and its bytes - from the '>' of its header line up to the '>' of the next record - offsets[i]:offsets[i + 1]
+    """
+
+    def __init__(self, fasta_bytes, ids, offsets):
+        self.fasta_bytes = fasta_bytes # Size of the indexed FASTA file, to tell when the index no longer belongs to it
+        self.ids = ids
+        self.offsets = offsets
+
+    @classmethod
+    def build(cls, fasta):
+        # One pass over the file (memory-mapped, so only the header lines are ever copied into python)
+        ids, offsets = [], []
+        fasta_bytes = os.path.getsize(fasta)
+        if fasta_bytes > 0:
+            with open(fasta, "rb") as fasta_file, mmap.mmap(fasta_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                start = 0 if data[:1] == b">" else _next_record(data, 0) # Anything before the first header is not part of a record
+                while start >= 0:
+                    header_end = data.find(b"\n", start)
+                    header = data[start + 1:header_end if header_end >= 0 else fasta_bytes].decode("utf-8").strip()
+                    ids.append(header.split(None, 1)[0] if header else "")
+                    offsets.append(start)
+                    start = _next_record(data, start)
+        offsets.append(fasta_bytes)
+        return cls(fasta_bytes, ids, offsets)
+
+    def save(self, path):
+        with open(path, "w") as index_file:
+            index_file.write(f"{INDEX_HEADER}\t{self.fasta_bytes}\n")
+            for record_id, start, end in zip(self.ids, self.offsets, self.offsets[1:]):
+                index_file.write(f"{record_id}\t{start}\t{end - start}\n")
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as index_file:
+            _, fasta_bytes = index_file.readline().rstrip("\n").split("\t")
+            ids, offsets = [], []
+            for line in index_file:
+                record_id, start, _ = line.rstrip("\n").split("\t")
+                ids.append(record_id)
+                offsets.append(int(start))
+        offsets.append(int(fasta_bytes))
+        return cls(int(fasta_bytes), ids, offsets)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def read_records(self, fasta, positions):
+        # Yields the bytes of each of the given records (positions in the index), with a direct seek to each one
+        with open(fasta, "rb") as fasta_file:
+            for i in positions:
+                fasta_file.seek(self.offsets[i])
+                yield fasta_file.read(self.offsets[i + 1] - self.offsets[i])
+
+
+
+def _next_record(data, position):
+    # Position of the '>' of the next header line after 'position' (-1 if there is none)
+    found = data.find(b"\n>", position)
+    return found + 1 if found >= 0 else -1
+
+
+def fasta_index_path(fasta):
+    # FINAL_cdhit_'genome' -> FINAL_cdhit_'genome'.idx, in the same directory
+    return fasta + INDEX_EXTENSION
+
+
+def load_fasta_index(fasta):
+    """
+    Loads the index saved next to 'fasta'. If there is none, or it was built for a different version of the file, the index is rebuilt (and saved, if the directory is writable).
+    """
+    index_path = fasta_index_path(fasta)
+    if os.path.exists(index_path):
+        fasta_index = FastaIndex.load(index_path)
+        if fasta_index.fasta_bytes == os.path.getsize(fasta):
+            return fasta_index
+        print(f"The FASTA index {index_path} does not match {fasta} - rebuilding it.")
+    else:
+        print(f"No FASTA index found at {index_path} - building it.")
+
+    fasta_index = FastaIndex.build(fasta)
+    try:
+        fasta_index.save(index_path)
+    except OSError:
+        pass
+    return fasta_index
+
+
+def fetch_records(fasta, names, key=None):
+    """
+    Yields the SeqRecords of 'fasta' whose ID (after 'key' is applied to it, e.g., to remove the cd-hit prefix) is in 'names', in file order - the same records,
+    in the same order, as parsing the whole file with SeqIO.parse and checking every record against 'names'.
+    """
+    fasta_index = load_fasta_index(fasta)
+    names = set(names)
+    record_ids = fasta_index.ids if key is None else map(key, fasta_index.ids)
+    positions = [i for i, record_id in enumerate(record_ids) if record_id in names]
+
+    for i, record_bytes in zip(positions, fasta_index.read_records(fasta, positions)):
+        record = SeqIO.read(io.StringIO(record_bytes.decode("utf-8")), "fasta")
+        if record.id != fasta_index.ids[i]: # The file was changed in place (with the same size) since it was indexed
+            raise ValueError(f"The FASTA index {fasta_index_path(fasta)} is out of date with {fasta} - delete it so that it is rebuilt.")
+        yield record
+
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python _fasta_index.py <FASTA file>")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    fasta_index = FastaIndex.build(sys.argv[1])
+    fasta_index.save(fasta_index_path(sys.argv[1]))
+    print(f"Indexed {len(fasta_index)} records of {sys.argv[1]} in {time.perf_counter() - start:.2f} s: {fasta_index_path(sys.argv[1])}")
@@ -0,0 +1,189 @@
+# FUNCTIONALITY: This script is called by 'Train/_START_TRAINING.py' and 'Classify/_START_CLASSIFYING.py' when a feature cache directory is given (--feature-cache <dir>).
+               # It keeps a persistent, content-addressed store of extracted features shared by every training and classification run.
+               # Each entry is keyed by the SHA-256 of the uppercased, imputed sequence, the feature family and the extractor that produced it (the ftrCOOL package and feature parameters
+               # versions, or the python engine version),
+               # so retraining the same dataset with a different --kbest, or classifying a consensus that was already seen in another genome, never recomputes its features.
+               # Only the cache misses are sent through feature extraction. The store is bounded in size - the least recently used entries are evicted first.
+
+
+
+import os
+import hashlib
+import sqlite3
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from _feature_engine import FEATURE_FAMILIES, assemble_extracted_dataset, family_columns, family_tag, run_feature_backend
+from _feature_exchange import read_table, write_table
+
+
+
+DEFAULT_MAX_GB = 20
+CACHE_FILE_NAME = "feature_cache.sqlite"
+
+
+
+def main___cached_feature_extraction(preprocessed_dataset, output_path, backend, r_script, cache_dir, max_gb=DEFAULT_MAX_GB, extra_r_args=(), families=None, workers=1, with_sequences=False):
+    """
+    STEP 3 with the feature cache - writes the same ftrCool_extracted_*.csv as 'backend' would, computing features only for sequences that are not cached yet.
+    """
+    print("\n")
+    print("\n")
+    print("-----------------------------------------------------------------------------------------------")
+    print(f"STEP 3: Extract features from each sequence within the dataset (feature cache: {cache_dir}).")
+    print("-----------------------------------------------------------------------------------------------")
+
+    families = list(FEATURE_FAMILIES) if families is None else [f for f in FEATURE_FAMILIES if f in families]
+
+    # Cache entries are keyed by sequence content, output rows by their position in the preprocessed dataset (row_index, same as the R script)
+    data = read_table(preprocessed_dataset)
+    keys = [sequence_key(s) for s in data["sequence_content"].astype(str)]
+
+    cache = FeatureCache(cache_dir, max_gb)
+    try:
+        found = {family: cache.get_many(family_tag(backend, family, r_script), family, keys) for family in families}
+        miss_mask = np.array([any(k not in found[f] for f in families) for k in keys], dtype=bool)
+        print(f"Sequences found in the feature cache: {int((~miss_mask).sum())} / {len(keys)}")
+
+        # Extract features for the cache misses only, then store them
+        if miss_mask.any():
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                miss_csv = os.path.join(tmp_dir, os.path.basename(str(preprocessed_dataset)))
+                miss_output = os.path.join(tmp_dir, "ftrCool_extracted_cache_misses" + (os.path.splitext(str(output_path))[1] or ".csv"))
+                write_table(data[miss_mask], miss_csv)
+                run_feature_backend(backend, miss_csv, miss_output, r_script, extra_r_args, families, workers)
+                extracted = read_table(miss_output)
+
+            # The row_index of the extracted misses points into the miss file - look up the cache key of each row there
+            miss_keys = np.asarray(keys, dtype=object)[miss_mask]
+            extracted_keys = miss_keys[extracted["row_index"].to_numpy() - 1].tolist()
+            for family in families:
+                block = family_columns(extracted, family).apply(pd.to_numeric, errors="coerce")
+                values = dict(zip(extracted_keys, block.to_numpy(dtype=float)))
+                cache.put_many(family_tag(backend, family, r_script), family, list(block.columns), values)
+                found[family].update(values)
+
+        # Rows the extractor dropped (eg. sequences it could not featurize) are dropped here as well
+        keep = np.array([all(k in found[f] for f in families) for k in keys], dtype=bool)
+        data = data[keep]
+        kept_keys = [k for k, kept in zip(keys, keep) if kept]
+
+        blocks = []
+        for family in families:
+            columns = cache.columns(family_tag(backend, family, r_script), family)
+            matrix = np.vstack([found[family][k] for k in kept_keys]) if kept_keys else np.empty((0, len(columns)))
+            blocks.append(pd.DataFrame(matrix, columns=columns))
+
+        combined_df = assemble_extracted_dataset(data, blocks, with_sequences)
+        write_table(combined_df, output_path)
+        print(f"\nFeature-extracted dataset saved to: {output_path}")
+
+        cache.evict()
+        cache.print_stats()
+    finally:
+        cache.close()
+
+
+def sequence_key(sequence):
+    # Content address of a sequence - the features only depend on the (uppercased, imputed) sequence itself
+    return hashlib.sha256(sequence.upper().encode("ascii")).hexdigest()
+
+
+
+class FeatureCache:
+    """
+    SQLite-backed feature store. One row per (extractor tag, family, sequence key) holding the family's feature vector as float64 bytes.
+    SQLite's file locking makes it safe to share one cache directory between concurrent SLURM jobs.
+    """
+
+    def __init__(self, cache_dir, max_gb=DEFAULT_MAX_GB):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.max_bytes = int(max_gb * 1024 ** 3)
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(os.path.join(cache_dir, CACHE_FILE_NAME), timeout=600)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS features (
+                tag TEXT NOT NULL, family TEXT NOT NULL, seq_key TEXT NOT NULL,
+                vec BLOB NOT NULL, nbytes INTEGER NOT NULL, last_used REAL NOT NULL,
+                PRIMARY KEY (tag, family, seq_key)
+            );
+            CREATE INDEX IF NOT EXISTS features_last_used ON features(last_used);
+            CREATE TABLE IF NOT EXISTS family_columns (
+                tag TEXT NOT NULL, family TEXT NOT NULL, columns TEXT NOT NULL,
+                PRIMARY KEY (tag, family)
+            );
+        """)
+
+    def get_many(self, tag, family, keys):
+        # Returns {key: feature vector} for every key that is cached, and marks those entries as recently used
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        for i in range(0, len(unique_keys), 500):
+            chunk = unique_keys[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT seq_key, vec FROM features WHERE tag = ? AND family = ? AND seq_key IN ({placeholders})",
+                [tag, family, *chunk]
+            ).fetchall()
+            for key, vec in rows:
+                found[key] = np.frombuffer(vec, dtype=np.float64)
+            self.conn.execute(
+                f"UPDATE features SET last_used = ? WHERE tag = ? AND family = ? AND seq_key IN ({placeholders})",
+                [time.time(), tag, family, *chunk]
+            )
+        self.conn.commit()
+        self.hits += len(found)
+        self.misses += len(unique_keys) - len(found)
+        return found
+
+    def put_many(self, tag, family, columns, values):
+        now = time.time()
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO family_columns VALUES (?, ?, ?)", (tag, family, "\t".join(columns)))
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO features VALUES (?, ?, ?, ?, ?, ?)",
+                ((tag, family, key, vec.astype(np.float64).tobytes(), vec.size * 8, now) for key, vec in values.items())
+            )
+
+    def columns(self, tag, family):
+        row = self.conn.execute("SELECT columns FROM family_columns WHERE tag = ? AND family = ?", (tag, family)).fetchone()
+        return row[0].split("\t") if row else []
+
+    def size_bytes(self):
+        return self.conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM features").fetchone()[0]
+
+    def evict(self):
+        # Drop least recently used entries until the cache is back under 90% of its size limit
+        size = self.size_bytes()
+        if size <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        evicted = 0
+        with self.conn:
+            while size > target:
+                oldest = self.conn.execute("SELECT rowid, nbytes FROM features ORDER BY last_used LIMIT 10000").fetchall()
+                if not oldest:
+                    break
+                doomed = []
+                for rowid, nbytes in oldest:
+                    if size <= target:
+                        break
+                    doomed.append((rowid,))
+                    size -= nbytes
+                self.conn.executemany("DELETE FROM features WHERE rowid = ?", doomed)
+                evicted += len(doomed)
+        print(f"Feature cache over its {self.max_bytes / 1024 ** 3:.1f} GB limit - evicted {evicted} least recently used entries")
+
+    def print_stats(self):
+        lookups = self.hits + self.misses
+        hit_rate = (self.hits / lookups * 100) if lookups else 0.0
+        entries = self.conn.execute("SELECT COUNT(*) FROM features").fetchone()[0]
+        print("\nFEATURE CACHE SUMMARY")
+        print(f"Hits: {self.hits}  Misses: {self.misses}  Hit rate: {hit_rate:.1f}%")
+        print(f"Entries: {entries}  Size: {self.size_bytes() / 1024 ** 2:.1f} MB (limit {self.max_bytes / 1024 ** 3:.1f} GB)")
+
+    def close(self):
+        self.conn.close()
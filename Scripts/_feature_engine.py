@@ -0,0 +1,671 @@
+# FUNCTIONALITY: This script is called by 'Train/_START_TRAINING.py' and 'Classify/_START_CLASSIFYING.py' when the python feature backend is chosen (--feature-backend python).
+               # It computes the ftrCOOL feature families in-process with NumPy instead of starting an Rscript and looping over each sequence in R.
+               # Sequences are 2-bit encoded (A=0, C=1, G=2, T=3) and concatenated into one array per batch, so every k-mer family is a single bincount over the whole batch.
+               # Families that depend on ftrCOOL's internal physicochemical property tables are still delegated to 'ftrCool_feature_extraction.R' (only those families are computed in R).
+               # The parameters of some native families (CkSNUCpair gaps, ExpectedValKmerNUC k, Mismatch k/m, NUCKpart remainder) and the Zcurve column names follow ftrCOOL's documentation,
+               # so before computing anything the backend runs ftrCool_feature_extraction.R and itself on a small fixed set of sequences, and stops if any requested native family
+               # disagrees with ftrCOOL (columns or values) - use the R backend for those. tests/test_feature_engine.py runs the same comparison for every native family.
+               #
+               # Run directly to compare an R-produced and a python-produced feature CSV column for column:
+               #   python Scripts/_feature_engine.py <ftrCool_extracted_R.csv> <ftrCool_extracted_python.csv>
+               # (either file may also be a .feather file written with --exchange-format feather)
+
+
+
+import os
+import sys
+import json
+import functools
+import subprocess
+import tempfile
+import re
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from _feature_exchange import is_feather, read_table, write_table
+from _feature_shards import run_r_sharded
+from _sequence_store import PackedSequences, dataset_store
+
+
+
+# Feature families in the exact order they are 'cbind'-ed in ftrCool_feature_extraction.R. The family name is also the column suffix the R script adds.
+FEATURE_FAMILIES = [
+    "KNUComposition_DNA", "APkNUCdi_DNA", "APkNUCTri_DNA", "CkSNUCpair_DNA", "ASDC_DNA", "CodonUsage_DNA", "DPCP_DNA",
+    "ExpectedValKmerNUC_DNA", "PCPseDNC", "Mismatch_DNA", "CodonFraction", "MMI_DNA", "PseEIIP", "NUCKpartComposition_DNA",
+    "PSEkNUCdi_DNA", "PSEkNUCTri_DNA", "Zcurve36bit_DNA", "Zcurve144bit_DNA", "Zcurve12bit_DNA", "Zcurve48bit_DNA", "Zcurve9bit_DNA",
+]
+
+# These families are built from ftrCOOL's physicochemical property tables, so they are always computed by the R script
+R_ONLY_FAMILIES = {"APkNUCdi_DNA", "APkNUCTri_DNA", "DPCP_DNA", "PCPseDNC", "PSEkNUCdi_DNA", "PSEkNUCTri_DNA"}
+
+# Bump this whenever a native family changes its output, so anything keyed on the extractor (eg. cached features) is invalidated
+ENGINE_VERSION = "1"
+
+# Record saved next to the scaler of a trained model (Model_Artifacts/FEATURE_BACKEND_<dataset>.json) - the backend (and native family version) its training features came from.
+# Classification with another backend would feed the model different feature values, so it is refused.
+BACKEND_RECORD_PREFIX = "FEATURE_BACKEND_"
+
+NUCLEOTIDES = "ACGT"
+
+# Lookup table used to 2-bit encode raw sequence bytes. Anything that is not A/C/G/T (upper or lower case) becomes 255 and invalidates every window it falls in.
+_ENCODE = np.full(256, 255, dtype=np.uint8)
+for _code, _base in enumerate(NUCLEOTIDES):
+    _ENCODE[ord(_base)] = _code
+    _ENCODE[ord(_base.lower())] = _code
+
+# Electron-ion interaction pseudopotential of each nucleotide (used by PseEIIP)
+_EIIP = np.array([0.1260, 0.1340, 0.0806, 0.1335])
+
+# Standard genetic code in ACGT codon order (AAA, AAC, AAG, AAT, ACA, ...) - '*' marks the stop codons. Used to group synonymous codons for CodonFraction.
+_GENETIC_CODE = "KNKNTTTTRSRSIIMIQHQHPPPPRRRRLLLLEDEDAAAAGGGGVVVV*Y*YSSSS*CWCLFLF"
+
+# Default parameters of the ftrCOOL calls made in ftrCool_feature_extraction.R
+KMER_K = 3
+CKSNUC_GAPS = 3
+MISMATCH_K = 3
+MISMATCH_M = 2
+EXPECTED_VAL_K = 2
+NUC_K_PARTS = 5
+
+# High-order k-mer spectra (eg. 5-mers and 6-mers, --sparse-kmers) are kept as sparse matrices - column names end with '_SparseKmer<k>'
+SPARSE_KMER_FAMILY = "SparseKmer"
+_SPARSE_KMER_COLUMN = re.compile(rf"^([ACGT]+)_{SPARSE_KMER_FAMILY}(\d+)$")
+
+# Features of the first-stage model of the cascade (--cascade): seq_length, the 3-mer composition and the dense 4-mer spectrum.
+# They come from a single native pass over the sequences, so the first stage costs a small fraction of the full feature set.
+FIRST_STAGE_FAMILIES = ["KNUComposition_DNA"]
+FIRST_STAGE_KMER_K = 4
+
+# Columns of a feature-extracted dataset that identify a row rather than describe it (seq_length is a feature).
+# row_index is the 1-based position of the row in the preprocessed dataset; sequence_content is only present when it was asked for (--with-sequences).
+ROW_KEY_COLUMNS = ["row_index", "Sequence_ID", "sequence_content"]
+
+# Sequences of the start-up parity check against ftrCOOL: fixed random sequences of a spread of lengths (none so short that a family leaves it out)
+PARITY_LENGTHS = [60, 97, 150, 233, 301, 412, 555, 1000]
+PARITY_SEED = 20240501
+
+# Number of nucleotides encoded at once. Keeps the per-batch index arrays at a few hundred MB even for very large datasets.
+BATCH_NT = 1 << 24
+
+
+
+def main___python_feature_extraction(preprocessed_dataset, output_path, r_script, extra_r_args=(), families=None, workers=1, with_sequences=False):
+    """
+    Python backend for STEP 3 - writes the same ftrCool_extracted_*.csv the R script would write for 'preprocessed_dataset'.
+    Native families are computed here; any requested R-only family is computed by running 'r_script' with --families.
+    """
+    print("\n")
+    print("\n")
+    print("-----------------------------------------------------------------------------------------------")
+    print("STEP 3: Extract features from each sequence within the dataset (python feature backend).")
+    print("-----------------------------------------------------------------------------------------------")
+
+    families = list(FEATURE_FAMILIES) if families is None else [f for f in FEATURE_FAMILIES if f in families]
+    native_families = [f for f in families if f not in R_ONLY_FAMILIES]
+    r_families = [f for f in families if f in R_ONLY_FAMILIES]
+
+    # The native families must reproduce ftrCOOL before the python backend is used
+    if native_families:
+        print(f"Checking {len(native_families)} native feature families against ftrCOOL")
+        failures = native_parity_failures(r_script, native_families, extra_r_args)
+        if failures:
+            for family, reason in failures.items():
+                print(f"ERROR: {family} does not match ftrCOOL: {reason}")
+            print("ERROR: the python feature backend does not reproduce ftrCOOL for these families - use --feature-backend r.")
+            sys.exit(1)
+
+    # One feature row per preprocessed row (duplicated sequences are not merged), keyed by row_index like the R script.
+    # The sequences come from the packed store saved next to the dataset (the feature batches are decoded from it), so the sequence_content column is not read.
+    data = read_table(preprocessed_dataset, columns=lambda c: c != "sequence_content")
+    store = dataset_store(preprocessed_dataset)
+    if len(store) != len(data):
+        raise ValueError(f"The sequence store of {preprocessed_dataset} does not line up with its rows.")
+
+    print(f"Computing {len(native_families)} feature families natively for {len(store)} sequences")
+    native_df = extract_features(store, native_families)
+
+    r_df = None
+    if r_families:
+        print(f"Delegating {len(r_families)} feature families to R: {', '.join(r_families)}")
+        r_df = run_r_families(preprocessed_dataset, r_script, r_families, extra_r_args, workers)
+        if r_df["row_index"].tolist() != list(range(1, len(data) + 1)):
+            raise ValueError("Rows returned by ftrCool_feature_extraction.R do not line up with the python feature rows.")
+
+    # Put the family blocks back together in the same order as the R cbind
+    blocks = [family_columns(r_df if family in R_ONLY_FAMILIES else native_df, family) for family in families]
+
+    combined_df = assemble_extracted_dataset(data, blocks, with_sequences, store)
+    write_table(combined_df, output_path)
+    print(f"\nFeature-extracted dataset saved to: {output_path}")
+
+
+def families_for_columns(columns):
+    """
+    Returns the feature families (in R cbind order) that are needed to produce 'columns' - eg. the features kept by a trained feature selector.
+    Columns that do not belong to a family (such as seq_length) are ignored.
+    """
+    return [f for f in FEATURE_FAMILIES if any(str(c).endswith(f"_{f}") for c in columns)]
+
+
+def family_columns(df, family):
+    # The block of columns that belongs to one feature family (every column name ends with '_<family>')
+    return df.loc[:, [c for c in df.columns if c.endswith(f"_{family}")]]
+
+
+def assemble_extracted_dataset(data, blocks, with_sequences=False, store=None):
+    """
+    Builds the same layout ftrCool_extracted_*.csv has in the R script from the preprocessed rows (keeping their original index) and the feature blocks:
+    row_index, Sequence_ID, [sequence_content], seq_length, <features>, [TE_Order - labelled (training) data only]
+    The sequences are taken from 'store' (one per row of 'data') if given, otherwise from the sequence_content column of 'data'.
+    """
+    row_columns = pd.DataFrame({"row_index": np.asarray(data.index) + 1})
+    if "Sequence_ID" in data.columns:
+        row_columns["Sequence_ID"] = data["Sequence_ID"].astype(str).to_numpy()
+    if store is None:
+        sequence_content = data["sequence_content"].astype(str).reset_index(drop=True)
+        if with_sequences:
+            row_columns["sequence_content"] = sequence_content
+        row_columns["seq_length"] = sequence_content.str.len()
+    else:
+        if with_sequences:
+            row_columns["sequence_content"] = list(store)
+        row_columns["seq_length"] = store.lengths
+
+    blocks = [b.reset_index(drop=True) for b in blocks]
+    labelled = "TE_Order" in data.columns
+    return pd.concat([row_columns] + blocks + ([data[["TE_Order"]].reset_index(drop=True)] if labelled else []), axis=1)
+
+
+def row_sequences(extracted, preprocessed_dataset):
+    """
+    The sequences of every row of a feature-extracted dataset, as a PackedSequences store - packed from the dataset itself if it was written with the sequences,
+    otherwise taken by row_index from the store of the preprocessed dataset.
+    """
+    if "sequence_content" in extracted.columns:
+        return PackedSequences.from_strings(extracted["sequence_content"].astype(str))
+    return dataset_store(preprocessed_dataset).subset(extracted["row_index"].to_numpy() - 1)
+
+
+def run_feature_backend(backend, preprocessed_dataset, output_path, r_script, extra_r_args=(), families=None, workers=1, with_sequences=False):
+    """
+    Runs STEP 3 with the chosen backend ('r' or 'python') and writes the feature-extracted dataset to 'output_path'.
+    If 'families' is given, only those feature families are computed. With workers > 1 the R script runs on concurrent row shards.
+    The sequence_content column is only written if 'with_sequences' is set.
+    """
+    if families is not None and not families:
+        # No feature family is needed (eg. a model that only uses seq_length and sparse k-mers) - the rows are written without running either backend
+        data = read_table(preprocessed_dataset, columns=lambda c: c != "sequence_content")
+        write_table(assemble_extracted_dataset(data, [], with_sequences, dataset_store(preprocessed_dataset)), output_path)
+        print(f"\nNo feature families needed - dataset saved to: {output_path}")
+    elif backend == "python":
+        main___python_feature_extraction(preprocessed_dataset, output_path, r_script, extra_r_args, families, workers, with_sequences)
+    else:
+        r_flags = [] if families is None else [f"--families={','.join(families)}"]
+        if with_sequences:
+            r_flags.append("--with-sequences")
+        run_r_sharded(preprocessed_dataset, output_path, r_script, workers, extra_r_args, r_flags)
+
+
+def backend_record_path(scaler_pkl):
+    # FEATURE_BACKEND_<dataset>.json, next to SCALER_<dataset>.pkl
+    directory, name = os.path.split(str(scaler_pkl))
+    return os.path.join(directory, BACKEND_RECORD_PREFIX + re.sub(r"^SCALER_", "", os.path.splitext(name)[0]) + ".json")
+
+
+def save_backend_record(scaler_pkl, backend):
+    with open(backend_record_path(scaler_pkl), "w") as record_file:
+        json.dump({"backend": backend, "engine_version": ENGINE_VERSION}, record_file, indent=1)
+
+
+def backend_mismatch(scaler_pkl, backend):
+    """
+    Returns why features extracted with 'backend' now would differ from the ones the model of 'scaler_pkl' was trained on - None if they are the same.
+    Models trained before the backend was recorded were trained on R features.
+    """
+    try:
+        with open(backend_record_path(scaler_pkl), "r") as record_file:
+            record = json.load(record_file)
+    except FileNotFoundError:
+        record = {"backend": "r", "engine_version": None}
+    if record["backend"] != backend:
+        return f"the model was trained on features of the '{record['backend']}' backend, not '{backend}'"
+    if backend == "python" and record["engine_version"] != ENGINE_VERSION:
+        return f"the model was trained on version {record['engine_version']} of the python feature families, this is version {ENGINE_VERSION}"
+    return None
+
+
+def family_tag(backend, family, r_script):
+    # Identifies which extractor produced a family's values - R-only families always come from ftrCOOL (named by its package and parameters version), even with the python backend
+    return ftrcool_version(str(r_script)) if backend == "r" or family in R_ONLY_FAMILIES else f"python-{ENGINE_VERSION}"
+
+
+@functools.lru_cache(maxsize=None)
+def ftrcool_version(r_script):
+    # 'ftrCOOL-<package version>-params<FEATURE_PARAMETERS_VERSION>', as printed by 'r_script --version' (asked once per run)
+    result = subprocess.run(["Rscript", r_script, "--version"], check=True, capture_output=True, text=True)
+    return result.stdout.strip().splitlines()[-1].strip()
+
+
+def run_r_families(preprocessed_dataset, r_script, r_families, extra_r_args=(), workers=1):
+    """
+    Runs ftrCool_feature_extraction.R for only 'r_families' and returns its output as a DataFrame.
+    R hands its output back in the same exchange format (Feather or CSV) as the preprocessed dataset.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        r_output = os.path.join(tmp_dir, "ftrCool_extracted_R_families" + (".feather" if is_feather(preprocessed_dataset) else ".csv"))
+        run_r_sharded(preprocessed_dataset, r_output, r_script, workers, extra_r_args, [f"--families={','.join(r_families)}"])
+        return read_table(r_output)
+
+
+def extract_features(sequences, families=None):
+    """
+    Computes the native feature families for a list of (uppercase, imputed) sequences, or a PackedSequences store of them.
+    Returns a DataFrame with one row per sequence and ftrCOOL-style '<feature>_<family>' column names.
+    """
+    families = [f for f in (FEATURE_FAMILIES if families is None else families) if f not in R_ONLY_FAMILIES]
+    unknown = [f for f in families if f not in NATIVE_FAMILIES]
+    if unknown:
+        raise ValueError(f"Unknown feature families: {unknown}")
+
+    columns = []
+    for family in families:
+        columns.extend(f"{name}_{family}" for name in NATIVE_FAMILIES[family][0]())
+
+    blocks = []
+    for seq_batch in _sequence_batches(sequences):
+        blocks.append(np.hstack([NATIVE_FAMILIES[f][1](seq_batch) for f in families]) if families else np.empty((seq_batch.n, 0)))
+
+    matrix = np.vstack(blocks) if blocks else np.empty((0, len(columns)))
+    return pd.DataFrame(matrix, columns=columns)
+
+
+def _sequence_batches(sequences):
+    # Yield SequenceBatch objects of roughly BATCH_NT nucleotides - packed stores are decoded straight to 2-bit codes, strings are encoded batch by batch
+    if isinstance(sequences, PackedSequences):
+        for start, stop in sequences.batch_ranges(BATCH_NT):
+            yield SequenceBatch.from_codes(sequences.codes(start, stop), sequences.lengths[start:stop])
+    else:
+        for batch in _batches(sequences):
+            yield SequenceBatch(batch)
+
+
+def _batches(sequences):
+    # Yield consecutive slices of the sequence list holding roughly BATCH_NT nucleotides each
+    start, total = 0, 0
+    for i, seq in enumerate(sequences):
+        total += len(seq)
+        if total >= BATCH_NT:
+            yield sequences[start:i + 1]
+            start, total = i + 1, 0
+    if start < len(sequences):
+        yield sequences[start:]
+
+
+
+class SequenceBatch:
+    """
+    A batch of sequences encoded as one concatenated 2-bit code array plus per-sequence offsets.
+    Window counts are memoized because several families reuse the same k-mer spectrum.
+    """
+
+    def __init__(self, sequences=None, codes=None, lengths=None):
+        if sequences is not None:
+            lengths = np.fromiter((len(s) for s in sequences), dtype=np.int64, count=len(sequences))
+            codes = _ENCODE[np.frombuffer("".join(sequences).encode("ascii"), dtype=np.uint8)]
+        self.n = len(lengths)
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.offsets = np.zeros(self.n + 1, dtype=np.int64)
+        np.cumsum(self.lengths, out=self.offsets[1:])
+        self.codes = codes
+        self.row_of = np.repeat(np.arange(self.n), self.lengths)             # Which sequence each position belongs to
+        self.pos_in_row = np.arange(len(self.codes)) - self.offsets[self.row_of] # Position of each nucleotide within its own sequence
+        self._cache = {}
+
+    @classmethod
+    def from_codes(cls, codes, lengths):
+        # Batch from already 2-bit encoded sequences (eg. decoded from a PackedSequences store - 255 marks a masked base)
+        return cls(codes=codes, lengths=lengths)
+
+    def window_counts(self, rel, phase=None):
+        """
+        Counts the nucleotide words read at relative positions 'rel' (eg. (0, 1, 2) for 3-mers, (0, 3) for pairs with a gap of 2) in every sequence.
+        Only windows that stay inside one sequence are counted. If 'phase' is given, only windows starting at positions where pos % 3 == phase are counted.
+        Returns an (n, 4 ** len(rel)) integer matrix with columns in ACGT word order.
+        """
+        key = (tuple(rel), phase)
+        if key in self._cache:
+            return self._cache[key]
+
+        n_cols = 4 ** len(rel)
+        rows, words = self.window_words(rel, phase)
+        counts = np.bincount(rows * n_cols + words, minlength=self.n * n_cols).reshape(self.n, n_cols)
+        self._cache[key] = counts
+        return counts
+
+    def window_words(self, rel, phase=None):
+        """
+        Returns (rows, words) for every valid window: the sequence each window belongs to, and the word it reads as an integer in ACGT order.
+        """
+        span = rel[-1] + 1
+        n_starts = max(len(self.codes) - span + 1, 0)
+
+        value = np.zeros(n_starts, dtype=np.int64)
+        valid = self.pos_in_row[:n_starts] + span <= self.lengths[self.row_of[:n_starts]]
+        for r in rel:
+            c = self.codes[r:r + n_starts]
+            valid &= c != 255
+            value = value * 4 + c
+        if phase is not None:
+            valid &= self.pos_in_row[:n_starts] % 3 == phase
+
+        return self.row_of[:n_starts][valid], value[valid]
+
+    def kmer_counts(self, k, phase=None):
+        return self.window_counts(tuple(range(k)), phase)
+
+
+
+def sparse_kmer_frequencies(sequences, k):
+    """
+    Normalized k-mer frequencies of every sequence (same values as kNUComposition_DNA with rng = k) as an (n, 4 ** k) scipy CSR matrix in name_kmers(k) column order.
+    Only the k-mers a sequence actually contains are stored, so memory follows the number of non-zero k-mers instead of n * 4 ** k.
+    Sequences shorter than k get an all-zero row.
+    """
+    blocks = []
+    for seq_batch in _sequence_batches(sequences):
+        rows, words = seq_batch.window_words(tuple(range(k)))
+        counts = sparse.csr_matrix((np.ones(len(rows)), (rows, words)), shape=(seq_batch.n, 4 ** k)) # Repeated (row, word) pairs are summed into counts
+        totals = np.asarray(counts.sum(axis=1)).ravel()
+        blocks.append(sparse.diags(np.divide(1.0, totals, out=np.zeros(len(totals)), where=totals > 0)) @ counts)
+    return sparse.vstack(blocks, format="csr") if blocks else sparse.csr_matrix((0, 4 ** k))
+
+
+def sparse_kmer_names(k):
+    return [f"{kmer}_{SPARSE_KMER_FAMILY}{k}" for kmer in name_kmers(k)]
+
+
+def is_sparse_kmer_column(column):
+    return _SPARSE_KMER_COLUMN.match(str(column)) is not None
+
+
+def sparse_kmer_columns(sequences, columns):
+    """
+    Computes only the given sparse k-mer 'columns' (eg. the ones kept when the model was trained) for 'sequences', as a dense DataFrame in the order given.
+    """
+    parsed = [_SPARSE_KMER_COLUMN.match(str(c)) for c in columns]
+    values = {}
+    for k in sorted({int(m.group(2)) for m in parsed}):
+        kmer_index = {kmer: i for i, kmer in enumerate(name_kmers(k))}
+        wanted = [m for m in parsed if int(m.group(2)) == k]
+        block = sparse_kmer_frequencies(sequences, k)[:, [kmer_index[m.group(1)] for m in wanted]].toarray()
+        values.update({m.group(0): block[:, i] for i, m in enumerate(wanted)})
+    return pd.DataFrame({str(c): values[str(c)] for c in columns}, index=range(len(sequences)))
+
+
+def first_stage_features(sequences):
+    """
+    Computes the cheap features of the first-stage (cascade) model for a list of sequences, or a PackedSequences store of them.
+    Training and classification both call this, so the columns always line up.
+    """
+    lengths = sequences.lengths if isinstance(sequences, PackedSequences) else [len(s) for s in sequences]
+    kmers = sparse_kmer_frequencies(sequences, FIRST_STAGE_KMER_K).toarray()
+    return pd.concat([
+        pd.DataFrame({"seq_length": np.asarray(lengths, dtype=float)}),
+        extract_features(sequences, FIRST_STAGE_FAMILIES),
+        pd.DataFrame(kmers, columns=sparse_kmer_names(FIRST_STAGE_KMER_K)),
+    ], axis=1)
+
+
+def name_kmers(k):
+    # Same ordering as ftrCOOL's nameKmer(k, type="dna"): AA..A, AA..C, ..., TT..T
+    names = [""]
+    for _ in range(k):
+        names = [n + b for n in names for b in NUCLEOTIDES]
+    return names
+
+
+def _frequencies(counts):
+    # Row-normalize a count matrix; rows without any valid window become NaN (and are dropped after extraction, like R's NaN rows)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return counts / counts.sum(axis=1, keepdims=True)
+
+
+def _zcurve(freqs):
+    # freqs has the 4 nucleotide frequencies (ACGT) on its last axis - returns the x, y, z components of the Z-curve on the last axis
+    a, c, g, t = freqs[..., 0], freqs[..., 1], freqs[..., 2], freqs[..., 3]
+    return np.stack([(a + g) - (c + t), (a + c) - (g + t), (a + t) - (g + c)], axis=-1)
+
+
+# ----------------------------------------------- Native feature families -----------------------------------------------
+
+def knu_composition(batch):
+    # kNUComposition_DNA(rng = 3): normalized 3-mer frequencies
+    return _frequencies(batch.kmer_counts(KMER_K))
+
+
+def cksnuc_pair(batch):
+    # CkSNUCpair_DNA(rng = 3, upto = TRUE): normalized frequencies of nucleotide pairs separated by 0..3 nucleotides
+    return np.hstack([_frequencies(batch.window_counts((0, gap + 1))) for gap in range(CKSNUC_GAPS + 1)])
+
+
+def asdc(batch):
+    # ASDC_DNA: pair counts summed over every possible gap. For each position j, the pairs (x, s_j) with x anywhere before j are the prefix counts of x,
+    # so the full O(L^2) pair count collapses to one cumulative sum per nucleotide.
+    one_hot = np.zeros((len(batch.codes), 4), dtype=np.int64)
+    ok = batch.codes != 255
+    one_hot[np.flatnonzero(ok), batch.codes[ok]] = 1
+    running = np.cumsum(one_hot, axis=0)
+    row_start = batch.offsets[batch.row_of]
+    prefix = running - one_hot - running[row_start - 1] * (row_start > 0)[:, None] # Counts of each nucleotide strictly before each position, within its own sequence
+
+    counts = np.zeros((batch.n, 16), dtype=np.int64)
+    for y in range(4):
+        at_y = batch.codes == y
+        np.add.at(counts, (batch.row_of[at_y], slice(y, 16, 4)), prefix[at_y])
+    return _frequencies(counts)
+
+
+def codon_usage(batch):
+    # CodonUsage_DNA: frequencies of the non-overlapping codons read from the first nucleotide
+    return _frequencies(batch.kmer_counts(3, phase=0))
+
+
+def expected_val_kmer(batch):
+    # ExpectedValKmerNUC_DNA(k = 2): observed dinucleotide frequency divided by the frequency expected from its single nucleotides
+    mono = _frequencies(batch.kmer_counts(1))
+    di = _frequencies(batch.kmer_counts(EXPECTED_VAL_K))
+    expected = np.einsum("ni,nj->nij", mono, mono).reshape(batch.n, 16)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return di / expected
+
+
+def mismatch(batch):
+    # Mismatch_DNA(k = 3, m = 2): for every 3-mer, the number of 3-mers in the sequence that differ from it in at most 2 positions
+    names = name_kmers(MISMATCH_K)
+    within = np.array([[sum(a != b for a, b in zip(x, y)) <= MISMATCH_M for y in names] for x in names], dtype=np.int64)
+    return batch.kmer_counts(MISMATCH_K) @ within
+
+
+def codon_fraction(batch):
+    # CodonFraction: each codon's count divided by the total count of the codons that encode the same amino acid
+    counts = batch.kmer_counts(3, phase=0).astype(float)
+    code = np.array(list(_GENETIC_CODE))
+    totals = np.zeros_like(counts)
+    for aa in set(_GENETIC_CODE):
+        members = code == aa
+        totals[:, members] = counts[:, members].sum(axis=1, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(totals > 0, counts / totals, 0.0)
+
+
+def _mmi_names():
+    pairs = [a + b for i, a in enumerate(NUCLEOTIDES) for b in NUCLEOTIDES[i:]]
+    triples = [a + b + c for i, a in enumerate(NUCLEOTIDES) for j, b in enumerate(NUCLEOTIDES[i:], i) for c in NUCLEOTIDES[j:]]
+    return pairs + triples
+
+
+def mmi(batch):
+    # MMI_DNA: multivariate mutual information of the 10 unordered dinucleotides and 20 unordered trinucleotides
+    mono = _frequencies(batch.kmer_counts(1))
+    di = _frequencies(batch.kmer_counts(2)).reshape(batch.n, 4, 4)
+    tri = _frequencies(batch.kmer_counts(3)).reshape(batch.n, 4, 4, 4)
+
+    # Unordered word frequencies - the frequency of a word is shared by all of its permutations
+    di_u = di + np.swapaxes(di, 1, 2) - np.einsum("nii->ni", di)[:, :, None] * np.eye(4)
+    tri_u = sum(np.transpose(tri, (0,) + p) for p in {(1, 2, 3), (1, 3, 2), (2, 1, 3), (2, 3, 1), (3, 1, 2), (3, 2, 1)})
+
+    def plogp_ratio(p, q):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where((p > 0) & (q > 0), p * np.log(p / q), 0.0)
+
+    columns = []
+    for name in _mmi_names():
+        idx = [NUCLEOTIDES.index(b) for b in name]
+        if len(idx) == 2:
+            x, y = idx
+            columns.append(plogp_ratio(di_u[:, x, y], mono[:, x] * mono[:, y]))
+        else:
+            x, y, z = idx
+            # I(x,y,z) = I(x,y) - I(x,y|z), with I(x,y|z) = H(x|z) - H(x|y,z)
+            i_xy = plogp_ratio(di_u[:, x, y], mono[:, x] * mono[:, y])
+            with np.errstate(divide="ignore", invalid="ignore"):
+                h_x_z = -plogp_ratio(di_u[:, x, z], mono[:, z])
+                h_x_yz = -plogp_ratio(tri_u[:, x, y, z], di_u[:, y, z])
+            columns.append(i_xy - (h_x_z - h_x_yz))
+    return np.column_stack(columns)
+
+
+def pse_eiip(batch):
+    # PseEIIP: trinucleotide frequency weighted by the summed EIIP value of its three nucleotides
+    eiip = np.array([_EIIP[[NUCLEOTIDES.index(b) for b in name]].sum() for name in name_kmers(3)])
+    return _frequencies(batch.kmer_counts(3)) * eiip
+
+
+def nuc_kpart_composition(batch):
+    # NUCKpartComposition_DNA(k = 5): nucleotide composition of each of 5 equal-length parts of the sequence
+    part_len = batch.lengths // NUC_K_PARTS
+    part = np.minimum(batch.pos_in_row // np.maximum(part_len[batch.row_of], 1), NUC_K_PARTS - 1)
+    ok = (batch.codes != 255) & (batch.pos_in_row < part_len[batch.row_of] * NUC_K_PARTS)
+    counts = np.bincount(
+        (batch.row_of[ok] * NUC_K_PARTS + part[ok]) * 4 + batch.codes[ok],
+        minlength=batch.n * NUC_K_PARTS * 4
+    ).reshape(batch.n, NUC_K_PARTS, 4)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (counts / counts.sum(axis=2, keepdims=True)).reshape(batch.n, -1)
+
+
+def _zcurve_family(batch, k, phased):
+    # Z-curve of the nucleotide that follows every (k-1)-nucleotide prefix, either over the whole sequence or separately for each codon phase
+    phases = (0, 1, 2) if phased else (None,)
+    blocks = []
+    for phase in phases:
+        counts = batch.kmer_counts(k, phase=phase).reshape(batch.n, 4 ** (k - 1), 4)
+        freqs = _frequencies(counts.reshape(batch.n, -1)).reshape(counts.shape)
+        blocks.append(_zcurve(freqs).reshape(batch.n, -1))
+    return np.hstack(blocks)
+
+
+def _zcurve_names(k, phased):
+    prefixes = name_kmers(k - 1) if k > 1 else [""]
+    names = [f"{p}_{axis}" if p else axis for p in prefixes for axis in "xyz"]
+    return [f"Pos{phase}_{n}" for phase in (1, 2, 3) for n in names] if phased else names
+
+
+# name -> (column name generator, feature function)
+NATIVE_FAMILIES = {
+    "KNUComposition_DNA":      (lambda: name_kmers(KMER_K), knu_composition),
+    "CkSNUCpair_DNA":          (lambda: [f"{p[0]}{'x' * gap}{p[1]}" for gap in range(CKSNUC_GAPS + 1) for p in name_kmers(2)], cksnuc_pair),
+    "ASDC_DNA":                (lambda: name_kmers(2), asdc),
+    "CodonUsage_DNA":          (lambda: name_kmers(3), codon_usage),
+    "ExpectedValKmerNUC_DNA":  (lambda: name_kmers(EXPECTED_VAL_K), expected_val_kmer),
+    "Mismatch_DNA":            (lambda: name_kmers(MISMATCH_K), mismatch),
+    "CodonFraction":           (lambda: name_kmers(3), codon_fraction),
+    "MMI_DNA":                 (_mmi_names, mmi),
+    "PseEIIP":                 (lambda: name_kmers(3), pse_eiip),
+    "NUCKpartComposition_DNA": (lambda: [f"p{part}_{b}" for part in range(1, NUC_K_PARTS + 1) for b in NUCLEOTIDES], nuc_kpart_composition),
+    "Zcurve36bit_DNA":         (lambda: _zcurve_names(2, True), lambda b: _zcurve_family(b, 2, True)),
+    "Zcurve144bit_DNA":        (lambda: _zcurve_names(3, True), lambda b: _zcurve_family(b, 3, True)),
+    "Zcurve12bit_DNA":         (lambda: _zcurve_names(2, False), lambda b: _zcurve_family(b, 2, False)),
+    "Zcurve48bit_DNA":         (lambda: _zcurve_names(3, False), lambda b: _zcurve_family(b, 3, False)),
+    "Zcurve9bit_DNA":          (lambda: _zcurve_names(1, True), lambda b: _zcurve_family(b, 1, True)),
+}
+
+
+
+def parity_sequences():
+    # The fixed sequences of the start-up parity check (the same on every run)
+    rng = np.random.default_rng(PARITY_SEED)
+    return ["".join(rng.choice(list(NUCLEOTIDES), length)) for length in PARITY_LENGTHS]
+
+
+def native_family_mismatches(sequences, r_features, families, rtol=1e-6, atol=1e-9):
+    """
+    Compares the native 'families' computed here for 'sequences' with the features ftrCool_feature_extraction.R wrote for them ('r_features', rows keyed by row_index).
+    Returns {family: reason} for every family whose column names or values differ - empty if they all agree.
+    """
+    python_features = extract_features(sequences, families)
+    rows = r_features["row_index"].to_numpy() - 1
+    mismatches = {}
+    for family in families:
+        r_block, python_block = family_columns(r_features, family), family_columns(python_features, family)
+        if list(python_block.columns) != list(r_block.columns):
+            mismatches[family] = f"columns differ (R: {list(r_block.columns)[:4]}..., python: {list(python_block.columns)[:4]}...)"
+        elif not np.allclose(python_block.iloc[rows].to_numpy(float), r_block.to_numpy(float), rtol=rtol, atol=atol, equal_nan=True):
+            mismatches[family] = "values differ"
+    return mismatches
+
+
+def native_parity_failures(r_script, families=None, extra_r_args=()):
+    """
+    Runs 'r_script' on the parity sequences for the native 'families' (all of them by default) and compares its output with the python backend's.
+    Returns {family: reason} for every family that does not reproduce ftrCOOL.
+    """
+    families = [f for f in (FEATURE_FAMILIES if families is None else families) if f in NATIVE_FAMILIES]
+    sequences = parity_sequences()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        parity_csv = os.path.join(tmp_dir, "PREPROCESSED_parity.csv")
+        r_output = os.path.join(tmp_dir, "ftrCool_extracted_parity.csv")
+        pd.DataFrame({"Sequence_ID": [f"parity_{i}" for i in range(len(sequences))], "sequence_content": sequences}).to_csv(parity_csv, index=False)
+        run_r_sharded(parity_csv, r_output, r_script, 1, extra_r_args, [f"--families={','.join(families)}"])
+        return native_family_mismatches(sequences, read_table(r_output), families)
+
+
+def parity_check(r_csv, python_csv, rtol=1e-6, atol=1e-9):
+    """
+    Compares a feature CSV written by ftrCool_feature_extraction.R with one written by the python backend, column for column.
+    Prints every mismatching column and returns True only if the column sets, column order, rows and values all agree.
+    """
+    r_df = read_table(r_csv)
+    py_df = read_table(python_csv)
+    ok = True
+
+    if list(r_df.columns) != list(py_df.columns):
+        ok = False
+        print("Column sets differ:")
+        print("  only in R:     ", [c for c in r_df.columns if c not in py_df.columns])
+        print("  only in python:", [c for c in py_df.columns if c not in r_df.columns])
+
+    if len(r_df) != len(py_df) or r_df["row_index"].tolist() != py_df["row_index"].tolist():
+        print("Row order differs between the two files - compare the same preprocessed dataset.")
+        return False
+
+    for column in [c for c in r_df.columns if c in py_df.columns]:
+        r_col, py_col = r_df[column], py_df[column]
+        if pd.api.types.is_numeric_dtype(r_col) and pd.api.types.is_numeric_dtype(py_col):
+            same = np.allclose(r_col.to_numpy(float), py_col.to_numpy(float), rtol=rtol, atol=atol, equal_nan=True)
+        else:
+            same = r_col.astype(str).tolist() == py_col.astype(str).tolist()
+        if not same:
+            ok = False
+            print(f"Values differ in column: {column}")
+
+    print("PARITY OK" if ok else "PARITY FAILED")
+    return ok
+
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python _feature_engine.py <ftrCool_extracted_R.csv> <ftrCool_extracted_python.csv>")
+        sys.exit(1)
+    sys.exit(0 if parity_check(sys.argv[1], sys.argv[2]) else 1)
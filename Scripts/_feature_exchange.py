@@ -0,0 +1,85 @@
+# FUNCTIONALITY: This script is used by the training and classification pipelines to hand datasets to and from 'ftrCool_feature_extraction.R' (--exchange-format <auto|feather|csv>).
+               # With Feather (Arrow IPC), the preprocessed dataset and the feature-extracted dataset are written as binary columnar files, so the hundreds of float feature columns
+               # are never converted to text by R's write.csv and parsed back by pandas. The file extension decides the format - '.feather' is Feather, anything else is CSV.
+               # With 'auto', CSV is kept as the fallback whenever pyarrow (python) or arrow (R) is not installed - an explicit 'feather' stops with an error instead (setup.sh installs both).
+
+
+
+import sys
+import importlib.util
+import subprocess
+from pathlib import Path
+import pandas as pd
+
+
+
+EXCHANGE_FORMATS = ["auto", "feather", "csv"]
+FEATHER_SUFFIX = ".feather"
+
+
+
+def resolve_exchange_format(requested):
+    """
+    Returns the exchange format to use ('feather' or 'csv') for the requested --exchange-format.
+    'auto' uses Feather when every side of the hand-off can read it, and falls back to CSV otherwise. 'feather' exits with an error if either side cannot.
+    """
+    if requested == "csv":
+        return "csv"
+
+    missing = []
+    if importlib.util.find_spec("pyarrow") is None:
+        missing.append("python package 'pyarrow'")
+    if not r_has_arrow():
+        missing.append("R package 'arrow'")
+
+    if missing and requested == "feather":
+        print(f"\nError: --exchange-format feather was requested, but Feather exchange is not available ({' and '.join(missing)} not installed). "
+              "Install it (setup.sh does), or use --exchange-format auto or csv.")
+        sys.exit(1)
+    if missing:
+        print(f"\nFeather exchange is not available ({' and '.join(missing)} not installed) - falling back to CSV.")
+        return "csv"
+    return "feather"
+
+
+def r_has_arrow():
+    # True if Rscript is on the PATH and can load the 'arrow' package
+    try:
+        check = subprocess.run(
+            ["Rscript", "-e", "quit(status = if (requireNamespace('arrow', quietly = TRUE)) 0 else 1)"],
+            capture_output=True
+        )
+    except FileNotFoundError:
+        return False
+    return check.returncode == 0
+
+
+def exchange_path(csv_path, exchange_format):
+    # The path a dataset named 'csv_path' is exchanged under - itself for CSV, the same name with a .feather extension for Feather (keeps str / Path as given)
+    if exchange_format != "feather":
+        return csv_path
+    new_path = Path(csv_path).with_suffix(FEATHER_SUFFIX)
+    return new_path if isinstance(csv_path, Path) else str(new_path)
+
+
+def is_feather(path):
+    return Path(path).suffix.lower() == FEATHER_SUFFIX
+
+
+def read_table(path, columns=None):
+    # Reads a dataset written by either side of the hand-off, in the format given by its extension - with 'columns' (a callable), only the columns it keeps
+    if not is_feather(path):
+        return pd.read_csv(path, usecols=columns)
+    if columns is not None:
+        import pyarrow
+        with pyarrow.memory_map(str(path)) as source:
+            columns = [c for c in pyarrow.ipc.open_file(source).schema.names if columns(c)]
+    return pd.read_feather(path, columns=columns)
+
+
+def write_table(df, path):
+    # Writes 'df' in the format given by the extension of 'path' (Feather needs a default index, so the index is always dropped)
+    if is_feather(path):
+        df.reset_index(drop=True).to_feather(path)
+    else:
+        df.to_csv(path, index=False)
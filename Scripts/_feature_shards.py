@@ -0,0 +1,77 @@
+# FUNCTIONALITY: This script is called through 'Scripts/_feature_engine.py' when more than one feature worker is requested (--feature-workers <int>).
+               # ftrCool_feature_extraction.R is single-threaded, so instead of one R process over the whole preprocessed dataset, the dataset is split into length-balanced
+               # shards, several R workers run concurrently (one per shard, at most 'workers' at a time), and their ftrCool_extracted_*.csv outputs are concatenated back in the original row order.
+               # Shards are handed to R in the exchange format of the input (Feather or CSV), and read back in the format of the output.
+
+
+
+import os
+import heapq
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from _feature_exchange import read_table, write_table
+
+
+
+def run_r_sharded(preprocessed_dataset, output_path, r_script, workers, extra_r_args=(), r_flags=()):
+    """
+    Runs 'r_script' over 'preprocessed_dataset' in 'workers' concurrent shards and writes the combined output to 'output_path'.
+    The combined file has the same rows, row order and columns as a single R run over the whole dataset.
+    """
+    single_run = ["Rscript", str(r_script), str(preprocessed_dataset), *extra_r_args, *r_flags, f"--output={output_path}"]
+    if workers <= 1:
+        subprocess.run(single_run, check=True)
+        return
+
+    data = read_table(preprocessed_dataset)
+
+    if len(data) <= 1:
+        subprocess.run(single_run, check=True)
+        return
+
+    shards = length_balanced_shards(data["sequence_content"].astype(str).str.len().tolist(), workers)
+    print(f"Running ftrCool_feature_extraction.R on {len(shards)} shards with up to {workers} concurrent workers")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        jobs = []
+        for i, rows in enumerate(shards):
+            shard_csv = os.path.join(tmp_dir, f"shard_{i}_{os.path.basename(str(preprocessed_dataset))}")
+            shard_out = os.path.join(tmp_dir, f"ftrCool_extracted_shard_{i}{Path(output_path).suffix or '.csv'}")
+            write_table(data.iloc[rows], shard_csv)
+            jobs.append((shard_csv, shard_out))
+
+        def run_shard(job):
+            (shard_csv, shard_out), rows = job
+            subprocess.run(["Rscript", str(r_script), shard_csv, *extra_r_args, *r_flags, f"--output={shard_out}"], check=True)
+            shard_df = read_table(shard_out)
+            # row_index is the position within the shard - map it back to the position within the whole input
+            shard_df["row_index"] = np.asarray(rows)[shard_df["row_index"].to_numpy() - 1] + 1
+            return shard_df
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            shard_outputs = list(pool.map(run_shard, zip(jobs, shards)))
+
+    # Concatenate and put the rows back in the order of the input
+    combined_df = pd.concat(shard_outputs, ignore_index=True).sort_values("row_index", kind="stable").reset_index(drop=True)
+
+    write_table(combined_df, output_path)
+    print(f"\nFeature-extracted dataset saved to: {output_path}")
+
+
+def length_balanced_shards(lengths, n_shards):
+    """
+    Greedily splits row indices into at most 'n_shards' shards with a similar total sequence length (longest sequences first, each to the lightest shard).
+    Rows keep their original relative order inside each shard.
+    """
+    n_shards = max(1, min(n_shards, len(lengths)))
+    heap = [(0, i) for i in range(n_shards)]
+    shards = [[] for _ in range(n_shards)]
+    for row in sorted(range(len(lengths)), key=lambda r: lengths[r], reverse=True):
+        total, shard = heapq.heappop(heap)
+        shards[shard].append(row)
+        heapq.heappush(heap, (total + lengths[row], shard))
+    return [sorted(rows) for rows in shards if rows]
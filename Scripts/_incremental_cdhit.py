@@ -0,0 +1,216 @@
+# FUNCTIONALITY: This script adds a new batch of prefixed TE sequences to an existing clustering, without clustering the genome's sequences again from scratch.
+               # It takes an existing FINAL_cdhit_'genome' FASTA (the representatives of the second cd-hit round) with its .clstr file, and a FASTA of new sequences whose headers
+               # are already prefixed with their tool (e.g., a COMBINED_TE_SEQUENCES file written by '_combine_fasta.py' for the new TE files).
+               # Every new sequence either joins the cluster of an existing representative, at the criteria of the second cd-hit round (80% identity over 80% of the sequence), or founds a new cluster.
+               # The representatives are indexed by their canonical spaced k-mers (the same sketch '_partition_cdhit.py' partitions the sequences with), and each new sequence is only aligned
+               # against the representatives it shares the most k-mers with - by one cd-hit-est-2d run on the candidate representatives and the new sequences.
+               # The sketch misses many short pairs near 80% identity, so every new sequence the first run leaves unassigned (no candidate, or none of its candidates is its match) is aligned
+               # by a second cd-hit-est-2d run against every representative at least as long as the shortest of them.
+               # The new sequences that join no representative are clustered among themselves by cd-hit-est, and their clusters are numbered after the existing ones.
+               # The existing clusters keep their numbers, members and representatives (a new sequence longer than a representative does not take its place, as cd-hit-est-2d only adds
+               # sequences of the second file to clusters of the first), so the output is the .clstr file cd-hit-est-2d + cd-hit-est would write, and it goes straight into 'format_data.py'.
+               # Name the output FINAL_cdhit_'name' (format_data.py takes the name of the results files from it) - the COLLAPSED_DUPLICATES file of the existing clustering still applies to it.
+               #
+               #   python Scripts/_incremental_cdhit.py <FINAL_cdhit_'genome'> <new prefixed sequences.fa> <output FINAL_cdhit_'name'> [--threads <N>] [--memory-mb <MB>] [--max-candidates <N>]
+
+
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+from _partition_cdhit import CDHIT_ROUNDS, SEED, read_fasta, seed_kmers
+
+
+
+ASSIGNMENT_ROUND = CDHIT_ROUNDS[1]  # New sequences are assigned at the criteria of the second round (the one FINAL_cdhit was clustered with)
+MAX_CANDIDATES = 32                 # Representatives a new sequence is aligned against at most (the ones it shares the most spaced k-mers with)
+MAX_KMER_REPRESENTATIVES = 1000     # Spaced k-mers found in more representatives than this do not make candidates (repeated domains would make every representative a candidate)
+
+
+
+def read_clstr(clstr_file):
+    """
+    Reads a cd-hit .clstr file as a list of [cluster number, member lines] (the member lines as they are in the file), plus the ID of every member.
+    """
+    clusters, member_ids = [], []
+    with open(clstr_file, "r") as clstr:
+        for line in clstr:
+            if line.startswith(">Cluster "):
+                clusters.append([int(line.split()[1]), []])
+            elif line.strip():
+                if not clusters:
+                    raise ValueError(f"{clstr_file}: member line before the first cluster: {line.rstrip()}")
+                clusters[-1][1].append(line if line.endswith("\n") else line + "\n")
+                member_ids.append(_member_id(line))
+    return clusters, member_ids
+
+
+def candidate_representatives(rep_sequences, new_sequences, max_candidates=MAX_CANDIDATES, seed=SEED):
+    """
+    Returns the candidate representatives of every new sequence - up to 'max_candidates' representatives (positions in 'rep_sequences') that share at least one spaced k-mer
+    with it and are at least as long (cd-hit-est-2d never puts a sequence in the cluster of a shorter representative), the ones sharing the most k-mers first.
+    """
+    rep_kmers, rep_owners = seed_kmers(rep_sequences, seed)
+    order = np.argsort(rep_kmers, kind="stable")
+    rep_kmers, rep_owners = rep_kmers[order], rep_owners[order]
+    new_kmers, new_owners = seed_kmers(new_sequences, seed)
+
+    # Every (new sequence, representative) pair that shares a k-mer - a k-mer of a new sequence matches the run of equal k-mers in the sorted representative k-mers
+    first = np.searchsorted(rep_kmers, new_kmers, side="left")
+    hits = np.searchsorted(rep_kmers, new_kmers, side="right") - first
+    hits[hits > MAX_KMER_REPRESENTATIVES] = 0
+    pair_new = np.repeat(new_owners.astype(np.int64), hits)
+    pair_rep = rep_owners[np.repeat(first - np.cumsum(hits) + hits, hits) + np.arange(hits.sum())].astype(np.int64)
+
+    rep_lengths = np.fromiter(map(len, rep_sequences), dtype=np.int64, count=len(rep_sequences))
+    new_lengths = np.fromiter(map(len, new_sequences), dtype=np.int64, count=len(new_sequences))
+    long_enough = rep_lengths[pair_rep] >= new_lengths[pair_new]
+    pairs, shared = np.unique(pair_new[long_enough] * len(rep_sequences) + pair_rep[long_enough], return_counts=True)
+    pair_new, pair_rep = pairs // max(len(rep_sequences), 1), pairs % max(len(rep_sequences), 1)
+
+    # The 'max_candidates' pairs of every new sequence that share the most k-mers
+    order = np.lexsort((-shared, pair_new))
+    pair_new, pair_rep = pair_new[order], pair_rep[order]
+    rank = np.arange(len(pair_new)) - np.searchsorted(pair_new, pair_new, side="left")
+    keep = rank < max_candidates
+
+    candidates = [[] for _ in new_sequences]
+    for new, rep in zip(pair_new[keep].tolist(), pair_rep[keep].tolist()):
+        candidates[new].append(rep)
+    return candidates
+
+
+def incremental_cdhit(final_fasta, new_fasta, output, threads=1, memory_mb=0, cdhit="cd-hit-est", cdhit_2d="cd-hit-est-2d", max_candidates=MAX_CANDIDATES, seed=SEED):
+    """
+    Adds the sequences of 'new_fasta' to the clustering 'final_fasta' (+ .clstr), and writes the updated clustering to 'output' (+ .clstr).
+    Returns the number of new sequences that joined existing clusters and the number of new clusters.
+    """
+    start = time.perf_counter()
+    rep_ids, rep_records, rep_sequences = read_fasta(final_fasta)
+    clusters, member_ids = read_clstr(f"{final_fasta}.clstr")
+    new_ids, new_records, new_sequences = read_fasta(new_fasta)
+
+    # The new IDs have to be unique, or their rows could not be told apart from the existing ones in the results
+    existing = set(member_ids) | set(rep_ids)
+    seen = set()
+    for new_id in new_ids:
+        if new_id in existing or new_id in seen:
+            raise ValueError(f"{new_fasta}: sequence ID {new_id} is already in the clustering (or twice in the new sequences) - the new sequences need IDs of their own")
+        seen.add(new_id)
+
+    candidates = candidate_representatives(rep_sequences, new_sequences, max_candidates, seed)
+    with_candidates = [i for i, reps in enumerate(candidates) if reps]
+    print(f"{len(new_ids)} new sequences, {len(with_candidates)} with candidate representatives (of {len(rep_ids)}) - indexed in {time.perf_counter() - start:.1f} s")
+
+    work_dir = tempfile.mkdtemp(prefix="cdhit_incremental_", dir=os.path.dirname(os.path.abspath(output)))
+    threads_option = ["-M", str(memory_mb), "-T", str(max(threads, 1))]
+    assigned = {} # ID of an existing representative -> member lines of the new sequences that joined its cluster
+
+    def assign(representatives, batch, name):
+        # One cd-hit-est-2d run of the new sequences 'batch' against the representatives 'representatives' (positions) - adds the ones that join a cluster to 'assigned'
+        reps_fasta, batch_fasta, assigned_output = (os.path.join(work_dir, f"{name}{suffix}") for suffix in ("_representatives.fa", "_batch.fa", ""))
+        with open(reps_fasta, "wb") as fasta:
+            fasta.writelines(rep_records[r] for r in representatives)
+        with open(batch_fasta, "wb") as fasta:
+            fasta.writelines(new_records[i] for i in batch)
+        subprocess.run([cdhit_2d, "-i", reps_fasta, "-i2", batch_fasta, "-o", assigned_output, *ASSIGNMENT_ROUND, *threads_option], check=True)
+
+        rep_set, batch_ids = set(rep_ids), {new_ids[i] for i in batch}
+        for _, member_lines in read_clstr(f"{assigned_output}.clstr")[0]:
+            representative = next((_member_id(line) for line in member_lines if _member_tail(line) == "*"), None)
+            if representative in rep_set:
+                assigned.setdefault(representative, []).extend(line for line in member_lines if _member_id(line) in batch_ids)
+
+    try:
+        # Align the new sequences that have candidates against the union of their candidates
+        if with_candidates:
+            assign(sorted({r for reps in candidates for r in reps}), with_candidates, "candidates")
+
+        # ... and every one still unassigned - without candidates, or whose candidates missed its match (a spurious shared k-mer, or the match outside the
+        # top 'max_candidates') - against every representative it could join (at least as long as the shortest of them)
+        assigned_ids = {_member_id(line) for lines in assigned.values() for line in lines}
+        fallback = [i for i in range(len(new_ids)) if new_ids[i] not in assigned_ids]
+        if fallback:
+            shortest = min(len(new_sequences[i]) for i in fallback)
+            long_enough = [r for r, sequence in enumerate(rep_sequences) if len(sequence) >= shortest]
+            if long_enough:
+                assign(long_enough, fallback, "fallback")
+
+        # The ones cd-hit-est-2d did not cluster with a representative stay novel
+        assigned_ids = {_member_id(line) for lines in assigned.values() for line in lines}
+        unassigned = [i for i in range(len(new_ids)) if new_ids[i] not in assigned_ids]
+
+        # Cluster the rest among themselves - they found new clusters
+        new_clusters, new_representatives = [], []
+        if unassigned:
+            novel_fasta, novel_output = os.path.join(work_dir, "novel.fa"), os.path.join(work_dir, "novel")
+            with open(novel_fasta, "wb") as fasta:
+                fasta.writelines(new_records[i] for i in unassigned)
+            subprocess.run([cdhit, "-i", novel_fasta, "-o", novel_output, *ASSIGNMENT_ROUND, *threads_option], check=True)
+            new_clusters = read_clstr(f"{novel_output}.clstr")[0]
+            new_representatives = read_fasta(novel_output)[1]
+    finally:
+        shutil.rmtree(work_dir)
+
+    # The existing clusters, with the new members appended (numbered on from the last member), then the new clusters numbered after the existing ones
+    next_cluster = max((number for number, _ in clusters), default=-1) + 1
+    with open(f"{output}.clstr", "w") as clstr:
+        for number, member_lines in clusters:
+            clstr.write(f">Cluster {number}\n")
+            clstr.writelines(member_lines)
+            representative = next((_member_id(line) for line in member_lines if _member_tail(line) == "*"), None)
+            for index, line in enumerate(assigned.get(representative, []), start=len(member_lines)):
+                member = line.partition("\t")[2]
+                clstr.write(f"{index}\t{member}")
+        for offset, (_, member_lines) in enumerate(new_clusters):
+            clstr.write(f">Cluster {next_cluster + offset}\n")
+            clstr.writelines(member_lines)
+
+    with open(output, "wb") as fasta:
+        fasta.writelines(rep_records)
+        fasta.writelines(new_representatives)
+
+    joined = sum(len(lines) for lines in assigned.values())
+    print(f"{joined} new sequences joined existing clusters, {len(unassigned)} formed {len(new_clusters)} new clusters - {output} and {output}.clstr written in {time.perf_counter() - start:.1f} s")
+    return joined, len(new_clusters)
+
+
+
+def _member_id(line):
+    # '3	4980nt, >EARLGREY_rnd-1_family-2#LTR/Gypsy... at +/98.75%' -> 'EARLGREY_rnd-1_family-2#LTR/Gypsy'
+    return line.partition(">")[2].partition("... ")[0]
+
+
+def _member_tail(line):
+    # '... *' -> '*', '... at +/98.75%' -> 'at +/98.75%'
+    return line.partition("... ")[2].strip()
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="_incremental_cdhit.py", description="Adds new prefixed TE sequences to an existing FINAL_cdhit clustering.")
+    parser.add_argument("final_fasta", help="Existing FINAL_cdhit_'genome' FASTA (its .clstr file is read from next to it)")
+    parser.add_argument("new_fasta", help="New sequences, with prefixed headers (e.g., written by _combine_fasta.py)")
+    parser.add_argument("output", help="Updated clustering (FASTA + .clstr) - name it FINAL_cdhit_'name' for format_data.py")
+    parser.add_argument("--threads", type=int, default=1, help="cd-hit threads")
+    parser.add_argument("--memory-mb", type=int, default=0, help="cd-hit memory limit (MB, 0 = unlimited)")
+    parser.add_argument("--max-candidates", type=int, default=MAX_CANDIDATES, help=f"Representatives a new sequence is aligned against at most (default {MAX_CANDIDATES})")
+    parser.add_argument("--cdhit", default="cd-hit-est")
+    parser.add_argument("--cdhit-2d", default="cd-hit-est-2d")
+    args = parser.parse_args()
+    if not os.path.exists(f"{args.final_fasta}.clstr"):
+        parser.error(f"no .clstr file next to {args.final_fasta}")
+
+    try:
+        incremental_cdhit(args.final_fasta, args.new_fasta, args.output, args.threads, args.memory_mb, args.cdhit, args.cdhit_2d, args.max_candidates)
+    except ValueError as error:
+        print(error)
+        sys.exit(1)
+    except subprocess.CalledProcessError as error:
+        print(f"cd-hit encountered an error: {error}")
+        sys.exit(1)
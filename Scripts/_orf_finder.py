@@ -0,0 +1,113 @@
+# FUNCTIONALITY: This script finds the open reading frames of the Representative_Sequences_'genome'.fasta file (the undiscovered unknown representatives) and writes them as proteins
+               # to Preprocessed_Representative_ORFs_'genome'.faa, the file pfam_scan.py scans - in one streaming pass, one record at a time.
+               # It replaces EMBOSS 'getorf -minsize 300' (its default '-find 0': the translated regions between STOP codons, in the three forward and the three reverse frames)
+               # and the 'awk' pass that renamed its headers: every ORF is written straight under the ID its Pfam hits are merged by - the last word of the sequence's header
+               # without its tool prefix (e.g., 'TE_1#LTR' for '>TE_1#LTR HITE_TE_1#LTR'), which is what the awk command made of getorf's headers.
+               # Each frame is translated at once, by looking its codons up in a codon table with numpy. Bases are IUPAC codes (4-bit masks of A, C, G and T), and an ambiguous codon
+               # translates to the amino acid (or STOP) all of its expansions code for, like in getorf - B or Z if they code for D/N or E/Q, 'X' if they differ otherwise
+               # (or if a base is not a nucleotide code).
+               #
+               #   python Scripts/_orf_finder.py <Representative_Sequences_'genome'.fasta> <Preprocessed_Representative_ORFs_'genome'.faa> [--minsize <nt>]
+
+
+
+import time
+import argparse
+import numpy as np
+
+
+
+MIN_ORF_NT = 300    # Minimum ORF length in nucleotides (getorf -minsize)
+LINE_WIDTH = 60     # Residues per line of the protein FASTA (as getorf writes them)
+
+# Standard genetic code (NCBI table 1, getorf's default), with the codons in TCAG order
+_STANDARD_CODE = "FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG"
+_TCAG = {1: 2, 2: 1, 4: 3, 8: 0} # A, C, G, T (as masks) -> position in TCAG
+
+# Sequence bytes to IUPAC masks (A=1, C=2, G=4, T=8, N=15 ..., either case, U as T) - anything else is 0; and the mask of the complement of each mask
+_IUPAC = {"A": 1, "C": 2, "G": 4, "T": 8, "U": 8, "R": 5, "Y": 10, "S": 6, "W": 9, "K": 12, "M": 3, "B": 14, "D": 13, "H": 11, "V": 7, "N": 15}
+_ENCODE = np.zeros(256, dtype=np.uint8)
+for _base, _mask in _IUPAC.items():
+    _ENCODE[ord(_base)] = _mask
+    _ENCODE[ord(_base.lower())] = _mask
+_COMPLEMENT = np.array([sum(_bit for _bit, _complement in ((1, 8), (2, 4), (4, 2), (8, 1)) if _mask & _complement) for _mask in range(16)], dtype=np.uint8)
+
+# The codon table, indexed by 256 * first mask + 16 * second mask + third mask
+_CODON_TABLE = np.full(4096, ord("X"), dtype=np.uint8)
+for _index in range(4096):
+    _masks = (_index >> 8, (_index >> 4) & 15, _index & 15)
+    _expansions = [[_bit for _bit in (1, 2, 4, 8) if _mask & _bit] for _mask in _masks]
+    _amino_acids = {_STANDARD_CODE[16 * _TCAG[_a] + 4 * _TCAG[_b] + _TCAG[_c]] for _a in _expansions[0] for _b in _expansions[1] for _c in _expansions[2]}
+    if len(_amino_acids) == 1:
+        _CODON_TABLE[_index] = ord(_amino_acids.pop())
+    elif _amino_acids in ({"D", "N"}, {"E", "Q"}):
+        _CODON_TABLE[_index] = ord("B" if "D" in _amino_acids else "Z")
+
+
+
+def fasta_records(fasta):
+    # Yields (header without '>', sequence bytes) for every record of 'fasta', one record at a time
+    header, lines = None, []
+    with open(fasta, "rb") as fasta_file:
+        for line in fasta_file:
+            if line.startswith(b">"):
+                if header is not None:
+                    yield header, b"".join(lines)
+                header, lines = line[1:].strip().decode("utf-8"), []
+            elif header is not None:
+                lines.append(line.strip())
+    if header is not None:
+        yield header, b"".join(lines)
+
+
+def orf_id(header):
+    # The last word of the header without its tool prefix ('TE_1#LTR HITE_TE_1#LTR' -> 'TE_1#LTR') - the ID the awk command made of getorf's headers
+    words = header.split()
+    last_word = words[-1] if words else ""
+    prefix, separator, rest = last_word.partition("_")
+    return rest if separator else last_word
+
+
+def translate_frames(sequence):
+    """
+    Translates the six reading frames of 'sequence' (bytes): the three forward frames, then the three frames of the reverse complement - each as protein bytes, '*' for STOP.
+    """
+    codes = _ENCODE[np.frombuffer(sequence, dtype=np.uint8)]
+    frames = []
+    for strand in (codes, _COMPLEMENT[codes[::-1]]):
+        for frame in range(3):
+            codons = strand[frame:frame + (len(strand) - frame) // 3 * 3].reshape(-1, 3).astype(np.uint16)
+            frames.append(_CODON_TABLE[256 * codons[:, 0] + 16 * codons[:, 1] + codons[:, 2]].tobytes())
+    return frames
+
+
+def find_orfs(sequence, minsize=MIN_ORF_NT):
+    # The ORFs of 'sequence' as getorf -find 0 reports them: every region between STOP codons (or a sequence end) of at least 'minsize' nucleotides, frame by frame
+    return [protein for frame in translate_frames(sequence) for protein in frame.split(b"*") if 3 * len(protein) >= minsize]
+
+
+def write_orfs(fasta, output, minsize=MIN_ORF_NT):
+    # Writes the ORFs of every record of 'fasta' to 'output' - returns the number of sequences and of ORFs
+    number_of_sequences = number_of_orfs = 0
+    with open(output, "wb") as faa:
+        for header, sequence in fasta_records(fasta):
+            record_id = orf_id(header).encode("utf-8")
+            for protein in find_orfs(sequence, minsize):
+                faa.write(b">" + record_id + b"\n")
+                faa.writelines(protein[start:start + LINE_WIDTH] + b"\n" for start in range(0, len(protein), LINE_WIDTH))
+                number_of_orfs += 1
+            number_of_sequences += 1
+    return number_of_sequences, number_of_orfs
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="_orf_finder.py", description="Writes the ORFs (regions between STOP codons, six frames) of the representative sequences as proteins.")
+    parser.add_argument("fasta", help="Representative_Sequences_'genome'.fasta")
+    parser.add_argument("output", help="Protein FASTA for pfam_scan.py")
+    parser.add_argument("--minsize", type=int, default=MIN_ORF_NT, help=f"Minimum ORF length in nucleotides (default {MIN_ORF_NT})")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    number_of_sequences, number_of_orfs = write_orfs(args.fasta, args.output, args.minsize)
+    print(f"{number_of_orfs} ORFs of at least {args.minsize} nt found in {number_of_sequences} sequences in {time.perf_counter() - start:.2f} s: {args.output}")
@@ -0,0 +1,360 @@
+# FUNCTIONALITY: This script runs the two rounds of cd-hit-est (95%, then 80% on the representatives of the first round) on the COMBINED_TE_SEQUENCES_'genome'.fa file,
+               # split into partitions that are clustered independently and in parallel - cd-hit's own '-T' threading scales poorly on large, repeat-rich TE libraries.
+               # Every sequence is sketched by its canonical spaced k-mers (20 bases out of every 36-base window), and sequences that share one are put in the same connected component:
+               # two sequences that cd-hit could cluster at 80% identity share long, nearly exact stretches, so they end up in the same component - apart from short ones at the
+               # lowest identities (of pairs of random sequences at 80% identity, 54% of the 100 nt pairs, 85% of the 200 nt pairs and 99% of the 500 nt pairs are linked - at 90%, 96% of the 100 nt pairs).
+               # That is not enough for the SINE and MITE lengths, so every sequence shorter than '--short-nt' (500 nt by default) is put in one shared component, and the short sequences are clustered
+               # together as they are on the whole file - only a pair whose shorter sequence is at least that long relies on the sketch.
+               # The two sequences of such a missed pair stay in separate clusters - otherwise the clusters are the ones cd-hit finds on the whole file.
+               # Partitioning is therefore opt-in ('--partition'), the whole-file run stays the default.
+               # The components are packed into bins of about equal size, each bin goes through both cd-hit rounds in its own cd-hit process (several at once),
+               # and the outputs of the bins are stitched back together into the usual Clustered_COMBINED_TE_SEQUENCES_'genome'(.clstr) and FINAL_cdhit_'genome'(.clstr) files -
+               # the clusters numbered globally, in the order cd-hit numbers them (longest representative first), and the representatives in the order of the input file.
+               # Low-complexity windows (poly-A tails, simple repeats - fewer than 20 distinct trinucleotides in the 36 bases) do not link sequences, or they would join unrelated components into one.
+               # Without '--partition' (or if everything falls into one component), cd-hit is simply run on the whole file with '--workers' threads, as before.
+               #
+               #   python Scripts/_partition_cdhit.py <combined.fa> <round 1 output> <round 2 output> --workers <N> --memory-mb <MB> [--partition] [--short-nt <N>] [--seed <1/0 pattern>] [--max-seed-sequences <N>]
+
+
+
+import os
+import sys
+import time
+import heapq
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+
+
+# The options of the two cd-hit-est rounds (-i, -o, -M and -T are added per run)
+CDHIT_ROUNDS = [
+    ["-d", "0", "-aS", "0.95", "-c", "0.95", "-G", "0", "-g", "1", "-b", "500"], # Round 1 - 95% sequence coverage and 95% sequence identity threshold
+    ["-d", "0", "-aS", "0.80", "-c", "0.80", "-G", "0", "-g", "1", "-b", "500"], # Round 2 - 80% sequence coverage and 80% sequence identity threshold
+]
+
+# Spaced seed the sequences are sketched with: a k-mer of the 20 bases at the '1' positions of every 36-base window. 20 bases are very unlikely to be shared by chance
+# within a TE library, and (as the mismatches between two sequences do not all break the same k-mers) sequences at 80% identity share far more spaced k-mers than contiguous 20-mers
+SEED = "111111011000001011000110110100011011"
+SHORT_SEQUENCE_NT = 500     # Sequences shorter than this all go in one shared component - the sketch misses too many of their pairs near 80% identity (SINEs, MITEs)
+MIN_SEED_TRIPLETS = 20      # Windows with fewer distinct trinucleotides than this are low-complexity (a random 36-base window has ~27 of its 34)
+BINS_PER_WORKER = 4         # More bins than workers, so that the bins finish at about the same time
+SKETCH_BATCH_NT = 1 << 23   # Nucleotides sketched at once (bounds the temporary k-mer arrays)
+
+# Lookup table from sequence bytes to 2-bit codes (either case) - anything else is 4, and no k-mer is taken across it
+_ENCODE = np.full(256, 4, dtype=np.uint8)
+for _code, _base in enumerate("ACGT"):
+    _ENCODE[ord(_base)] = _code
+    _ENCODE[ord(_base.lower())] = _code
+
+
+
+def read_fasta(fasta):
+    # IDs (first word of the header), whole records (bytes) and sequences (bytes, without line breaks) of every record, in file order
+    ids, records, sequences = [], [], []
+    with open(fasta, "rb") as fasta_file:
+        for chunk in fasta_file.read().split(b"\n>"):
+            chunk = chunk.removeprefix(b">")
+            if not chunk.strip():
+                continue
+            header, _, body = chunk.partition(b"\n")
+            ids.append(header.split(None, 1)[0].decode("utf-8") if header.strip() else "")
+            records.append(b">" + chunk.rstrip(b"\n") + b"\n")
+            sequences.append(b"".join(body.split()))
+    return ids, records, sequences
+
+
+
+# ------------------------------------------------ Partitioning ------------------------------------------------
+
+def sequence_components(sequences, seed=SEED, max_seed_sequences=None, short_nt=SHORT_SEQUENCE_NT):
+    """
+    Connected components of the sequences, linked when they share a spaced k-mer (either strand, as cd-hit-est compares both) that is not low-complexity.
+    With 'max_seed_sequences', spaced k-mers found in more sequences than that do not link them. All the sequences shorter than 'short_nt' are linked to each other.
+    Returns the component of every sequence - the index of its first sequence in the component.
+    """
+    kmers, owners = seed_kmers(sequences, seed)
+
+    # Group the sequences by k-mer (the sequences of a group in input order), and link every sequence of a group to the first one (groups that are too large are skipped)
+    order = np.argsort(kmers, kind="stable")
+    kmers, owners = kmers[order], owners[order]
+    group_start = np.flatnonzero(np.concatenate(([True], kmers[1:] != kmers[:-1]))) if len(kmers) else np.array([], dtype=np.int64)
+    group_size = np.diff(np.append(group_start, len(kmers)))
+    linking = (group_size > 1) & (group_size <= (max_seed_sequences or len(sequences)))
+    first_owner = np.repeat(owners[group_start], group_size)
+    in_linking_group = np.repeat(linking, group_size) & (owners != first_owner)
+
+    # The short sequences share one component, linked to the first of them
+    short = np.flatnonzero(np.fromiter(map(len, sequences), dtype=np.int64, count=len(sequences)) < short_nt)
+    a = np.concatenate((owners[in_linking_group].astype(np.int64), short[1:]))
+    b = np.concatenate((first_owner[in_linking_group].astype(np.int64), np.full(max(len(short) - 1, 0), short[0] if len(short) else 0, dtype=np.int64)))
+    return _components(len(sequences), a, b)
+
+
+def seed_kmers(sequences, seed=SEED):
+    # Every distinct canonical spaced k-mer of every sequence, as (k-mer code, position of the sequence) - sketched in batches of about SKETCH_BATCH_NT nucleotides
+    kmers, owners = [], []
+    start = 0
+    while start < len(sequences):
+        stop, batch_nt = start, 0
+        while stop < len(sequences) and (stop == start or batch_nt + len(sequences[stop]) <= SKETCH_BATCH_NT):
+            batch_nt += len(sequences[stop]) + 1
+            stop += 1
+        batch_kmers, batch_owners = _distinct_kmers(sequences[start:stop], seed)
+        kmers.append(batch_kmers)
+        owners.append(batch_owners + start)
+        start = stop
+    kmers = np.concatenate(kmers) if kmers else np.array([], dtype=np.uint64)
+    owners = np.concatenate(owners) if owners else np.array([], dtype=np.int32)
+    return kmers, owners
+
+
+def _distinct_kmers(sequences, seed):
+    # Every distinct canonical spaced k-mer of every sequence of the batch, as (k-mer code, position of the sequence in the batch)
+    span = len(seed)
+    codes = _ENCODE[np.frombuffer(b"\xff".join(sequences) + b"\xff", dtype=np.uint8)]
+    owner_of_base = np.repeat(np.arange(len(sequences), dtype=np.int32), [len(s) + 1 for s in sequences])
+    windows = len(codes) - span + 1
+    if windows <= 0:
+        return np.array([], dtype=np.uint64), np.array([], dtype=np.int32)
+
+    # A window gives a k-mer if it holds no other base than A/C/G/T (the separator between two sequences is not one either)...
+    invalid = np.concatenate(([0], np.cumsum(codes == 4)))
+    valid = (invalid[span:] - invalid[:windows]) == 0
+
+    # ... and if it is not low-complexity: the distinct trinucleotides of every window, as a 64-bit set
+    bases = (codes & 3).astype(np.uint64)
+    if span >= 3:
+        triplets = (bases[:-2] << np.uint64(4)) | (bases[1:-1] << np.uint64(2)) | bases[2:]
+        triplet_set = np.zeros(windows, dtype=np.uint64)
+        for j in range(span - 2):
+            triplet_set |= np.uint64(1) << triplets[j:j + windows]
+        valid &= _popcount(triplet_set) >= min(MIN_SEED_TRIPLETS, span - 2)
+
+    # The bases at the '1' positions of the seed, on the forward strand and on the reverse complement of the window (the canonical k-mer is the smaller one)
+    forward = np.zeros(windows, dtype=np.uint64)
+    reverse = np.zeros(windows, dtype=np.uint64)
+    for j in [j for j, used in enumerate(seed) if used == "1"]:
+        forward = (forward << np.uint64(2)) | bases[j:j + windows]
+        reverse = (reverse << np.uint64(2)) | (np.uint64(3) - bases[span - 1 - j:span - 1 - j + windows])
+    canonical = np.minimum(forward, reverse)[valid]
+    owner = owner_of_base[:windows][valid]
+
+    # Keep each (k-mer, sequence) pair once
+    order = np.lexsort((owner, canonical))
+    canonical, owner = canonical[order], owner[order]
+    distinct = np.concatenate(([True], (canonical[1:] != canonical[:-1]) | (owner[1:] != owner[:-1]))) if len(canonical) else np.array([], dtype=bool)
+    return canonical[distinct], owner[distinct]
+
+
+def _popcount(values):
+    # Number of set bits of every uint64
+    values = values - ((values >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    values = (values & np.uint64(0x3333333333333333)) + ((values >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    values = (values + (values >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return (values * np.uint64(0x0101010101010101)) >> np.uint64(56)
+
+
+def _components(number_of_sequences, a, b):
+    # Connected components of the graph with edges a[i] - b[i]: every node ends up labelled with the smallest node of its component
+    labels = np.arange(number_of_sequences, dtype=np.int64)
+    while len(a):
+        smallest = np.minimum(labels[a], labels[b])
+        np.minimum.at(labels, a, smallest)
+        np.minimum.at(labels, b, smallest)
+        while True: # Pointer jumping - a label always points to a node of the same component
+            jumped = labels[labels]
+            if np.array_equal(jumped, labels):
+                break
+            labels = jumped
+        if np.array_equal(labels[a], labels[b]):
+            break
+    return labels
+
+
+def pack_bins(components, lengths, number_of_bins):
+    """
+    Packs the components into (at most) 'number_of_bins' bins of about the same number of nucleotides - the largest component first, always into the emptiest bin.
+    Returns the bin of every sequence.
+    """
+    component_ids, component_of_sequence = np.unique(components, return_inverse=True)
+    component_nt = np.bincount(component_of_sequence, weights=lengths, minlength=len(component_ids))
+    bins = [(0.0, b) for b in range(min(number_of_bins, len(component_ids)))]
+    bin_of_component = np.zeros(len(component_ids), dtype=np.int64)
+    for component in np.argsort(-component_nt, kind="stable").tolist():
+        load, b = heapq.heappop(bins)
+        bin_of_component[component] = b
+        heapq.heappush(bins, (load + component_nt[component], b))
+    return bin_of_component[component_of_sequence]
+
+
+
+# ------------------------------------------------ Running cd-hit ------------------------------------------------
+
+class _ThreadBudget:
+    # Lets cd-hit runs start only while the threads they use fit in the budget
+    def __init__(self, threads):
+        self.free = threads
+        self.condition = threading.Condition()
+
+    def acquire(self, threads):
+        with self.condition:
+            self.condition.wait_for(lambda: self.free >= threads)
+            self.free -= threads
+
+    def release(self, threads):
+        with self.condition:
+            self.free += threads
+            self.condition.notify_all()
+
+
+def run_rounds(cdhit, fasta, outputs, threads, memory_mb, log=None):
+    # Both cd-hit rounds - each round clusters the representatives (output FASTA) of the round before
+    round_input = fasta
+    for options, output in zip(CDHIT_ROUNDS, outputs):
+        command = [cdhit, "-i", round_input, "-o", output, *options, "-M", str(memory_mb), "-T", str(threads)]
+        subprocess.run(command, check=True, stdout=log, stderr=subprocess.STDOUT if log else None)
+        round_input = output
+
+
+def partitioned_cdhit(combined_fasta, outputs, workers, memory_mb, cdhit="cd-hit-est", seed=SEED, max_seed_sequences=None, partition=False, keep_partitions=False, short_nt=SHORT_SEQUENCE_NT):
+    """
+    Runs the cd-hit rounds on 'combined_fasta' and writes 'outputs' (one FASTA + .clstr per round) - partitioned over 'workers' parallel cd-hit runs
+    when the sequences fall into more than one component (and 'partition' is set).
+    """
+    start = time.perf_counter()
+    ids, records, sequences = read_fasta(combined_fasta)
+    lengths = np.fromiter(map(len, sequences), dtype=np.int64, count=len(sequences))
+    partition = partition and workers > 1
+    components = sequence_components(sequences, seed, max_seed_sequences, short_nt) if partition else np.zeros(len(sequences), dtype=np.int64)
+    component_nt = np.bincount(np.unique(components, return_inverse=True)[1], weights=lengths)
+    if partition:
+        largest_share = component_nt.max() / max(lengths.sum(), 1) if len(sequences) else 0.0
+        print(f"{len(sequences)} sequences in {len(component_nt)} components (largest: {largest_share:.1%} of the nucleotides) - sketched in {time.perf_counter() - start:.1f} s")
+
+    if not partition or len(component_nt) <= 1:
+        print("Running cd-hit on the whole file.")
+        run_rounds(cdhit, combined_fasta, outputs, max(workers, 1), memory_mb)
+        return
+
+    bins = pack_bins(components, lengths, workers * BINS_PER_WORKER)
+    bin_ids = np.unique(bins).tolist()
+    bin_nt = np.bincount(bins, weights=lengths)
+    total_nt = max(bin_nt.sum(), 1)
+    work_dir = tempfile.mkdtemp(prefix="cdhit_partitions_", dir=os.path.dirname(os.path.abspath(outputs[-1])))
+    budget = _ThreadBudget(workers)
+
+    def cluster_bin(b):
+        # A bin large enough to hold more than one worker's share of the nucleotides gets more threads (and memory)
+        share = bin_nt[b] / total_nt
+        threads = max(1, min(workers, round(workers * share)))
+        bin_memory_mb = 0 if memory_mb == 0 else min(memory_mb, max(memory_mb // workers, int(memory_mb * share)))
+        bin_dir = os.path.join(work_dir, f"bin_{b}")
+        os.mkdir(bin_dir)
+        with open(os.path.join(bin_dir, "input.fa"), "wb") as bin_fasta:
+            bin_fasta.writelines(records[i] for i in np.flatnonzero(bins == b).tolist())
+        bin_outputs = [os.path.join(bin_dir, f"round_{r + 1}") for r in range(len(outputs))]
+
+        budget.acquire(threads)
+        try:
+            with open(os.path.join(bin_dir, "cd-hit.log"), "w") as log:
+                run_rounds(cdhit, os.path.join(bin_dir, "input.fa"), bin_outputs, threads, bin_memory_mb, log)
+        finally:
+            budget.release(threads)
+        return bin_outputs
+
+    clustering_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        bin_outputs = list(pool.map(cluster_bin, sorted(bin_ids, key=lambda b: -bin_nt[b]))) # Largest bins first
+    print(f"{len(bin_ids)} bins clustered by {workers} parallel cd-hit runs in {time.perf_counter() - clustering_start:.1f} s")
+
+    position = {record_id: i for i, record_id in reversed(list(enumerate(ids)))}
+    for r, output in enumerate(outputs):
+        stitch_round([outputs_of_bin[r] for outputs_of_bin in bin_outputs], position, output)
+        print(f"Round {r + 1} written: {output} and {output}.clstr")
+
+    if keep_partitions:
+        print(f"Partitions kept in {work_dir}")
+    else:
+        shutil.rmtree(work_dir)
+
+
+
+# ------------------------------------------------ Stitching ------------------------------------------------
+
+def stitch_round(bin_outputs, position, output):
+    """
+    Writes the cd-hit outputs of every bin (FASTA + .clstr) as one cd-hit output: the clusters renumbered from 0 with the longest representative first
+    (ties in input order, as cd-hit sorts the sequences), and the representative sequences in input order.
+    """
+    clusters, representatives = [], []
+    for bin_output in bin_outputs:
+        clusters.extend(_clstr_clusters(f"{bin_output}.clstr", position))
+        representatives.extend(_fasta_records(bin_output, position))
+
+    clusters.sort(key=lambda cluster: cluster[0])
+    with open(f"{output}.clstr", "w") as clstr:
+        for number, (_, member_lines) in enumerate(clusters):
+            clstr.write(f">Cluster {number}\n")
+            clstr.writelines(member_lines)
+
+    representatives.sort(key=lambda representative: representative[0])
+    with open(output, "wb") as fasta:
+        fasta.writelines(record for _, record in representatives)
+
+
+def _clstr_clusters(clstr_file, position):
+    # Yields ((-representative length, input position of the representative), member lines) for every cluster of a .clstr file
+    member_lines, key = [], None
+    with open(clstr_file, "r") as clstr:
+        for line in clstr:
+            if line.startswith(">Cluster "):
+                if member_lines:
+                    yield key, member_lines
+                member_lines, key = [], None
+                continue
+            if not line.strip():
+                continue
+            member_lines.append(line if line.endswith("\n") else line + "\n")
+            length_text, _, rest = line.partition("\t")[2].partition("nt, ")
+            te_id, _, tail = rest.partition("... ")
+            if tail.strip() == "*":
+                key = (-int(length_text), position[te_id.removeprefix(">")])
+    if member_lines:
+        yield key, member_lines
+
+
+def _fasta_records(fasta, position):
+    # (input position, record bytes) for every record of a cd-hit output FASTA
+    record_ids, records, _ = read_fasta(fasta)
+    return [(position[record_id], record) for record_id, record in zip(record_ids, records)]
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="_partition_cdhit.py", description="Runs both cd-hit-est rounds on the combined TE sequences, partitioned into independent components.")
+    parser.add_argument("combined_fasta")
+    parser.add_argument("round_1_output")
+    parser.add_argument("round_2_output")
+    parser.add_argument("--workers", type=int, default=1, help="cd-hit runs at once (threads in total)")
+    parser.add_argument("--partition", action="store_true", help="Cluster independent components in parallel cd-hit runs (default: the whole file in one run with --workers threads)")
+    parser.add_argument("--short-nt", type=int, default=SHORT_SEQUENCE_NT, help=f"Sequences shorter than this share one component (default {SHORT_SEQUENCE_NT})")
+    parser.add_argument("--memory-mb", type=int, default=0, help="cd-hit memory budget (MB) shared by the runs (0 = unlimited)")
+    parser.add_argument("--cdhit", default="cd-hit-est")
+    parser.add_argument("--seed", default=SEED, help=f"Spaced seed the sequences are linked by - '1' for a base that is used (default {SEED}, at most 32 '1's)")
+    parser.add_argument("--max-seed-sequences", type=int, default=None, help="Spaced k-mers found in more sequences than this do not link them (default: no limit)")
+    parser.add_argument("--keep-partitions", action="store_true", help="Keep the cd-hit inputs and outputs of every bin")
+    args = parser.parse_args()
+    if set(args.seed) - {"0", "1"} or not 1 <= args.seed.count("1") <= 32:
+        parser.error("--seed must be a pattern of '1's and '0's with 1 to 32 '1's")
+
+    try:
+        partitioned_cdhit(args.combined_fasta, [args.round_1_output, args.round_2_output], args.workers, args.memory_mb, args.cdhit,
+                          args.seed, args.max_seed_sequences, args.partition, args.keep_partitions, args.short_nt)
+    except subprocess.CalledProcessError as error:
+        print(f"cd-hit-est encountered an error: {error}")
+        sys.exit(1)
@@ -0,0 +1,299 @@
+# FUNCTIONALITY: This script holds the shared, pre-pressed Pfam-A cache that every genome run scans against - instead of every run copying the multi-GB Pfam-A.hmm and Pfam-A.hmm.dat
+               # files into its own Databases/pfamdb/pfamdb_'genome' directory, pressing them with hmmpress, and deleting them again at the end.
+               # The cache is built once (by 'setup.sh', or by the first run that needs it) in Databases/pfamdb/pressed/Pfam-A_<checksum>/: a copy of Pfam-A.hmm and Pfam-A.hmm.dat,
+               # the hmmpress files (.h3f, .h3i, .h3m, .h3p), and a PRESSED.json manifest with the size and SHA-256 checksum of every file - all of it read-only.
+               # The directory is named after the checksum of the source files, so a new Pfam release gets a cache of its own, and a run never uses files pressed from another release
+               # (the caches of older releases are left in place, for runs that may still be scanning against them - remove them by hand once no run uses them).
+               # It is built in a temporary directory and renamed into place once complete, under an exclusive lock on pressed/.lock - several runs starting at once build it only once,
+               # the others wait for it, and no run ever sees a half-built cache. Once built, a run checks the file sizes against the manifest, and the checksums of the small .h3i and .h3f files
+               # (the index and the filters hmmscan reads first - a same-size change there is caught on every run without re-hashing the GBs of profiles; with '--verify', every checksum).
+               # NOTE: the lock is an flock() lock - on a shared filesystem it needs flock support (e.g., Lustre mounted with 'flock'), like the SQLite caches of the pipeline.
+               # Fast mode ('--te-only', or '--domains-file <file>' for a list of one's own): a second cache, Pfam-A_<checksum>_te_<list checksum>/, pressed from only the Pfam families of
+               # a list of TE-associated domains (names, shell wildcards allowed, or PF accessions) - merge.py only keeps the names of the hits, and for triaging the undiscovered unknowns
+               # what matters is whether an ORF carries a TE domain, so scanning a few hundred profiles instead of all ~20k cuts the hmmscan time of every ORF about as much.
+               # The full cache stays as it is (both can be used side by side), and the sub-database has a release of its own, so their hits are never mixed in the Pfam hit cache.
+               #
+               #   python Scripts/_pfam_cache.py <Databases/pfamdb> [--cache-dir <dir>] [--hmmpress <hmmpress>] [--verify] [--te-only | --domains-file <file>]
+               #   (prints the path of the pressed cache directory - the directory to give pfam_scan.py)
+
+
+
+import os
+import sys
+import gzip
+import fnmatch
+import json
+import stat
+import time
+import fcntl
+import shutil
+import hashlib
+import argparse
+import tempfile
+import subprocess
+
+
+
+SOURCE_FILES = ["Pfam-A.hmm", "Pfam-A.hmm.dat"]
+PRESSED_EXTENSIONS = [".h3f", ".h3i", ".h3m", ".h3p"]   # Files hmmpress writes next to Pfam-A.hmm
+ALWAYS_VERIFIED = [".h3f", ".h3i"]                      # Pressed files small enough to checksum on every run
+MANIFEST = "PRESSED.json"
+CURRENT = "current.json"    # Stat (size, modification time) of the source files the last caches were built from -> the directory of each variant, so a run does not re-hash the source files
+FULL = "full"               # Variant name of the cache of the whole Pfam-A database
+LOCK = ".lock"
+CHECKSUM_BLOCK = 1 << 24
+
+# TE-associated Pfam families of the fast mode (Pfam names - shell wildcards allowed - or PF accessions): reverse transcriptases, integrases, RNase H, retrotransposon
+# proteases and gag proteins, DDE and other transposases of the DNA transposons, Helitron helicases, and the endonucleases of non-LTR retrotransposons
+TE_DOMAINS = [
+    "RVT_*", "RT_RNaseH*", "RNase_H", "rve*", "Integrase_Zn", "IN_DBD_C", "zf-RVT", "gag_pre-integrs",
+    "RVP*", "Peptidase_A17", "Retrotrans_gag", "Retrotran_gag_*", "gag-asp_proteas", "UBN2*", "Exo_endo_phos*",
+    "Transposase_*", "DDE_*", "HTH_Tnp_*", "DBD_Tnp_*", "DEDD_Tnp_*", "Tnp_*", "Dimer_Tnp_hAT", "MULE", "Plant_tran", "Transpos_assoc", "FAR1", "CENP-B_N", "Phage_integrase",
+    "Helitron_like_N", "PIF1",
+]
+
+
+
+def log(message):
+    # Messages go to stderr - stdout only holds the cache directory, for the shell to capture
+    print(message, file=sys.stderr)
+
+
+def pressed_pfam(pfam_db_dir, cache_dir=None, hmmpress="hmmpress", verify=False, domains=None):
+    """
+    Returns the pressed cache directory for the Pfam-A files in 'pfam_db_dir' - building it first if there is none for them (or if it fails verification).
+    With 'domains' (Pfam names or accessions, see TE_DOMAINS), the cache of the sub-database of only those families.
+    """
+    cache_dir = cache_dir or os.path.join(pfam_db_dir, "pressed")
+    os.makedirs(cache_dir, exist_ok=True)
+    domains = sorted(set(domains)) if domains else None
+    variant = _variant(domains)
+
+    # Fast path, without the lock: the cache of the same source files is complete
+    pressed_dir = _current_cache(pfam_db_dir, cache_dir, variant)
+    if pressed_dir and _valid(pressed_dir, verify):
+        return pressed_dir
+
+    with open(os.path.join(cache_dir, LOCK), "w") as lock:
+        waited = time.perf_counter()
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if time.perf_counter() - waited > 1:
+            log(f"Waited {time.perf_counter() - waited:.0f} s for another run to set up the Pfam cache.")
+        try:
+            _unpack(pfam_db_dir)
+
+            # Another run may have built it while this one waited for the lock
+            pressed_dir = _current_cache(pfam_db_dir, cache_dir, variant)
+            if pressed_dir and _valid(pressed_dir, verify):
+                return pressed_dir
+
+            start = time.perf_counter()
+            source_checksum = pfam_checksum(pfam_db_dir)
+            pressed_dir = os.path.join(cache_dir, f"Pfam-A_{source_checksum[:16]}" + ("" if variant == FULL else f"_{variant}"))
+            if os.path.isdir(pressed_dir) and not _valid(pressed_dir, verify=True):
+                log(f"The Pfam cache {pressed_dir} is incomplete or changed - rebuilding it.")
+                _remove(pressed_dir)
+            if not os.path.isdir(pressed_dir):
+                _build(pfam_db_dir, cache_dir, pressed_dir, source_checksum, hmmpress, domains)
+                log(f"Pfam cache built in {time.perf_counter() - start:.0f} s: {pressed_dir}")
+
+            # The other variants built from the same source files are kept
+            source_stat = _source_stat(pfam_db_dir)
+            variants = _current_variants(cache_dir, source_stat)
+            variants[variant] = os.path.basename(pressed_dir)
+            _write_json(os.path.join(cache_dir, CURRENT), {"source": source_stat, "variants": variants})
+            return pressed_dir
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+
+def pfam_checksum(pfam_dir):
+    # SHA-256 of the Pfam-A.hmm and Pfam-A.hmm.dat files of 'pfam_dir' - it names the Pfam release they are
+    return hashlib.sha256("".join(_checksum(os.path.join(pfam_dir, name)) for name in SOURCE_FILES).encode("ascii")).hexdigest()
+
+
+def pfam_release(pfam_dir):
+    # The release of the Pfam-A files a directory holds - read from the manifest of a pressed cache directory (the checksum of the source files, and the variant
+    # for a sub-database - caches built before there were variants only have the checksum), computed for any other directory
+    try:
+        with open(os.path.join(pfam_dir, MANIFEST), "r") as manifest_file:
+            manifest = json.load(manifest_file)
+        return manifest.get("release", manifest["source_checksum"])
+    except (OSError, ValueError, KeyError, AttributeError):
+        return pfam_checksum(pfam_dir)
+
+
+def read_domains(path):
+    # Pfam names or accessions, one per line ('#' starts a comment)
+    with open(path, "r") as domains_file:
+        domains = [line.split("#")[0].strip() for line in domains_file if line.split("#")[0].strip()]
+    if not domains:
+        raise ValueError(f"{path} lists no Pfam domains")
+    return domains
+
+
+
+def _variant(domains):
+    # Name of the cache variant: the whole database, or the sub-database of a list of domains (named after its checksum, so another list gets a cache of its own)
+    if not domains:
+        return FULL
+    return "te_" + hashlib.sha256("\n".join(domains).encode("utf-8")).hexdigest()[:8]
+
+
+def _current_variants(cache_dir, source_stat):
+    # {variant: cache directory name} recorded for the source files as they are now (empty if they changed since, or there is none)
+    try:
+        with open(os.path.join(cache_dir, CURRENT), "r") as current_file:
+            current = json.load(current_file)
+        if current["source"] == source_stat:
+            return dict(current["variants"])
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return {}
+
+
+def _current_cache(pfam_db_dir, cache_dir, variant=FULL):
+    # The cache directory of 'variant' recorded for the source files as they are now (None if they changed since, or there is none)
+    pressed_dir = _current_variants(cache_dir, _source_stat(pfam_db_dir)).get(variant)
+    return os.path.join(cache_dir, pressed_dir) if pressed_dir else None
+
+
+def _source_stat(pfam_db_dir):
+    stats = {}
+    for name in SOURCE_FILES:
+        path = os.path.join(pfam_db_dir, name)
+        if os.path.exists(path):
+            stats[name] = [os.stat(path).st_size, os.stat(path).st_mtime_ns]
+    return stats
+
+
+def _valid(pressed_dir, verify):
+    # The cache is valid if every file of its manifest is there with the same size, and the .h3i and .h3f files (when verifying, every file) with the same checksum
+    try:
+        with open(os.path.join(pressed_dir, MANIFEST), "r") as manifest_file:
+            files = json.load(manifest_file)["files"]
+    except (OSError, ValueError, KeyError):
+        return False
+    for name, (size, checksum) in files.items():
+        path = os.path.join(pressed_dir, name)
+        if not os.path.isfile(path) or os.path.getsize(path) != size:
+            return False
+        if (verify or name.endswith(tuple(ALWAYS_VERIFIED))) and _checksum(path) != checksum:
+            return False
+    return True
+
+
+def _unpack(pfam_db_dir):
+    # The compressed Pfam-A files are unpacked once (if 'setup.sh' has not done it yet), then removed - as 'main.sh' used to do on every run
+    for name in SOURCE_FILES:
+        path = os.path.join(pfam_db_dir, name)
+        if not os.path.exists(path) and os.path.exists(f"{path}.gz"):
+            log(f"Unpacking {path}.gz")
+            with gzip.open(f"{path}.gz", "rb") as compressed, open(f"{path}.part", "wb") as unpacked:
+                shutil.copyfileobj(compressed, unpacked, CHECKSUM_BLOCK)
+            os.replace(f"{path}.part", path)
+            os.remove(f"{path}.gz")
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} not found (nor {path}.gz) - run setup.sh to download the Pfam database")
+
+
+def _build(pfam_db_dir, cache_dir, pressed_dir, source_checksum, hmmpress, domains=None):
+    # Copy (or, with 'domains', filter) and press the source files in a temporary directory, then rename it into place - it only appears once complete
+    build_dir = tempfile.mkdtemp(prefix=".build_", dir=cache_dir)
+    try:
+        manifest = {"source_checksum": source_checksum, "release": source_checksum}
+        if domains:
+            kept = [_write_subset(os.path.join(pfam_db_dir, name), os.path.join(build_dir, name), domains) for name in SOURCE_FILES]
+            if kept[0][0] == 0:
+                raise ValueError(f"None of the {kept[0][1]} Pfam families matches the domain list ({', '.join(domains[:5])}...)")
+            log(f"Pfam sub-database: {kept[0][0]} of {kept[0][1]} families kept")
+            manifest.update(release=f"{source_checksum}:{_variant(domains)}", domains=domains, profiles=kept[0][0])
+        else:
+            for name in SOURCE_FILES:
+                shutil.copyfile(os.path.join(pfam_db_dir, name), os.path.join(build_dir, name))
+        subprocess.run([hmmpress, os.path.join(build_dir, SOURCE_FILES[0])], check=True, stdout=sys.stderr)
+
+        names = SOURCE_FILES + [SOURCE_FILES[0] + extension for extension in PRESSED_EXTENSIONS]
+        manifest["files"] = {name: [os.path.getsize(os.path.join(build_dir, name)), _checksum(os.path.join(build_dir, name))] for name in names}
+        _write_json(os.path.join(build_dir, MANIFEST), manifest)
+
+        for name in names + [MANIFEST]:
+            os.chmod(os.path.join(build_dir, name), stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        os.chmod(build_dir, stat.S_IRUSR | stat.S_IXUSR | stat.S_IRGRP | stat.S_IXGRP | stat.S_IROTH | stat.S_IXOTH)
+        os.rename(build_dir, pressed_dir)
+    except BaseException:
+        _remove(build_dir)
+        raise
+
+
+def _write_subset(source, destination, domains):
+    """
+    Copies the records of a Pfam file (Pfam-A.hmm, or Pfam-A.hmm.dat - records end with a '//' line) of the families that match 'domains' from 'source' to 'destination'.
+    A family matches by name (NAME / '#=GF ID' line, shell wildcards allowed) or by accession without its version (ACC / '#=GF AC' line). Returns (records kept, records read).
+    """
+    kept = read = 0
+    with open(source, "rb") as source_file, open(destination, "wb") as destination_file:
+        record, name, accession = [], "", ""
+        for line in source_file:
+            record.append(line)
+            fields = line.split()
+            if fields[:1] == [b"NAME"] or fields[:2] == [b"#=GF", b"ID"]:
+                name = fields[-1].decode("utf-8")
+            elif fields[:1] == [b"ACC"] or fields[:2] == [b"#=GF", b"AC"]:
+                accession = fields[-1].decode("utf-8")
+            elif fields == [b"//"]:
+                read += 1
+                if _matches(name, accession, domains):
+                    destination_file.writelines(record)
+                    kept += 1
+                record, name, accession = [], "", ""
+    return kept, read
+
+
+def _matches(name, accession, domains):
+    return any(fnmatch.fnmatchcase(name, domain) or (accession and accession.split(".")[0] == domain.split(".")[0]) for domain in domains)
+
+
+def _remove(directory):
+    # The cache is read-only, so it is made writable again first
+    if os.path.isdir(directory):
+        os.chmod(directory, stat.S_IRWXU)
+        for name in os.listdir(directory):
+            os.chmod(os.path.join(directory, name), stat.S_IRUSR | stat.S_IWUSR)
+        shutil.rmtree(directory)
+
+
+def _checksum(path):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(CHECKSUM_BLOCK), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def _write_json(path, content):
+    # Written to a temporary file and renamed, so readers see the old or the new file, never a partial one
+    with open(f"{path}.part", "w") as json_file:
+        json.dump(content, json_file, indent=1)
+    os.replace(f"{path}.part", path)
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="_pfam_cache.py", description="Builds (once) and returns the shared, pre-pressed Pfam-A cache.")
+    parser.add_argument("pfam_db_dir", help="Directory with Pfam-A.hmm and Pfam-A.hmm.dat (or their .gz files)")
+    parser.add_argument("--cache-dir", default=None, help="Directory holding the pressed caches (default: <pfam_db_dir>/pressed)")
+    parser.add_argument("--hmmpress", default="hmmpress")
+    parser.add_argument("--verify", action="store_true", help="Check the checksum of every cached file (not only its size)")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--te-only", action="store_true", help="Fast mode: the sub-database of the TE-associated Pfam families (TE_DOMAINS) only")
+    mode.add_argument("--domains-file", default=None, help="Fast mode with a list of one's own: Pfam names (wildcards allowed) or accessions, one per line")
+    args = parser.parse_args()
+
+    try:
+        domains = read_domains(args.domains_file) if args.domains_file else TE_DOMAINS if args.te_only else None
+        print(pressed_pfam(args.pfam_db_dir, args.cache_dir, args.hmmpress, args.verify, domains))
+    except (OSError, ValueError, subprocess.CalledProcessError) as error:
+        log(f"The Pfam cache could not be set up: {error}")
+        sys.exit(1)
@@ -0,0 +1,120 @@
+# FUNCTIONALITY: This script is called by 'Scripts/_pfam_shards.py' when a Pfam hit cache directory is given (--hit-cache <dir>, set in 'main.sh' by PFAM_HIT_CACHE).
+               # It keeps a persistent store of the pfam_scan.py hits of every ORF ever scanned, shared by every genome run - many TE ORFs (transposases, reverse transcriptases,
+               # helicases) are near-identical across related genomes and across reruns of the same genome, and the hits of an ORF only depend on its protein sequence and the Pfam release.
+               # Each entry is keyed by the Pfam release (the checksum of the Pfam-A files, see '_pfam_cache.py') and the SHA-256 of the uppercased ORF protein sequence,
+               # and holds the csv rows pfam_scan.py wrote for that ORF (without the seq_id column) - an empty entry for an ORF with no hits, so that it is not scanned again either.
+               # Only the ORFs that are not cached yet are sent through pfam_scan.py. The store is bounded in size (--hit-cache-max-gb) - the least recently looked up ORFs are evicted
+               # first, which also clears out the hits of Pfam releases no run scans against any more.
+
+
+
+import os
+import time
+import hashlib
+import sqlite3
+
+
+
+CACHE_FILE_NAME = "pfam_hit_cache.sqlite"
+DEFAULT_MAX_GB = 5
+
+
+
+def orf_key(sequence):
+    # Content address of an ORF (protein sequence, bytes) - its hits only depend on the sequence itself
+    return hashlib.sha256(sequence.upper()).hexdigest()
+
+
+
+class PfamHitCache:
+    """
+    SQLite-backed hit store. One row per (Pfam release, ORF key) holding the ORF's pfam_scan.py csv rows (its size is the length of those rows), and the csv header of every release.
+    The genome runs of main.sh look up and add ORFs concurrently, so it is opened with a long busy timeout in WAL mode - a run waits for another's write instead of failing.
+    """
+
+    def __init__(self, cache_dir, max_gb=DEFAULT_MAX_GB):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.max_bytes = int(max_gb * 1024 ** 3)
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(os.path.join(cache_dir, CACHE_FILE_NAME), timeout=600)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS hits (
+                release TEXT NOT NULL, orf_key TEXT NOT NULL,
+                rows TEXT NOT NULL, last_used REAL NOT NULL,
+                PRIMARY KEY (release, orf_key)
+            );
+            CREATE INDEX IF NOT EXISTS hits_last_used ON hits(last_used);
+            CREATE TABLE IF NOT EXISTS headers (
+                release TEXT NOT NULL PRIMARY KEY, header TEXT NOT NULL
+            );
+        """)
+
+    def get_many(self, release, keys):
+        # Returns {key: csv rows} for every key that is cached, and marks those entries as recently used
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        for i in range(0, len(unique_keys), 500):
+            chunk = unique_keys[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT orf_key, rows FROM hits WHERE release = ? AND orf_key IN ({placeholders})",
+                [release, *chunk]
+            ).fetchall()
+            found.update(rows)
+            self.conn.execute(
+                f"UPDATE hits SET last_used = ? WHERE release = ? AND orf_key IN ({placeholders})",
+                [time.time(), release, *chunk]
+            )
+        self.conn.commit()
+        self.hits += len(found)
+        self.misses += len(unique_keys) - len(found)
+        return found
+
+    def put_many(self, release, header, values):
+        now = time.time()
+        with self.conn:
+            if header is not None:
+                self.conn.execute("INSERT OR REPLACE INTO headers VALUES (?, ?)", (release, header))
+            self.conn.executemany("INSERT OR REPLACE INTO hits VALUES (?, ?, ?, ?)", ((release, key, rows, now) for key, rows in values.items()))
+
+    def header(self, release):
+        row = self.conn.execute("SELECT header FROM headers WHERE release = ?", (release,)).fetchone()
+        return row[0] if row else None
+
+    def size_bytes(self):
+        return self.conn.execute("SELECT COALESCE(SUM(length(rows)), 0) FROM hits").fetchone()[0]
+
+    def evict(self):
+        # Drop least recently used entries until the cache is back under 90% of its size limit
+        size = self.size_bytes()
+        if size <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        evicted = 0
+        with self.conn:
+            while size > target:
+                oldest = self.conn.execute("SELECT rowid, length(rows) FROM hits ORDER BY last_used LIMIT 10000").fetchall()
+                if not oldest:
+                    break
+                doomed = []
+                for rowid, nbytes in oldest:
+                    if size <= target:
+                        break
+                    doomed.append((rowid,))
+                    size -= nbytes
+                self.conn.executemany("DELETE FROM hits WHERE rowid = ?", doomed)
+                evicted += len(doomed)
+        print(f"Pfam hit cache over its {self.max_bytes / 1024 ** 3:.1f} GB limit - evicted {evicted} least recently used entries")
+
+    def print_stats(self):
+        lookups = self.hits + self.misses
+        hit_rate = (self.hits / lookups * 100) if lookups else 0.0
+        entries = self.conn.execute("SELECT COUNT(*) FROM hits").fetchone()[0]
+        print("\nPFAM HIT CACHE SUMMARY")
+        print(f"Hits: {self.hits}  Misses: {self.misses}  Hit rate: {hit_rate:.1f}%  (distinct ORF sequences)")
+        print(f"Entries: {entries}  Size: {self.size_bytes() / 1024 ** 2:.1f} MB (limit {self.max_bytes / 1024 ** 3:.1f} GB)")
+
+    def close(self):
+        self.conn.close()
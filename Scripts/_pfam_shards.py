@@ -0,0 +1,160 @@
+# FUNCTIONALITY: This script runs the Pfam stage of 'main.sh' - pfam_scan.py over the Preprocessed_Representative_ORFs_'genome'.faa file - in parallel shards.
+               # pfam_scan.py used to run once over the whole ORF file, on its own on the critical path after clustering, without using the threads of the job.
+               # Instead, the ORFs are split into residue-balanced shards (hmmscan time grows with the length of the query), up to 'workers' pfam_scan.py runs go at once (one per shard),
+               # and their csv outputs are merged back into pfam_output_'genome'.csv: the header once, and the hits in the order of the ORFs in the input file,
+               # so the merged file holds the same rows in the same order whatever the number of workers.
+               # The ORFs of a representative sequence all carry its ID, so in the shards every ORF is named by its position in the input file instead (and named back when merging) -
+               # that way the hits of every ORF go back to their exact place, even when the ORFs of one sequence end up in different shards.
+               # With a Pfam hit cache ('--hit-cache <dir>', see '_pfam_hit_cache.py'), only the ORFs whose protein sequence is not cached for this Pfam release are scanned (each distinct
+               # sequence once), their hits are added to the cache, and the cached hits of the other ORFs are merged back in - the output is the same as without the cache.
+               #
+               #   python Scripts/_pfam_shards.py <ORF .faa> <pressed Pfam directory> <output csv> --workers <N> [--pfam-scan <path to pfam_scan.py>] [--cpu-per-shard <N>] [--hit-cache <dir>] [--hit-cache-max-gb <GB>]
+
+
+
+import io
+import os
+import csv
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from _partition_cdhit import read_fasta
+from _feature_shards import length_balanced_shards
+from _pfam_cache import pfam_release
+from _pfam_hit_cache import DEFAULT_MAX_GB, PfamHitCache, orf_key
+
+
+
+def run_pfam_sharded(orf_fasta, pfam_dir, output_csv, workers, pfam_scan="pfam_scan.py", cpu_per_shard=1, hit_cache_dir=None, hit_cache_max_gb=DEFAULT_MAX_GB):
+    """
+    Runs 'pfam_scan' over 'orf_fasta' against 'pfam_dir' in up to 'workers' concurrent shards and writes the merged csv output to 'output_csv'
+    (only over the ORFs that are not in the hit cache, if 'hit_cache_dir' is given).
+    """
+    start = time.perf_counter()
+    ids, _, sequences = read_fasta(orf_fasta)
+
+    # The ORFs to scan - all of them, or the first ORF of every sequence that is not cached yet
+    cache, header, cached, keys = None, None, {}, []
+    to_scan = list(range(len(ids)))
+    if hit_cache_dir:
+        cache = PfamHitCache(hit_cache_dir, hit_cache_max_gb)
+        release = pfam_release(pfam_dir)
+        keys = [orf_key(sequence) for sequence in sequences]
+        cached = cache.get_many(release, keys)
+        header = cache.header(release)
+        first_position = {}
+        for position, key in enumerate(keys):
+            if key not in cached:
+                first_position.setdefault(key, position)
+        to_scan = sorted(first_position.values())
+        found = sum(key in cached for key in keys)
+        print(f"Pfam hit cache: {found} of {len(ids)} ORFs cached ({found / len(ids) if ids else 0:.1%}) - {len(to_scan)} distinct ORF sequences left to scan")
+
+    scanned_header, scanned = scan_orfs(sequences, to_scan, pfam_dir, workers, pfam_scan, cpu_per_shard, os.path.dirname(os.path.abspath(output_csv)), header is None)
+    if header is not None and scanned_header is not None and scanned_header != header:
+        raise ValueError(f"The csv header of pfam_scan.py differs from the one in the Pfam hit cache: {scanned_header.rstrip()}")
+    header = header if header is not None else scanned_header
+
+    # The hit rows of every ORF - scanned, or from the cache (or from the scanned ORF with the same sequence)
+    if cache:
+        scanned_rows = {keys[position]: "".join(rows) for position, rows in scanned.items()}
+        cache.put_many(release, scanned_header, scanned_rows)
+        cached.update(scanned_rows)
+        cache.evict()
+        orf_rows = [[row + "\n" for row in cached[key].split("\n") if row] for key in keys]
+        cache.print_stats()
+        cache.close()
+    else:
+        orf_rows = [scanned.get(position, []) for position in range(len(ids))]
+
+    with open(output_csv, "w") as output:
+        if header is not None:
+            output.write(header)
+        for record_id, rows in zip(ids, orf_rows):
+            field = _csv_field(record_id)
+            output.writelines(f"{field},{rest}" for rest in rows)
+    print(f"pfam_scan.py ran on {len(to_scan)} of {len(ids)} ORFs in {time.perf_counter() - start:.0f} s - merged into {output_csv}")
+
+
+def scan_orfs(sequences, positions, pfam_dir, workers, pfam_scan, cpu_per_shard, tmp_parent, need_header=True):
+    """
+    Scans the ORFs at 'positions' of 'sequences' in up to 'workers' residue-balanced shards. Returns the csv header (None if nothing was scanned)
+    and {position: csv rows of the ORF without the seq_id column, in the order pfam_scan.py wrote them} for every scanned ORF.
+    """
+    shards = [[positions[i] for i in rows] for rows in length_balanced_shards([len(sequences[position]) for position in positions], max(workers, 1))]
+    if not shards and not need_header:
+        return None, {}
+    if not shards:
+        shards = [[]] # One run on an empty file, for the csv header
+    print(f"Running pfam_scan.py on {len(positions)} ORFs in {len(shards)} residue-balanced shards with up to {workers} concurrent workers")
+
+    with tempfile.TemporaryDirectory(prefix="pfam_shards_", dir=tmp_parent) as tmp_dir:
+        def run_shard(shard):
+            number, rows = shard
+            shard_fasta, shard_csv = os.path.join(tmp_dir, f"shard_{number}.faa"), os.path.join(tmp_dir, f"shard_{number}.csv")
+            with open(shard_fasta, "wb") as fasta:
+                fasta.writelines(b">%d\n%s\n" % (row, sequences[row]) for row in rows)
+            _pfam_scan(pfam_scan, shard_fasta, pfam_dir, shard_csv, cpu_per_shard)
+            return shard_csv
+
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+            shard_csvs = list(pool.map(run_shard, enumerate(shards)))
+        header, rows = read_shard_csvs(shard_csvs)
+
+    scanned = {position: [] for shard in shards for position in shard}
+    for position, rest in rows:
+        scanned[position].append(rest)
+    return header, scanned
+
+
+def read_shard_csvs(shard_csvs):
+    """
+    Reads the csv outputs of the shards: the header (the same in every shard), and (position, rest of the row) for every hit row - seq_id, the first column,
+    is the position the ORF was named by in its shard. All the hits of an ORF come from the same shard, so they keep the order pfam_scan.py wrote them in.
+    """
+    header, rows = None, []
+    for shard_csv in shard_csvs:
+        with open(shard_csv, "r") as shard:
+            lines = [line if line.endswith("\n") else line + "\n" for line in shard if line.strip()]
+        if not lines:
+            continue
+        if header is None:
+            header = lines[0]
+        elif lines[0] != header:
+            raise ValueError(f"{shard_csv}: the header differs from the other shards: {lines[0].rstrip()}")
+        rows.extend((int(position), rest) for position, _, rest in (line.partition(",") for line in lines[1:]))
+    return header, rows
+
+
+def _csv_field(text):
+    # 'text' as a csv field, quoted only if it has to be (as the csv writer of pfam_scan.py writes it)
+    field = io.StringIO()
+    csv.writer(field, lineterminator="").writerow([text])
+    return field.getvalue()
+
+
+def _pfam_scan(pfam_scan, fasta, pfam_dir, output_csv, cpu):
+    subprocess.run([pfam_scan, fasta, pfam_dir, "-out", output_csv, "-outfmt", "csv", "-cpu", str(cpu)], check=True)
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="_pfam_shards.py", description="Runs pfam_scan.py over the representative ORFs in parallel, residue-balanced shards.")
+    parser.add_argument("orf_fasta")
+    parser.add_argument("pfam_dir", help="Pressed Pfam directory (from _pfam_cache.py)")
+    parser.add_argument("output_csv")
+    parser.add_argument("--workers", type=int, default=1, help="pfam_scan.py runs at once")
+    parser.add_argument("--pfam-scan", default="pfam_scan.py", help="Path to pfam_scan.py")
+    parser.add_argument("--cpu-per-shard", type=int, default=1, help="hmmscan threads of every pfam_scan.py run")
+    parser.add_argument("--hit-cache", default=None, help="Pfam hit cache directory shared by the runs - only the ORFs not cached yet are scanned")
+    parser.add_argument("--hit-cache-max-gb", type=float, default=DEFAULT_MAX_GB, help="Size limit of the Pfam hit cache in GB - least recently used entries are evicted beyond it")
+    args = parser.parse_args()
+
+    try:
+        run_pfam_sharded(args.orf_fasta, args.pfam_dir, args.output_csv, args.workers, args.pfam_scan, args.cpu_per_shard, args.hit_cache, args.hit_cache_max_gb)
+    except (ValueError, subprocess.CalledProcessError) as error:
+        print(f"pfam_scan.py encountered an error: {error}")
+        sys.exit(1)
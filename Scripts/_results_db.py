@@ -0,0 +1,236 @@
+# FUNCTIONALITY: This script holds the optional SQLite results database - one file that can hold the results of many genomes, indexed on cluster, pipeline, unknown status and family,
+               # so that questions like "all undiscovered unknown clusters with a Pfam hit" or "all HELIANO autonomous helitrons" are answered with an index lookup instead of loading
+               # every COMPLETE_TE_RESULTS csv file with pandas. 'format_data.py' stores a genome's clusters in it, 'merge.py' stores them again with the Pfam proteins,
+               # and 'Classify/_START_CLASSIFYING.py' adds the classification results (each with '--results-db <file.sqlite>', or 'main.sh --results_db <file.sqlite>').
+               #
+               # Query it with:
+               #   python Scripts/_results_db.py <file.sqlite> genomes
+               #   python Scripts/_results_db.py <file.sqlite> undiscovered [--with-pfam] [--genome <genome>]
+               #   python Scripts/_results_db.py <file.sqlite> family <family> [--pipeline <pipeline>] [--genome <genome>]     (e.g., family autonomous_helitron --pipeline HELIANO)
+               #   python Scripts/_results_db.py <file.sqlite> classified [--class <class>] [--genome <genome>]
+               #   python Scripts/_results_db.py <file.sqlite> sql "<SELECT ...>"
+
+
+
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import numpy as np
+import pandas as pd
+from _add_metrics import sequence_families
+from _cluster_table import ClusterTable, UNKNOWN_NONE, UNKNOWN_UNDISCOVERED, UNKNOWN_DISCOVERED
+
+
+
+# Unknown status of a cluster, as stored in the database
+UNKNOWN_STATUS_NAMES = {UNKNOWN_NONE: "N/A", UNKNOWN_UNDISCOVERED: "Undiscovered", UNKNOWN_DISCOVERED: "Discovered"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sequences (
+    genome          TEXT    NOT NULL,
+    row             INTEGER NOT NULL,   -- position of the sequence in the genome's COMPLETE_TE_RESULTS csv
+    cluster         INTEGER NOT NULL,   -- 5 for 'Cluster 5'
+    length          INTEGER,
+    pipeline        TEXT,
+    sequence_info   TEXT,
+    location        TEXT,
+    identity        REAL,               -- % identity to the cluster's representative (NULL for the representative)
+    representative  INTEGER,            -- 1 for the cluster's representative sequence
+    family          TEXT,               -- the family the sequence adds to its cluster's family_count (NULL if none)
+    proteins        TEXT,               -- Pfam proteins (after merge.py)
+    PRIMARY KEY (genome, row)
+);
+CREATE INDEX IF NOT EXISTS sequences_cluster ON sequences (genome, cluster);
+CREATE INDEX IF NOT EXISTS sequences_pipeline ON sequences (pipeline);
+CREATE INDEX IF NOT EXISTS sequences_family ON sequences (family, pipeline);
+CREATE INDEX IF NOT EXISTS sequences_info ON sequences (genome, sequence_info);
+
+CREATE TABLE IF NOT EXISTS clusters (
+    genome          TEXT    NOT NULL,
+    cluster         INTEGER NOT NULL,
+    size            INTEGER,
+    representative  TEXT,               -- sequence_info of the representative sequence
+    unknown_status  TEXT,               -- 'N/A', 'Undiscovered' or 'Discovered'
+    pipeline_count  TEXT,
+    family_count    TEXT,
+    PRIMARY KEY (genome, cluster)
+);
+CREATE INDEX IF NOT EXISTS clusters_unknown_status ON clusters (unknown_status, genome);
+
+CREATE TABLE IF NOT EXISTS classifications (
+    genome          TEXT    NOT NULL,
+    sequence_info   TEXT    NOT NULL,   -- the classified representative sequence
+    predicted_class TEXT,               -- 'UNKNOWN' if below the threshold
+    threshold       REAL,
+    PRIMARY KEY (genome, sequence_info)
+);
+CREATE INDEX IF NOT EXISTS classifications_class ON classifications (predicted_class);
+"""
+
+
+
+def genome_name(complete_csv):
+    # COMPLETE_TE_RESULTS_'genome'.csv -> 'genome' (the name a genome's results are stored under)
+    return os.path.splitext(os.path.basename(complete_csv))[0].replace("COMPLETE_TE_RESULTS_", "", 1)
+
+
+def connect(db_path):
+    con = sqlite3.connect(db_path)
+    con.executescript(SCHEMA)
+    return con
+
+
+def store_results(db_path, genome, df):
+    """
+    Stores a COMPLETE_TE_RESULTS table (with or without the 'Proteins' column) as the results of 'genome', replacing any results stored for it before.
+    The classification results of the genome are kept.
+    """
+    members = df[df["cluster"].notna()].reset_index(drop=True)
+    cluster_table = ClusterTable.from_results(members)
+    member_clusters = cluster_table.member_clusters()
+    proteins = members["Proteins"] if "Proteins" in members.columns else pd.Series(None, index=members.index, dtype=object)
+
+    sequence_rows = zip(
+        [genome] * len(members),
+        range(len(members)),
+        cluster_table.cluster_ids[member_clusters].tolist(),
+        cluster_table.lengths.tolist(),
+        _values(members["Pipeline Used"]),
+        _values(members["Sequence Information"]),
+        _values(members["location"]),
+        [None if np.isnan(identity) else identity for identity in cluster_table.identity.astype(float).tolist()],
+        cluster_table.representative.astype(int).tolist(),
+        _values(sequence_families(members)),
+        _values(proteins),
+    )
+    names = cluster_table.names
+    cluster_rows = zip(
+        [genome] * len(cluster_table),
+        cluster_table.cluster_ids.tolist(),
+        cluster_table.sizes.tolist(),
+        [names[i] if i >= 0 else None for i in cluster_table.rep_index.tolist()],
+        [UNKNOWN_STATUS_NAMES[status] for status in cluster_table.unknown_status.tolist()],
+        cluster_table.pipeline_counts,
+        cluster_table.family_counts,
+    )
+
+    with connect(db_path) as con: # One transaction - readers see either the old or the new results of the genome
+        con.execute("DELETE FROM sequences WHERE genome = ?", (genome,))
+        con.execute("DELETE FROM clusters WHERE genome = ?", (genome,))
+        con.executemany("INSERT INTO sequences VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", sequence_rows)
+        con.executemany("INSERT INTO clusters VALUES (?, ?, ?, ?, ?, ?, ?)", cluster_rows)
+    con.close()
+    print(f"Results of {genome} stored in {db_path}: {len(members)} sequences in {len(cluster_table)} clusters.")
+
+
+def store_classifications(db_path, genome, results, classifier_threshold):
+    # Stores the classification results (Sequence_ID, Predicted_Class) of 'genome', replacing earlier results for the same sequences
+    rows = zip([genome] * len(results), results["Sequence_ID"].astype(str).tolist(), results["Predicted_Class"].astype(str).tolist(),
+               [float(classifier_threshold)] * len(results))
+    with connect(db_path) as con:
+        con.executemany("INSERT OR REPLACE INTO classifications VALUES (?, ?, ?, ?)", rows)
+    con.close()
+    print(f"Classification results of {genome} stored in {db_path}: {len(results)} sequences.")
+
+
+
+# ------------------------------------------------ Queries ------------------------------------------------
+
+def query_genomes(con, args):
+    return con.execute("""
+        SELECT genome, COUNT(*) AS clusters, SUM(size) AS sequences, SUM(unknown_status = 'Undiscovered') AS undiscovered_clusters
+        FROM clusters GROUP BY genome ORDER BY genome""")
+
+
+def query_undiscovered(con, args):
+    # Clusters whose unknowns were not discovered through clustering, with the Pfam proteins found in them (only those with proteins for --with-pfam)
+    sql = """
+        SELECT * FROM (
+            SELECT c.genome, c.cluster, c.size, c.representative, c.pipeline_count, c.family_count,
+                   (SELECT group_concat(s.proteins, '; ') FROM sequences s
+                    WHERE s.genome = c.genome AND s.cluster = c.cluster AND s.proteins IS NOT NULL) AS proteins
+            FROM clusters c
+            WHERE c.unknown_status = 'Undiscovered' AND (? IS NULL OR c.genome = ?)
+        )
+        WHERE (? = 0 OR proteins IS NOT NULL)
+        ORDER BY genome, cluster"""
+    return con.execute(sql, (args.genome, args.genome, int(args.with_pfam)))
+
+
+def query_family(con, args):
+    sql = """
+        SELECT genome, cluster, pipeline, sequence_info, length, representative, proteins
+        FROM sequences
+        WHERE family = ? AND (? IS NULL OR pipeline = ?) AND (? IS NULL OR genome = ?)
+        ORDER BY genome, row"""
+    return con.execute(sql, (args.family, args.pipeline, args.pipeline, args.genome, args.genome))
+
+
+def query_classified(con, args):
+    sql = """
+        SELECT k.genome, s.cluster, k.sequence_info, k.predicted_class, k.threshold
+        FROM classifications k
+        LEFT JOIN sequences s ON s.genome = k.genome AND s.sequence_info = k.sequence_info AND s.representative = 1
+        WHERE (? IS NULL OR k.predicted_class = ?) AND (? IS NULL OR k.genome = ?)
+        ORDER BY k.genome, s.cluster"""
+    return con.execute(sql, (args.predicted_class, args.predicted_class, args.genome, args.genome))
+
+
+def query_sql(con, args):
+    return con.execute(args.sql)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="_results_db.py", description="Query the SQLite results database written with --results-db.")
+    parser.add_argument("db", help="SQLite results database")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("genomes", help="Genomes stored in the database, with their numbers of clusters and sequences").set_defaults(query=query_genomes)
+
+    undiscovered = commands.add_parser("undiscovered", help="Clusters with unknowns that were not discovered through clustering")
+    undiscovered.add_argument("--with-pfam", action="store_true", help="Only clusters with a Pfam hit")
+    undiscovered.add_argument("--genome", default=None)
+    undiscovered.set_defaults(query=query_undiscovered)
+
+    family = commands.add_parser("family", help="Sequences of a family (e.g., autonomous_helitron, LTR/Copia, SINE)")
+    family.add_argument("family")
+    family.add_argument("--pipeline", default=None, help="Only sequences found by this pipeline (e.g., HELIANO)")
+    family.add_argument("--genome", default=None)
+    family.set_defaults(query=query_family)
+
+    classified = commands.add_parser("classified", help="Classification results of the representative sequences")
+    classified.add_argument("--class", dest="predicted_class", default=None, help="Only this predicted class (e.g., UNKNOWN)")
+    classified.add_argument("--genome", default=None)
+    classified.set_defaults(query=query_classified)
+
+    sql = commands.add_parser("sql", help="Any read-only SQL query (tables: sequences, clusters, classifications)")
+    sql.add_argument("sql")
+    sql.set_defaults(query=query_sql)
+
+    args = parser.parse_args()
+    if not os.path.exists(args.db):
+        parser.error(f"no such database: {args.db}")
+
+    start = time.perf_counter()
+    con = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True) # Read-only, so the queries can never change the results
+    cursor = args.query(con, args)
+    print("\t".join(column[0] for column in cursor.description))
+    row_count = 0
+    for row in cursor:
+        print("\t".join("" if value is None else str(value) for value in row))
+        row_count += 1
+    con.close()
+    print(f"{row_count} rows in {(time.perf_counter() - start) * 1000:.1f} ms", file=sys.stderr)
+
+
+
+def _values(column):
+    # Cell values of a column as python objects, with missing cells as None
+    return column.astype(object).where(column.notna(), None).tolist()
+
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+# FUNCTIONALITY: This script holds a compact, memory-mappable container for large sets of nucleotide sequences (used by the preprocessing and feature stages of both pipelines).
+               # Bases are packed 2 bits each (A=0, C=1, G=2, T=3, 4 bases per byte, every sequence starting on a byte boundary so one sequence is a zero-copy slice of the packed array).
+               # Anything that is not an uppercase A/C/G/T (N, other IUPAC codes, lowercase, gaps...) is kept in a run-length ambiguity mask, so the original text is restored exactly.
+               # Sequence boundaries are kept in an offsets array and the sequence IDs in a single UTF-8 blob. This takes ~1/4 of the RAM of the same sequences held as Python strings.
+               #
+               # A store is saved as a directory of .npy files, which are memory-mapped when loaded - only the pages that are read are pulled from disk.
+               # The preprocessing step saves one next to the preprocessed dataset (PREPROCESSED_x.csv -> PREPROCESSED_x.seqstore), and the later python stages
+               # (feature backend, sparse k-mers, cascade) load it with 'dataset_store' instead of reading the sequence_content column back as strings:
+               #   python Scripts/_sequence_store.py build <dataset.csv> <output.seqstore>   (columns: Sequence_ID, sequence_content)
+               #   python Scripts/_sequence_store.py info <dataset.seqstore>
+
+
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+from _feature_exchange import read_table
+
+
+
+# Lookup table to 2-bit encode raw sequence bytes. Anything that is not an uppercase A/C/G/T becomes 255 (masked).
+_ENCODE = np.full(256, 255, dtype=np.uint8)
+for _code, _base in enumerate("ACGT"):
+    _ENCODE[ord(_base)] = _code
+_DECODE = np.frombuffer(b"ACGT", dtype=np.uint8)
+
+# Number of nucleotides packed at once when building a store (bounds the temporary index arrays)
+BUILD_BATCH_NT = 1 << 24
+
+# Extension of the store saved next to a dataset
+STORE_SUFFIX = ".seqstore"
+
+_ARRAYS = ["packed", "offsets", "byte_offsets", "mask_offsets", "mask_starts", "mask_lengths", "mask_symbols", "id_blob", "id_offsets"]
+
+
+
+class PackedSequences:
+    """
+    n sequences stored as:
+        packed        uint8  - 2-bit bases, sequence i is packed[byte_offsets[i]:byte_offsets[i + 1]] (masked positions hold 0)
+        offsets       int64  - sequence i covers bases offsets[i]:offsets[i + 1] of the concatenated sequences (so lengths = diff(offsets))
+        mask_*               - runs of masked bases: sequence i owns runs mask_offsets[i]:mask_offsets[i + 1], each run is 'mask_lengths' copies of
+                               the byte 'mask_symbols' starting at base 'mask_starts' (counted from the start of its sequence)
+        id_blob / id_offsets - the UTF-8 encoded sequence IDs, concatenated
+    """
+
+    def __init__(self, packed, offsets, byte_offsets, mask_offsets, mask_starts, mask_lengths, mask_symbols, id_blob, id_offsets):
+        self.packed = packed
+        self.offsets = offsets
+        self.byte_offsets = byte_offsets
+        self.mask_offsets = mask_offsets
+        self.mask_starts = mask_starts
+        self.mask_lengths = mask_lengths
+        self.mask_symbols = mask_symbols
+        self.id_blob = id_blob
+        self.id_offsets = id_offsets
+
+    # ------------------------------------------------ Building / saving ------------------------------------------------
+
+    @classmethod
+    def from_strings(cls, sequences, ids=None):
+        """
+        Packs an iterable of sequence strings (and optionally their IDs, in the same order).
+        """
+        sequences = [str(s) for s in sequences]
+        ids = [""] * len(sequences) if ids is None else [str(i) for i in ids]
+        if len(ids) != len(sequences):
+            raise ValueError("Number of sequence IDs does not match the number of sequences.")
+
+        parts = []
+        start, total = 0, 0
+        for i, seq in enumerate(sequences):
+            total += len(seq)
+            if total >= BUILD_BATCH_NT:
+                parts.append(_pack_batch(sequences[start:i + 1]))
+                start, total = i + 1, 0
+        if start < len(sequences) or not parts:
+            parts.append(_pack_batch(sequences[start:]))
+
+        packed, lengths, byte_lengths, run_counts, mask_starts, mask_lengths, mask_symbols = (np.concatenate(p) for p in zip(*parts))
+        id_bytes = [i.encode("utf-8") for i in ids]
+        return cls(
+            packed=packed,
+            offsets=_offsets(lengths),
+            byte_offsets=_offsets(byte_lengths),
+            mask_offsets=_offsets(run_counts),
+            mask_starts=mask_starts,
+            mask_lengths=mask_lengths,
+            mask_symbols=mask_symbols,
+            id_blob=np.frombuffer(b"".join(id_bytes), dtype=np.uint8),
+            id_offsets=_offsets(np.fromiter((len(b) for b in id_bytes), dtype=np.int64, count=len(id_bytes))),
+        )
+
+    @classmethod
+    def from_dataframe(cls, df, sequence_column="sequence_content", id_column="Sequence_ID"):
+        # A missing sequence (an empty CSV cell is read as NaN) is packed as an empty one
+        return cls.from_strings(df[sequence_column].fillna("").astype(str), df[id_column] if id_column in df.columns else None)
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        for name in _ARRAYS:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        # With mmap=True nothing is read up front - the arrays are memory-mapped, read-only views of the files
+        return cls(**{name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r" if mmap else None) for name in _ARRAYS})
+
+    def subset(self, rows):
+        """
+        A new (in-memory) store of the sequences at positions 'rows', in that order - only their packed bytes are read.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        lengths, byte_lengths = np.diff(self.offsets)[rows], np.diff(self.byte_offsets)[rows]
+        run_counts, id_lengths = np.diff(self.mask_offsets)[rows], np.diff(self.id_offsets)[rows]
+        runs = _expand_runs(self.mask_offsets[rows], run_counts)
+        return PackedSequences(
+            packed=np.asarray(self.packed)[_expand_runs(self.byte_offsets[rows], byte_lengths)],
+            offsets=_offsets(lengths),
+            byte_offsets=_offsets(byte_lengths),
+            mask_offsets=_offsets(run_counts),
+            mask_starts=np.asarray(self.mask_starts)[runs],
+            mask_lengths=np.asarray(self.mask_lengths)[runs],
+            mask_symbols=np.asarray(self.mask_symbols)[runs],
+            id_blob=np.asarray(self.id_blob)[_expand_runs(self.id_offsets[rows], id_lengths)],
+            id_offsets=_offsets(id_lengths),
+        )
+
+    # ------------------------------------------------ Access ------------------------------------------------
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    @property
+    def ids(self):
+        blob = bytes(self.id_blob)
+        return [blob[a:b].decode("utf-8") for a, b in zip(self.id_offsets[:-1], self.id_offsets[1:])]
+
+    def __getitem__(self, i):
+        # The original sequence text (masked bases restored)
+        if i < 0:
+            i += len(self)
+        codes = self.codes(i, i + 1)
+        text = _DECODE[np.where(codes == 255, 0, codes)]
+        for start, length, symbol in self._runs(i, i + 1):
+            text[start:start + length] = symbol
+        return text.tobytes().decode("ascii")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def packed_slice(self, i):
+        # Zero-copy view of the packed bytes of sequence i
+        return self.packed[self.byte_offsets[i]:self.byte_offsets[i + 1]]
+
+    def codes(self, start=0, stop=None):
+        """
+        2-bit codes (0-3) of sequences start..stop-1, concatenated, with 255 at every masked base - the encoding used by Scripts/_feature_engine.py.
+        """
+        stop = len(self) if stop is None else stop
+        packed = np.asarray(self.packed[self.byte_offsets[start]:self.byte_offsets[stop]])
+        padded = ((packed[:, None] >> np.array([6, 4, 2, 0], dtype=np.uint8)) & 3).ravel()
+
+        # Drop the padding that keeps every sequence on a byte boundary
+        lengths = np.diff(self.offsets[start:stop + 1])
+        padded_lengths = np.diff(self.byte_offsets[start:stop + 1]) * 4
+        pos_in_row = np.arange(len(padded)) - np.repeat(np.cumsum(padded_lengths) - padded_lengths, padded_lengths)
+        codes = padded[pos_in_row < np.repeat(lengths, padded_lengths)]
+
+        a, b = self.mask_offsets[start], self.mask_offsets[stop]
+        run_row_starts = np.repeat(np.cumsum(lengths) - lengths, np.diff(self.mask_offsets[start:stop + 1]))
+        codes[_expand_runs(run_row_starts + self.mask_starts[a:b], np.asarray(self.mask_lengths[a:b]))] = 255
+        return codes
+
+    def _runs(self, start, stop):
+        a, b = self.mask_offsets[start], self.mask_offsets[stop]
+        return zip(self.mask_starts[a:b], self.mask_lengths[a:b], self.mask_symbols[a:b])
+
+    def batch_ranges(self, max_nt):
+        # (start, stop) row ranges holding roughly 'max_nt' bases each
+        start = 0
+        while start < len(self):
+            stop = int(np.searchsorted(self.offsets, self.offsets[start] + max_nt, side="right"))
+            stop = min(max(stop - 1, start + 1), len(self))
+            yield start, stop
+            start = stop
+
+    # ------------------------------------------------ Ambiguity summaries (no decoding needed) ------------------------------------------------
+
+    def ambiguous_counts(self, only=None, ignore=""):
+        """
+        Number of masked bases in every sequence. 'only' restricts the count to those symbols (eg. "N"), 'ignore' leaves symbols out.
+        """
+        keep = self._symbol_filter(only, ignore)
+        run_rows = np.repeat(np.arange(len(self)), np.diff(self.mask_offsets))
+        return np.bincount(run_rows[keep], weights=np.asarray(self.mask_lengths)[keep], minlength=len(self)).astype(np.int64)
+
+    def ambiguous_symbols(self, only=None, ignore=""):
+        # The set of masked symbols present anywhere in the store
+        keep = self._symbol_filter(only, ignore)
+        return {chr(s) for s in np.unique(np.asarray(self.mask_symbols)[keep])}
+
+    def _symbol_filter(self, only, ignore):
+        symbols = np.asarray(self.mask_symbols)
+        keep = np.ones(len(symbols), dtype=bool)
+        if only is not None:
+            keep &= np.isin(symbols, np.frombuffer(only.encode("ascii"), dtype=np.uint8))
+        if ignore:
+            keep &= ~np.isin(symbols, np.frombuffer(ignore.encode("ascii"), dtype=np.uint8))
+        return keep
+
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in _ARRAYS)
+
+
+
+def store_path(dataset):
+    # The store saved next to a dataset: PREPROCESSED_x.csv -> PREPROCESSED_x.seqstore
+    return os.path.splitext(str(dataset))[0] + STORE_SUFFIX
+
+
+def save_dataset_store(df, dataset):
+    # Packs the sequence_content (and Sequence_ID) column of the rows of 'dataset' and saves the store next to it
+    store = PackedSequences.from_dataframe(df)
+    store.save(store_path(dataset))
+    return store
+
+
+def dataset_store(dataset):
+    """
+    The sequences of 'dataset', row for row - the store saved next to it is memory-mapped, so its sequence_content column is never read as strings.
+    A dataset without a store (or with one older than the dataset itself) is read and packed instead.
+    """
+    path = store_path(dataset)
+    offsets_file = os.path.join(path, "offsets.npy") # Rewritten on every save (the directory itself is not)
+    if os.path.exists(offsets_file) and os.path.getmtime(offsets_file) >= os.path.getmtime(dataset):
+        return PackedSequences.load(path)
+    return PackedSequences.from_dataframe(read_table(dataset, columns=lambda c: c in ("Sequence_ID", "sequence_content")))
+
+
+def _offsets(lengths):
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return offsets
+
+
+def _expand_runs(starts, lengths):
+    # Every position covered by the runs [starts[j], starts[j] + lengths[j])
+    return np.repeat(starts, lengths) + (np.arange(int(lengths.sum())) - np.repeat(np.cumsum(lengths) - lengths, lengths))
+
+
+def _pack_batch(sequences):
+    # Packs one batch of sequences - returns the per-batch arrays that PackedSequences.from_strings concatenates
+    lengths = np.fromiter((len(s) for s in sequences), dtype=np.int64, count=len(sequences))
+    raw = np.frombuffer("".join(sequences).encode("ascii", errors="replace"), dtype=np.uint8)
+    codes = _ENCODE[raw]
+    masked = codes == 255
+    row_of = np.repeat(np.arange(len(sequences)), lengths)
+    row_starts = _offsets(lengths)[:-1]
+
+    # Run-length encode the masked bases - a run ends at a gap, a change of symbol, or the end of a sequence
+    masked_pos = np.flatnonzero(masked)
+    new_run = np.ones(len(masked_pos), dtype=bool)
+    new_run[1:] = (np.diff(masked_pos) != 1) | (raw[masked_pos[1:]] != raw[masked_pos[:-1]]) | (row_of[masked_pos[1:]] != row_of[masked_pos[:-1]])
+    run_first = masked_pos[new_run]
+    run_lengths = np.diff(np.append(np.flatnonzero(new_run), len(masked_pos)))
+    run_rows = row_of[run_first]
+
+    # Pad every sequence to a multiple of 4 bases, then pack 4 codes per byte
+    byte_lengths = (lengths + 3) // 4
+    padded = np.zeros(int(byte_lengths.sum()) * 4, dtype=np.uint8)
+    padded_starts = _offsets(byte_lengths * 4)[:-1]
+    padded[padded_starts[row_of] + (np.arange(len(raw)) - row_starts[row_of])] = np.where(masked, 0, codes)
+    quads = padded.reshape(-1, 4)
+    packed = (quads[:, 0] << 6) | (quads[:, 1] << 4) | (quads[:, 2] << 2) | quads[:, 3]
+
+    return (
+        packed.astype(np.uint8), lengths, byte_lengths,
+        np.bincount(run_rows, minlength=len(sequences)).astype(np.int64),
+        (run_first - row_starts[run_rows]).astype(np.int64), run_lengths.astype(np.int64), raw[run_first],
+    )
+
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "build":
+        store = PackedSequences.from_dataframe(pd.read_csv(sys.argv[2]))
+        store.save(sys.argv[3])
+        print(f"Packed {len(store)} sequences ({int(store.lengths.sum())} bases) into {sys.argv[3]} - {store.nbytes() / 1024 ** 2:.1f} MB")
+    elif len(sys.argv) == 3 and sys.argv[1] == "info":
+        store = PackedSequences.load(sys.argv[2])
+        print(f"Sequences: {len(store)}  Bases: {int(store.lengths.sum())}  Size: {store.nbytes() / 1024 ** 2:.1f} MB")
+        print(f"Sequences with masked bases: {int((store.ambiguous_counts() > 0).sum())}  Masked symbols: {sorted(store.ambiguous_symbols())}")
+    else:
+        print("Usage: python _sequence_store.py build <dataset.csv> <output.seqstore>")
+        print("       python _sequence_store.py info <dataset.seqstore>")
+        sys.exit(1)
@@ -0,0 +1,126 @@
+# FUNCTIONALITY: This script writes the typed, columnar copy of the COMPLETE_TE_RESULTS_'genome'.csv file - COMPLETE_TE_RESULTS_'genome'.parquet, saved next to the csv.
+               # In the csv every cell is text ('Cluster 5', '86.57%', 'EARLGREY: 2, HELIANO: 1'), so anything reading it has to re-parse those strings row by row.
+               # In the Parquet file the cluster is an integer, the identity a float, the pipeline and family counts are map columns (pipeline/family -> count) and the Pfam proteins a list column,
+               # and a reader can load only the columns it needs (read_typed_results(path, columns=[...])).
+               # It is written by 'format_data.py', and rewritten with the proteins by 'merge.py'. It needs pyarrow - without it only the csv is written.
+               #
+               # Run directly to write the Parquet file for an existing csv (e.g., from a run before this file existed):
+               #   python Scripts/_typed_results.py <COMPLETE_TE_RESULTS_'genome'.csv>
+
+
+
+import re
+import sys
+import importlib.util
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from _add_metrics import cluster_runs
+
+
+
+TYPED_SUFFIX = ".parquet"
+UNKNOWNS_PROPORTION_KEY = b"unknowns_proportion" # Schema metadata key holding the 'Proportion of Unknowns found through clustering' summary (the last row of the csv)
+COUNT_ENTRY_PATTERN = re.compile(r"(.*?): (\d+)(?:, |$)") # One 'name: count' entry of a count text (a name may itself hold ', ', so the text is not simply split on it)
+
+def typed_results_available():
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def typed_results_path(complete_csv):
+    # COMPLETE_TE_RESULTS_'genome'.csv -> COMPLETE_TE_RESULTS_'genome'.parquet, in the same directory (keeps str / Path as given)
+    new_path = Path(complete_csv).with_suffix(TYPED_SUFFIX)
+    return new_path if isinstance(complete_csv, Path) else str(new_path)
+
+
+def typed_results_table(df):
+    """
+    Builds the typed Arrow table from a COMPLETE_TE_RESULTS table (one row per clustered sequence - the proportion-of-unknowns row goes to the schema metadata).
+    Like in the csv, the cluster aggregates (pipeline_count, unknown_count, family_count) are only set on the last row of each cluster.
+    The 'proteins' column is only added once the table has a 'Proteins' column (after 'merge.py').
+    """
+    import pyarrow as pa
+
+    is_member = df["cluster"].notna()
+    members = df[is_member]
+    _, last_rows = cluster_runs(members)
+    is_last = np.zeros(len(members), dtype=bool)
+    is_last[last_rows] = True
+    identity = members["similarity (%)"].astype(object).where(members["similarity (%)"].notna(), None)
+    unknown_count = members["Unknown_Count"].astype(object).where(~is_last | members["Unknown_Count"].notna(), "N/A") # Every last row has one - pandas reads the csv's 'N/A' back as missing
+    counts_type = pa.map_(pa.string(), pa.int32())
+
+    columns = {
+        "cluster": pa.array(members["cluster"].astype(str).str.removeprefix("Cluster ").astype("int64").to_numpy(), pa.int64()),
+        "length": pa.array(members["length (nucleotides [nt] long)"].astype("int64").to_numpy(), pa.int64()),
+        "pipeline": pa.array(_values(members["Pipeline Used"]), pa.string()).dictionary_encode(),
+        "sequence_info": pa.array(_values(members["Sequence Information"]), pa.string()),
+        "location": pa.array(_values(members["location"]), pa.string()),
+        "identity": pa.array(identity.str.rstrip("%").astype("float32").to_numpy(), pa.float32(), from_pandas=True),
+        "representative": pa.array((members["Representative Sequence?"] == "YES").to_numpy(dtype=bool), pa.bool_()),
+        "pipeline_count": pa.array(_counts_column(members["Pipeline_Count"], is_last), counts_type),
+        "unknown_count": pa.array(_values(unknown_count), pa.string()).dictionary_encode(),
+        "family_count": pa.array(_counts_column(members["family_count"], is_last), counts_type),
+    }
+    if "Proteins" in members.columns:
+        columns["proteins"] = pa.array([None if text is None else text.split(", ") for text in _values(members["Proteins"])], pa.list_(pa.string()))
+
+    # The summary row (if any) is the row without a cluster
+    summary = df.loc[~is_member, "Unknown_Count"].dropna()
+    metadata = {UNKNOWNS_PROPORTION_KEY: str(summary.iloc[-1]).encode("utf-8")} if len(summary) else None
+
+    return pa.table(columns, metadata=metadata)
+
+
+def write_typed_results(df, complete_csv):
+    # Writes the Parquet file next to 'complete_csv' (skipped, with a note, if pyarrow is not installed)
+    if not typed_results_available():
+        print(f"\npyarrow is not installed - skipping the typed copy of {complete_csv} ({typed_results_path(complete_csv)}).")
+        return None
+
+    import pyarrow.parquet as pq
+    path = typed_results_path(complete_csv)
+    pq.write_table(typed_results_table(df), path)
+    return path
+
+
+def read_typed_results(path, columns=None):
+    # Reads the Parquet file (only 'columns', if given) as a DataFrame - map columns come back as lists of (key, count) tuples, list columns as arrays
+    return pd.read_parquet(path, columns=columns)
+
+
+def unknowns_proportion(path):
+    # The 'Proportion of Unknowns found through clustering' summary saved with the Parquet file (None if there was none)
+    import pyarrow.parquet as pq
+    metadata = pq.read_schema(path).metadata or {}
+    value = metadata.get(UNKNOWNS_PROPORTION_KEY)
+    return None if value is None else value.decode("utf-8")
+
+
+
+def _values(column):
+    # Cell values of a column as python objects, with missing cells as None
+    return column.astype(object).where(column.notna(), None).tolist()
+
+
+def _counts_column(column, is_last):
+    # The counts of every cluster on its last row (an empty map if the cluster has none - the csv has an empty cell there), and None on the other rows
+    return [_counts(text) if last else None for text, last in zip(_values(column), is_last.tolist())]
+
+
+def _counts(text):
+    # 'EARLGREY: 2, HELIANO: 1' -> [('EARLGREY', 2), ('HELIANO', 1)]
+    if text is None or text == "":
+        return []
+    return [(name, int(count)) for name, count in COUNT_ENTRY_PATTERN.findall(str(text))]
+
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python _typed_results.py <COMPLETE_TE_RESULTS_'genome'.csv>")
+        sys.exit(1)
+
+    written = write_typed_results(pd.read_csv(sys.argv[1]), sys.argv[1])
+    if written:
+        print(f"Typed results written: {written}")
@@ -1,26 +1,37 @@
 #!/usr/bin/env python
 
-# FUNCTIONALITY: This script takes as input the cd_hit '.clstr' file (the one clustered at 80%), then runs it through R to get a rough excel output file.
-              # After this rough excel file is produced, it gets run through the "_optimize_csv.py" file to get a better formatted version of the excel file.
+# FUNCTIONALITY: This script takes as input the cd_hit '.clstr' file (the one clustered at 80%), then parses it in a single streaming pass (with "_clstr_parser.py") into a formatted table.
+              # The metrics columns are then added to that table by "_add_metrics.py", and the result is written out as the final COMPLETE_TE_RESULTS_'genome'.csv file.
+              # The same table is also saved as the cluster table CLUSTER_TABLE_'genome'.npz (with "_cluster_table.py"), which the later steps query instead of re-reading the csv,
+              # and as the typed, columnar COMPLETE_TE_RESULTS_'genome'.parquet file (with "_typed_results.py").
+              # With '--results-db <file.sqlite>', the results are also stored in the SQLite results database (with "_results_db.py").
+              # With '--duplicates <COLLAPSED_DUPLICATES_'genome'.tsv>', the exact duplicates collapsed before clustering (by "_combine_fasta.py") are put back into their clusters first.
 
 
 
 import sys
-import subprocess
+import argparse
 import pandas as pd
 sys.path.append('./Scripts') # I have to specify this path so the following two import statements work
-import _optimize_csv
+import _clstr_parser
+from _combine_fasta import read_duplicates
 import _add_metrics
+from _cluster_table import ClusterTable, cluster_table_path
+from _typed_results import write_typed_results
+from _results_db import store_results
 
 
 
-# Check if the correct number of arguments are provided
-if len(sys.argv) != 2:
-    print("Usage: python format_data.py <final_cdhit '.clstr' file>") # This is the template for the command line that was passed through in main.sh
-    sys.exit(1)
+# Read the arguments - this is the template for the command line that was passed through in main.sh
+parser = argparse.ArgumentParser(usage="python format_data.py <final_cdhit '.clstr' file> [--results-db <file.sqlite>] [--duplicates <duplicates.tsv>]")
+parser.add_argument("final_clstr")
+parser.add_argument("--results-db", default=None)
+parser.add_argument("--duplicates", default=None)
+args = parser.parse_args()
+results_db = args.results_db
 
 # Assign variables and naming conventions
-final_clstr = sys.argv[1]
+final_clstr = args.final_clstr
 final_clstr_location = f"../{final_clstr}"
 final_clstr_no_extension = final_clstr.replace(".clstr", "")
 
@@ -29,19 +40,13 @@ print(f"final_clstr: {final_clstr}")
 
 
 
-# Denote the working directory where the .clstr file (final_clstr) is located for the R script to run
-path_to_wd = "./"
+# _clstr_parser.py - Parse the .clstr file (in the current working directory) straight into the formatted table: one row per cluster member, with the cluster, length, pipeline,
+# sequence information, location, similarity and representative columns
+formatted_excel = _clstr_parser.clstr_table(final_clstr)
 
-# _clstr_to_excel.R - The below format basically passes in these different variables to the R script like command-line-arguments
-subprocess.run(["Rscript", "./Scripts/_clstr_to_excel.R", path_to_wd, final_clstr]) # Runs the clstr_to_excel R script - passing in the path to working directory and the .clstr file
-
-
-
-# Now we call _optimize_excel.py to optimize the rough excel file
-rough_excel = f"{final_clstr_no_extension}_PROTOTYPE.xlsx" # assign the rough excel variable to the output excel file produced from the above R script (which will be
-                                                           # outputted to the main directory, and is named "{final_clstr_no_extension}_PROTOTYPE.xlsx)
-
-formatted_excel = _optimize_csv.main(rough_excel) # Passes in the Prototype Excel File be converted into a better formatted Excel Datasheet
+# Put the exact duplicates collapsed before clustering back into the clusters of the sequences they duplicate (so their pipelines are counted again)
+if args.duplicates:
+    formatted_excel = _clstr_parser.restore_duplicates(formatted_excel, read_duplicates(args.duplicates))
 
 
 
@@ -54,4 +59,14 @@ final_metricized_excel = _add_metrics.main(formatted_excel)
 # Output final Excel file
 final_metricized_excel.to_csv(f"COMPLETE_TE_RESULTS_{base_name}.csv", index=False)
 
+# _cluster_table.py - Save the clusters (members, representatives, unknown status, pipeline and family counts) as the binary cluster table, next to the csv
+ClusterTable.from_results(final_metricized_excel).save(cluster_table_path(f"COMPLETE_TE_RESULTS_{base_name}.csv"))
+
+# _typed_results.py - Save the typed copy of the final file (integer clusters, float identities, map columns for the pipeline and family counts), next to the csv
+write_typed_results(final_metricized_excel, f"COMPLETE_TE_RESULTS_{base_name}.csv")
+
+# _results_db.py - Store the results of this genome in the SQLite results database (if one was given)
+if results_db:
+    store_results(results_db, base_name, final_metricized_excel)
+
 
@@ -1,47 +1,49 @@
 # FUNCTIONALITY: This script, which is called by the 'main.sh' file, will take as input the complete CSV file and the filtered_output_PFAM table. This script will then merge the PFAM table into the complete CSV file,
-               # resulting in a 'proteins' column added to the complete CSV output file.
+               # resulting in a 'proteins' column added to the complete CSV output file. The clusters are read from the cluster table saved next to the complete CSV file (CLUSTER_TABLE_'genome'.npz).
+               # The typed copy of the complete CSV file (COMPLETE_TE_RESULTS_'genome'.parquet) is rewritten as well, with the proteins as a list column,
+               # and so are the genome's results in the SQLite results database, if one is given (--results-db <file.sqlite>).
 
 import sys
+import numpy as np
 import pandas as pd
 from Bio import SeqIO
-from collections import defaultdict
+from _cluster_table import load_cluster_table, UNKNOWN_UNDISCOVERED
+from _typed_results import write_typed_results
+from _results_db import store_results, genome_name
 
 
 
 # passes in the complete csv file and the filtered pfam output csv file
-def main(c_df, p_df):
+def main(c_df, p_df, results_db=None):
     complete_df = pd.read_csv(c_df)
     pfam_df = pd.read_csv(p_df)
+    cluster_table = load_cluster_table(c_df, complete_df) # The csv is read anyway, so the table is checked against its rows (and rebuilt from them if it does not match)
 
     filtered_pfam_df = clean_pfam(pfam_df)
     merged_df, merged_rows = merge_dataframes(complete_df, filtered_pfam_df)
-    final_merged_df = optimize_row_placement(merged_df, merged_rows)
+    final_merged_df = optimize_row_placement(merged_df, merged_rows, cluster_table)
 
     final_merged_df.to_csv(c_df, index=False)
+    write_typed_results(final_merged_df, c_df)
+    if results_db:
+        store_results(results_db, genome_name(c_df), final_merged_df)
 
 
 def clean_pfam(pfam_df): # Cleans pfam dataframe, making it ready for merging with complete dataframe
-    pfam_df = pfam_df[['seq_id', 'hmm_name']].copy()  # Explicitly create a copy of the pfam_dataframe
-    pfam_df = pfam_df.rename(columns={'seq_id': 'Sequence Information'})  # Rename seq_id column so that column names match
+    pfam_df = pfam_df[['seq_id', 'hmm_name']].rename(columns={'seq_id': 'Sequence Information'})  # Rename seq_id column so that column names match
 
-    # Initialize the dictionary to store protein names as sets
-    # Default dicts automatically create a default value (empty list for eg) when you access a key that doesn't exist
-    pfam_dict = defaultdict(set) # To avoid duplicate values, make the value a set
+    # To avoid duplicate values, drop repeated (sequence ID, protein name) pairs
+    pfam_df = pfam_df.drop_duplicates()
 
-    # Iterate through the DataFrame and add protein names to the set for each sequence ID
-    for seq_id, protein_name in zip(pfam_df['Sequence Information'], pfam_df['hmm_name']):
-        pfam_dict[seq_id].add(protein_name)
+    # Group the protein names by seq_id (seq_ids numbered in the order they first appear, protein names kept in the order they appear in the pfam table)
+    seq_id_codes, seq_ids = pd.factorize(pfam_df['Sequence Information'])
+    order = np.argsort(seq_id_codes, kind='stable')
+    protein_names = pfam_df['hmm_name'].to_numpy(dtype=object)[order]
+    bounds = np.searchsorted(seq_id_codes[order], np.arange(len(seq_ids) + 1)).tolist()
 
     # Join multiple protein names for the same seq_id into a comma-separated string
-    for seq_id in pfam_dict:
-        pfam_dict[seq_id] = ', '.join(pfam_dict[seq_id])
-
-    # Convert the dict back into dataframe for merging
-    filtered_pfam_df = pd.DataFrame.from_dict(pfam_dict, orient='index', columns=['Proteins'])
-
-    # Reset the index to treat sequence information as a regular column and name it 'Sequence Information'
-    filtered_pfam_df.reset_index(inplace=True)
-    filtered_pfam_df.rename(columns={'index': 'Sequence Information'}, inplace=True)
+    proteins = [', '.join(protein_names[start:end]) for start, end in zip(bounds, bounds[1:])]
+    filtered_pfam_df = pd.DataFrame({'Sequence Information': seq_ids, 'Proteins': proteins})
 
     return filtered_pfam_df
 
@@ -55,30 +57,35 @@ def merge_dataframes(complete_df, filtered_pfam_df): # This function will merge
 
 
 
-def optimize_row_placement(merged_df, merged_rows):
-    # Get the list of clusters you need to check
-    clusters = merged_rows['cluster'].unique()  # Get unique clusters from merged_rows
-
-    # Create a dictionary to store matching rows (that are in the main complete csv) by cluster
-    matching_rows_dict = {cluster: merged_df[merged_df['cluster'] == cluster] for cluster in clusters}
+def optimize_row_placement(merged_df, merged_rows, cluster_table):
+    # The left merge keeps the rows of the complete csv in order, so its first rows are the members of the cluster table (the last row may be the proportion-of-unknowns row)
+    member_count = cluster_table.number_of_members
+    member_clusters = cluster_table.member_clusters()
+    proteins = merged_df['Proteins'].iloc[:member_count]
+    has_protein = (proteins.notna() & (proteins != '')).to_numpy(dtype=bool)
 
-    # Iterate through each cluster's rows and update as needed
-    for cluster, cluster_df in matching_rows_dict.items(): # cluster is the key, cluseter_df is the value
-        # Find the row where the 'Unknown_Count' column has "UNKNOWN PRESENT: Undiscovered"
-        undiscovered_row = cluster_df[cluster_df['Unknown_Count'] == "UNKNOWN PRESENT: Undiscovered"]
+    # The clusters to check: clusters with a Pfam hit in merged_rows that have an undiscovered unknown ("UNKNOWN PRESENT: Undiscovered" is on the last row of the cluster)
+    hit_rows = merged_df.index.get_indexer(merged_rows.index)
+    clusters = np.unique(member_clusters[hit_rows[hit_rows < member_count]])
+    clusters = clusters[cluster_table.unknown_status[clusters] == UNKNOWN_UNDISCOVERED]
 
-        if not undiscovered_row.empty:
-            # Find the first row with a protein name in the cluster
-            protein_row = cluster_df[cluster_df['Proteins'].notna() & (cluster_df['Proteins'] != '')].iloc[0]
+    # Find the first row with a protein name in each of these clusters
+    protein_rows = np.flatnonzero(has_protein)
+    protein_clusters, first = np.unique(member_clusters[protein_rows], return_index=True)
+    first_protein_row = protein_rows[first[np.searchsorted(protein_clusters, clusters)]]
 
-            # Update the 'undiscovered_row' row with the protein name from protein_row
-            merged_df.loc[undiscovered_row.index, 'Proteins'] = protein_row['Proteins']
+    # Update the undiscovered row (the last row of the cluster) with the protein name from that row
+    undiscovered_rows = cluster_table.last_members[clusters]
+    merged_df.loc[merged_df.index[undiscovered_rows], 'Proteins'] = proteins.iloc[first_protein_row].to_numpy()
 
-            # Clear protein names from all other rows in the same cluster that do not have 'UNKNOWN PRESENT: Undiscovered'
-            merged_df.loc[cluster_df[cluster_df['Unknown_Count'] != "UNKNOWN PRESENT: Undiscovered"].index, 'Proteins'] = None
+    # Clear protein names from all other rows in the same clusters that do not have 'UNKNOWN PRESENT: Undiscovered'
+    other_rows = np.isin(member_clusters, clusters)
+    other_rows[undiscovered_rows] = False
+    merged_df.loc[merged_df.index[np.flatnonzero(other_rows)], 'Proteins'] = None
 
     return merged_df
 
 
 
-main(sys.argv[1], sys.argv[2])
+if __name__ == "__main__":
+    main(sys.argv[1], sys.argv[2], sys.argv[4] if len(sys.argv) == 5 and sys.argv[3] == "--results-db" else None)
@@ -7,14 +7,21 @@ SCRIPT 0
 import shutil
 import sys
 import argparse
-from summarize_ambig_seqs import main___summarize_ambig_seqs
-from preprocessing_before_ftrCool import main___preprocessing_before_ftrCool
-from preprocessing_after_ftrCool import main___preprocessing_after_ftr_cool
-from train_model import main___train_model
 import subprocess
 import os
 from pathlib import Path
 
+# Modules shared by the Train and Classify pipelines live in Scripts/
+sys.path.append(str(Path(__file__).resolve().parent.parent / "Scripts"))
+from _feature_engine import run_feature_backend, save_backend_record
+from _feature_cache import main___cached_feature_extraction, DEFAULT_MAX_GB
+from _feature_exchange import EXCHANGE_FORMATS, exchange_path, resolve_exchange_format
+
+from summarize_ambig_seqs import main___summarize_ambig_seqs
+from preprocessing_before_ftrCool import main___preprocessing_before_ftrCool
+from preprocessing_after_ftrCool import main___preprocessing_after_ftr_cool
+from train_model import main___train_model, main___train_first_stage
+
 def main():
 
     # Print an evident message to the terminal so the user knows that the training process will begin
@@ -50,6 +57,20 @@ def main():
             raise argparse.ArgumentTypeError("n_estimators must be between 50 and 1000")
         return v
 
+    # This function will restrict the number of feature extraction workers
+    def restricted_workers(v):
+        v = int(v)
+        if v < 1:
+            raise argparse.ArgumentTypeError("feature-workers must be at least 1")
+        return v
+
+    # This function will parse and restrict the sparse k-mer orders (eg. "5,6")
+    def restricted_kmer_orders(v):
+        orders = sorted({int(k) for k in v.split(",") if k.strip()})
+        if not orders or not all(4 <= k <= 8 for k in orders):
+            raise argparse.ArgumentTypeError("sparse-kmers must be a comma separated list of k-mer orders between 4 and 8")
+        return orders
+
     # This sets up the argument parser
     parser = argparse.ArgumentParser(
         prog="_START_TRAINING.py",
@@ -65,6 +86,28 @@ def main():
                         help="Top-K features to select (integer in [5, 1000])")
     parser.add_argument("--n-estimators", type=restricted_estimators, default=100,
                         help="Number of trees for Random Forest (integer in [50, 1000])")
+    parser.add_argument("--feature-backend", choices=["r", "python"], default="r",
+                        help="Feature extraction backend: 'r' runs ftrCool_feature_extraction.R, 'python' computes "
+                             "the features in-process (families that need ftrCOOL's property tables are still computed by R; it first checks its families against ftrCOOL and stops if any disagrees)")
+    parser.add_argument("--feature-cache", default=None, metavar="DIR",
+                        help="Directory of the persistent feature cache shared by training and classification runs (disabled if not given)")
+    parser.add_argument("--feature-cache-max-gb", type=float, default=DEFAULT_MAX_GB,
+                        help="Size limit of the feature cache in GB - least recently used entries are evicted beyond it")
+    parser.add_argument("--feature-workers", type=restricted_workers, default=1,
+                        help="Number of concurrent R workers - above 1, the dataset is split into length-balanced shards that are feature-extracted in parallel")
+    parser.add_argument("--family-workers", type=restricted_workers, default=1,
+                        help="Number of forked workers inside each R process - above 1, the feature families are computed concurrently instead of one after another")
+    parser.add_argument("--sparse-kmers", type=restricted_kmer_orders, default=[], metavar="K[,K...]",
+                        help="Also consider the k-mer spectra of these orders (eg. 5,6) as features - they are kept as sparse matrices and pre-selected before SelectKBest")
+    parser.add_argument("--cascade", action="store_true",
+                        help="Also train a small first-stage model on cheap composition features (seq_length, 3-mer and 4-mer frequencies) - classification "
+                             "can then skip full feature extraction for the sequences it is already confident about (--first-stage-model)")
+    parser.add_argument("--with-sequences", action="store_true",
+                        help="Also write the full sequence_content column to the feature-extracted and FINAL datasets (rows are otherwise identified by Sequence_ID)")
+    parser.add_argument("--exchange-format", choices=EXCHANGE_FORMATS, default="auto",
+                        help="File format of the datasets handed to and from ftrCool_feature_extraction.R: 'feather' (Arrow IPC, needs pyarrow and the R package arrow) "
+                             "avoids converting the feature matrix to text and back, 'auto' uses it when available and falls back to 'csv' otherwise "
+                             "('feather' stops with an error if either package is missing)")
 
     # If user supplied no args, show a short usage + tip and exit (like your sys.exit example)
     if len(sys.argv) == 1:
@@ -85,23 +128,41 @@ def main():
     # STEP 1: Summarize all ambiguous sequences in the training dataset to give the user an overview of data quality
     main___summarize_ambig_seqs(args.dataset)
 
+    # Work out the file format of the hand-off between the python stages and ftrCool_feature_extraction.R (Feather or CSV)
+    exchange_format = resolve_exchange_format(args.exchange_format)
+
     # STEP 2: Preprocess the dataset before ftrCool
-    main___preprocessing_before_ftrCool(args.dataset)
+    main___preprocessing_before_ftrCool(args.dataset, exchange_format)
 
-    # STEP 3: Perform feature extraction using R package ftrCool
-    preprocessed_dataset = Path.cwd() / f"PREPROCESSED_{input_file}"
+    # STEP 3: Perform feature extraction using R package ftrCool (or the python feature backend)
+    preprocessed_dataset = exchange_path(Path.cwd() / f"PREPROCESSED_{input_file}", exchange_format)
     r_script = SCRIPT_DIR / "ftrCool_feature_extraction.R"
-    subprocess.run(
-        ["Rscript", str(r_script), str(preprocessed_dataset)],
-        cwd=str(SCRIPT_DIR),
-        check=True
-    )
+    extracted_derived  = exchange_path(Path.cwd() / f"ftrCool_extracted_{os.path.splitext(input_file)[0]}.csv", exchange_format)
+    ftrCool_extracted_dataset = None
+    r_flags = [f"--family-workers={args.family_workers}"] if args.family_workers > 1 else [] # Flags are ignored by the R script's positional arguments
+    if args.feature_cache:
+        main___cached_feature_extraction(
+            preprocessed_dataset, extracted_derived, args.feature_backend, r_script,
+            args.feature_cache, args.feature_cache_max_gb, extra_r_args=r_flags, workers=args.feature_workers, with_sequences=args.with_sequences
+        )
+        ftrCool_extracted_dataset = str(extracted_derived)
+    elif args.feature_backend == "python" or args.feature_workers > 1 or exchange_format == "feather":
+        run_feature_backend(args.feature_backend, preprocessed_dataset, extracted_derived, r_script, extra_r_args=r_flags, workers=args.feature_workers,
+                            with_sequences=args.with_sequences)
+        ftrCool_extracted_dataset = str(extracted_derived)
+    else:
+        subprocess.run(
+            ["Rscript", str(r_script), str(preprocessed_dataset), *r_flags, *(["--with-sequences"] if args.with_sequences else [])],
+            cwd=str(SCRIPT_DIR),
+            check=True
+        )
 
     # STEP 4: Preprocess the dataset after ftrCool
     # Prefer the constant name the R script wrote, but fall back to the derived name if present
     extracted_constant = SCRIPT_DIR / "ftrCool_extracted_training_dataset.csv"
-    extracted_derived  = Path.cwd() / f"ftrCool_extracted_{os.path.splitext(input_file)[0]}.csv"
-    if extracted_constant.exists():
+    if ftrCool_extracted_dataset is not None:
+        pass # Written by the python backend / feature cache at a known path
+    elif extracted_constant.exists():
         ftrCool_extracted_dataset = str(extracted_constant)
     elif extracted_derived.exists():
         ftrCool_extracted_dataset = str(extracted_derived)
@@ -109,19 +170,26 @@ def main():
         # Default to the constant path (keeps behavior predictable if creation happens slightly later)
         ftrCool_extracted_dataset = str(extracted_constant)
 
-    main___preprocessing_after_ftr_cool(ftrCool_extracted_dataset, input_file, args.kbest)
+    main___preprocessing_after_ftr_cool(ftrCool_extracted_dataset, input_file, args.kbest, args.sparse_kmers, preprocessed_dataset)
+
+    # Record the feature backend next to the scaler, so classification can refuse features from another backend
+    save_backend_record(Path("Model_Artifacts") / f"SCALER_{input_file.replace('.CSV', '').replace('.csv', '')}.pkl", args.feature_backend)
 
     # STEP 5: Train the model
     final_training_data = f"FINAL_{input_file}"
     main___train_model(final_training_data, input_file, args.n_estimators)
 
-    # STEP 6: Clean up directory - move all intermediate CSV files to subfolder
+    # STEP 6: Train the first-stage model of the classification cascade
+    if args.cascade:
+        main___train_first_stage(preprocessed_dataset, input_file)
+
+    # STEP 7: Clean up directory - move all intermediate CSV files to subfolder
     INTERMEDIATE_DATA_DIR = "Intermediate_dataset_files"
     os.makedirs(INTERMEDIATE_DATA_DIR, exist_ok=True)
 
-    # Move all intermediate CSV files to the new directory
+    # Move all intermediate CSV (and Feather) files, and the sequence stores saved next to them, to the new directory
     for filename in os.listdir("."):
-        if filename.lower().endswith(".csv") and filename != os.path.basename(args.dataset):
+        if filename.lower().endswith((".csv", ".feather", ".seqstore")) and filename != os.path.basename(args.dataset):
             shutil.move(filename, os.path.join(INTERMEDIATE_DATA_DIR, filename))
 
 
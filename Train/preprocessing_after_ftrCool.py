@@ -6,6 +6,9 @@ SCRIPT 4
     2. Scales the numerical data so that all features fall between a specified range
     3. Choose a subset of the most relevant features from a dataset to use in the ML model using 'selectkbest'
     4. Saved the final preprocessed dataset to be used for model training.    
+
+- If sparse k-mer orders are given (eg. 5 and 6), their k-mer spectra are added as extra candidate features. These are computed, scaled and pre-selected as
+  sparse matrices, and only the pre-selected k-mer columns are added to the (dense) features that go through the scaler and SelectKBest below.
 """
 
 
@@ -13,12 +16,18 @@ SCRIPT 4
 import os
 import pandas as pd
 import numpy as np
-from sklearn.feature_selection import SelectKBest, mutual_info_classif
-from sklearn.preprocessing import MinMaxScaler
+from sklearn.feature_selection import SelectKBest, mutual_info_classif, chi2
+from sklearn.preprocessing import MinMaxScaler, MaxAbsScaler
 from joblib import dump
+from _feature_exchange import read_table
+from _feature_engine import ROW_KEY_COLUMNS, row_sequences, sparse_kmer_frequencies, sparse_kmer_names
+
+
+# Number of k-mers (per k-mer order) that are pre-selected from each sparse k-mer spectrum before the final SelectKBest
+SPARSE_KMER_KEEP = 256
 
 
-def main___preprocessing_after_ftr_cool(dataset, original_dataset_name, number_kbest):
+def main___preprocessing_after_ftr_cool(dataset, original_dataset_name, number_kbest, sparse_kmers=(), preprocessed_dataset=None):
     print("\n")
     print("\n")
     print("-----------------------------------------------------------------------------------------------")
@@ -29,7 +38,7 @@ def main___preprocessing_after_ftr_cool(dataset, original_dataset_name, number_k
     PKL_DIR = "Model_Artifacts"
     os.makedirs(PKL_DIR, exist_ok=True)
 
-    dataset = pd.read_csv(dataset)
+    dataset = read_table(dataset) # CSV or Feather, depending on the exchange format used with ftrCool_feature_extraction.R
     
     # Inspect the dataset
     print("\nDataset head (5 rows):")
@@ -38,7 +47,7 @@ def main___preprocessing_after_ftr_cool(dataset, original_dataset_name, number_k
     dataset.info() # Give further info about this dataset
 
     # Separate features and labels
-    features_df = dataset.iloc[:, 1:-1].copy()   # Features (columns 1 up to the last column - doesn't include the last TE_Order column)
+    features_df = dataset.drop(columns=[c for c in ROW_KEY_COLUMNS if c in dataset.columns]).iloc[:, :-1].copy() # Features (everything except the row key columns - row_index, Sequence_ID, sequence_content if written - and the last TE_Order column)
     labels_df = dataset.iloc[:, -1].copy()    # Final_Class
 
     # Ensure all features are numeric
@@ -54,11 +63,17 @@ def main___preprocessing_after_ftr_cool(dataset, original_dataset_name, number_k
     features_df.replace([np.inf, -np.inf], np.nan, inplace=True)
     features_df.dropna(inplace=True)
 
-    # Align labels and sequence_content column
+    # Align labels and the row key columns
     labels_df = labels_df.loc[features_df.index].reset_index(drop=True) # Aligns labels_df rows to match the row indices of features_df, ensuring both dataframes are perfectly synchronized. The reset_index(drop=True) removes the old indices and reassigns a clean, sequential index (0,1,2,...).
-    sequence_content_col = dataset.loc[features_df.index, 'sequence_content'].reset_index(drop=True) # Selects the 'sequence_content' column for rows matching features_df’s index, and resets the row index
+    kept_rows = dataset.loc[features_df.index]
+    row_key_df = kept_rows[[c for c in ("Sequence_ID", "sequence_content") if c in dataset.columns]].reset_index(drop=True) # Sequence_ID (and sequence_content, only if it was asked for) of the rows matching features_df’s index
     features_df = features_df.reset_index(drop=True)
 
+    # Add the pre-selected columns of the sparse high-order k-mer spectra (if any were requested) - the sequences are looked up by row_index unless they were written
+    if sparse_kmers:
+        sequences = row_sequences(kept_rows, preprocessed_dataset)
+        features_df = pd.concat([features_df, select_sparse_kmers(sequences, labels_df, sparse_kmers, number_kbest)], axis=1)
+
     # Check again after filtering
     print("\nAfter filtering:")
     print("Number of inf values:", np.isinf(features_df).sum().sum())
@@ -108,9 +123,9 @@ def main___preprocessing_after_ftr_cool(dataset, original_dataset_name, number_k
     print("\nSelected features:")
     print(selected_feature_names)
 
-    # Create the final DataFrame - concatenating the sequence_content columns, dataframe, the selected columns of the features_df df, and the labels_df column
+    # Create the final DataFrame - concatenating the row key columns, the selected columns of the features_df df, and the labels_df column
     final_df = pd.concat([
-        sequence_content_col,
+        row_key_df,
         best_features_df[selected_feature_names],
         labels_df.rename('Final_Class')
     ], axis=1)
@@ -118,4 +133,26 @@ def main___preprocessing_after_ftr_cool(dataset, original_dataset_name, number_k
     # Save to CSV
     final_training_dataset_name = f"FINAL_{original_dataset_name}"
     final_df.to_csv(final_training_dataset_name, index=False)
-    print(f"\nFinal dataset produced: {final_training_dataset_name}. Model training will now begin.")
\ No newline at end of file
+    print(f"\nFinal dataset produced: {final_training_dataset_name}. Model training will now begin.")
+
+
+
+# Builds the sparse k-mer spectrum for each order in 'orders', and returns only its most class-related k-mers as a dense DataFrame.
+# The spectra stay sparse (CSR) the whole time - MaxAbsScaler and chi2 both work on sparse matrices, and for non-negative frequencies MaxAbsScaler gives the same [0, 1]
+# range as the MinMaxScaler used for every other feature. mutual_info_classif cannot score sparse continuous features, so chi2 is used for this pre-selection.
+# Only the kept columns are densified (rows x SPARSE_KMER_KEEP per order, instead of rows x 4^k), and they then compete with the other features in the final SelectKBest.
+def select_sparse_kmers(sequences, labels, orders, number_kbest):
+    keep = max(number_kbest, SPARSE_KMER_KEEP)
+    kept_blocks = []
+    for k in orders:
+        kmer_block = sparse_kmer_frequencies(sequences, k)
+        density = kmer_block.nnz / max(1, kmer_block.shape[0] * kmer_block.shape[1]) * 100
+        print(f"\nSparse {k}-mer spectrum: {kmer_block.shape[1]} columns, {kmer_block.nnz} non-zero values ({density:.1f}% of a dense matrix)")
+
+        kmer_scaled = MaxAbsScaler().fit_transform(kmer_block)
+        kmer_selector = SelectKBest(score_func=chi2, k=min(keep, kmer_block.shape[1])).fit(kmer_scaled, labels)
+        kept = kmer_selector.get_support(indices=True)
+        print(f"Keeping the {len(kept)} {k}-mers most associated with the TE orders (chi2) as candidate features")
+
+        kept_blocks.append(pd.DataFrame(kmer_block[:, kept].toarray(), columns=[sparse_kmer_names(k)[i] for i in kept]))
+    return pd.concat(kept_blocks, axis=1)
@@ -6,11 +6,12 @@ SCRIPT 1
 
 
 import pandas as pd
+import numpy as np
 import statistics
 import matplotlib.pyplot as plt
 import sys
 import os
-from Bio.Seq import Seq
+from _sequence_store import PackedSequences
 
 
 
@@ -25,13 +26,11 @@ def main___summarize_ambig_seqs(dataset):
     print(f"Raw training dataset: {dataset}")
     print('length of dataframe is: ', len(df))
 
-    percentages = []
-    
-    # Go through each sequence, take account of all the seqs that have ambiguous nucleotides
-    for index, value in df["sequence_content"].items():
-        seq = Seq(value)
-        ambig_count = sum(1 for base in seq if base not in "ACTG") # This counts all the ambig nucleotides in each seq
-        percentages.append((ambig_count / len(seq)) * 100)
+    # Pack the sequences (2 bits per base) - every base that is not A/C/T/G is kept in the store's ambiguity mask, so it can be counted without looking at each base
+    store = PackedSequences.from_dataframe(df)
+    ambig_counts = store.ambiguous_counts() # This counts all the ambig nucleotides in each seq
+    lengths = store.lengths
+    percentages = (np.divide(ambig_counts, lengths, out=np.zeros(len(lengths)), where=lengths > 0) * 100).tolist() # An empty sequence counts as 0% ambiguous
 
     print("\n")
     print("Showing percentage of ambiguous bases for the first ten sequences: ", percentages[:10])
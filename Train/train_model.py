@@ -31,6 +31,18 @@ from sklearn.calibration import CalibratedClassifierCV
 from imblearn.over_sampling import SMOTE
 from joblib import dump
 
+# For the first-stage (cascade) model
+from _feature_engine import first_stage_features
+from _feature_exchange import read_table
+from _sequence_store import dataset_store
+
+
+# The first-stage model is kept small - it only has to be sure about the easy sequences
+FIRST_STAGE_ESTIMATORS = 100
+
+# Thresholds at which the early-exit rate of the first-stage model is reported (to help pick --classifier-threshold when classifying)
+FIRST_STAGE_REPORT_THRESHOLDS = [0.5, 0.6, 0.7, 0.8, 0.9, 0.95]
+
 
 def main___train_model(data, name, number_of_estimators):
     print("\n")
@@ -121,14 +133,86 @@ def main___train_model(data, name, number_of_estimators):
     print(f"Model training complete. Saved as '{trained_model_path}'. Ready for evaluation on a properly formatted testing dataset.")
 
 
+def main___train_first_stage(preprocessed_dataset, name):
+    print("\n")
+    print("\n")
+    print("-----------------------------------------------------------------------------------------------")
+    print("STEP 6: Train the first-stage (cascade) model on cheap composition features.")
+    print("-----------------------------------------------------------------------------------------------")
+
+    PKL_DIR = "Model_Artifacts"
+    original_dataset_name_no_extension = name.replace(".CSV", "").replace(".csv", "")
+
+    # Reuse the label encoder of the full model, so both stages predict the same integer classes
+    label_encoder = joblib.load(os.path.join(PKL_DIR, f"LABEL_ENCODER_{original_dataset_name_no_extension}.pkl"))
+
+    # The first stage is trained on the preprocessed sequences themselves (before ftrCool) - orders the full model never saw are left out
+    # (the sequences are taken from the packed store saved next to the dataset - only the TE_Order column is read)
+    orders = read_table(preprocessed_dataset, columns=lambda c: c == "TE_Order")["TE_Order"]
+    known = orders.isin(label_encoder.classes_).to_numpy()
+
+    features = first_stage_features(dataset_store(preprocessed_dataset).subset(np.flatnonzero(known))).to_numpy()
+    targets = label_encoder.transform(orders[known])
+    print(f"First-stage features: {features.shape[1]} (seq_length, 3-mer composition, 4-mer spectrum) for {len(targets)} sequences")
+
+    base_rf = RandomForestClassifier(n_estimators=FIRST_STAGE_ESTIMATORS, random_state=42, class_weight="balanced")
+    smote = SMOTE(random_state=42, k_neighbors=3)
+
+    # Out-of-fold probabilities show how many sequences would exit early at each threshold, and how accurate those early exits are
+    out_of_fold_probs = np.zeros((len(targets), len(label_encoder.classes_)))
+    skf = StratifiedKFold(n_splits=5, shuffle=True, random_state=42)
+    for train_idx, test_idx in skf.split(features, targets):
+        X_train, y_train = smote.fit_resample(features[train_idx], targets[train_idx])
+        calibrated_rf = CalibratedClassifierCV(base_rf, method="sigmoid", cv=5)
+        calibrated_rf.fit(X_train, y_train)
+        out_of_fold_probs[np.ix_(test_idx, calibrated_rf.classes_)] = calibrated_rf.predict_proba(features[test_idx])
+
+    report_early_exits(out_of_fold_probs, targets)
+
+    # Refit on the full dataset (with SMOTE) and save next to the full model
+    X_resampled, y_resampled = smote.fit_resample(features, targets)
+    first_stage_model = CalibratedClassifierCV(base_rf, method="sigmoid", cv=5)
+    first_stage_model.fit(X_resampled, y_resampled)
+
+    first_stage_model_path = os.path.join(PKL_DIR, f"FIRST_STAGE_MODEL_{original_dataset_name_no_extension}.pkl")
+    dump(first_stage_model, first_stage_model_path)
+
+    print("\n")
+    print(f"First-stage model saved as '{first_stage_model_path}'. Pass it to the classification step with --first-stage-model to enable the cascade.")
+
+
+def report_early_exits(probs, targets):
+    # For each threshold: the fraction of sequences whose top first-stage probability reaches it (they skip full feature extraction), and the accuracy on those
+    max_val = probs.max(axis=1)
+    correct = probs.argmax(axis=1) == targets
+
+    rows = []
+    for threshold in FIRST_STAGE_REPORT_THRESHOLDS:
+        early = max_val >= threshold
+        rows.append({
+            "threshold": threshold,
+            "early_exit_fraction": early.mean(),
+            "early_exit_accuracy": correct[early].mean() if early.any() else np.nan,
+        })
+    report_df = pd.DataFrame(rows)
+
+    print("\n=== FIRST-STAGE EARLY EXITS (out-of-fold) ===")
+    print(report_df.to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+
+    os.makedirs("Visualizations/Training Metrics", exist_ok=True)
+    report_csv_path = "Visualizations/Training Metrics/first_stage_early_exits.csv"
+    report_df.to_csv(report_csv_path, index=False)
+    print(f"\nFirst-stage early exit report saved to: {report_csv_path}")
+
+
 def load_data(data, name):
     """
     Load and split data from CSV - One list for features and another for targets
     """
     df_randomized = data.sample(frac=1, random_state=42).reset_index(drop=True)
 
-    # features are the (already SCALED) columns from training preprocessing
-    features = df_randomized.iloc[:, 1:-1].values.tolist()
+    # features are the (already SCALED) columns from training preprocessing - everything between the row key columns (Sequence_ID, and sequence_content if it was written) and the last column
+    features = df_randomized.drop(columns=["Sequence_ID", "sequence_content"], errors="ignore").iloc[:, :-1].values.tolist()
     targets = df_randomized.iloc[:, -1].tolist()
 
     target_encoder = LabelEncoder()
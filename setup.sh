@@ -18,16 +18,15 @@ load_module apptainer
 load_module cd-hit/4.8.1
 load_module python/3.11
 load_module R/4.3.1
-load_module emboss/6.6.0
 load_module hmmer
 
 if command -v python3 &> /dev/null; then
     python3 -m pip install --upgrade pip
-    python3 -m pip install pandas biopython "numpy==1.25.2" matplotlib seaborn joblib "scikit-learn==1.3.2" "imbalanced-learn==0.11.0"
+    python3 -m pip install pandas biopython pyarrow "numpy==1.25.2" matplotlib seaborn joblib "scikit-learn==1.3.2" "imbalanced-learn==0.11.0"
 fi
 
 if command -v R &> /dev/null; then
-    Rscript -e "install.packages(c('stringr','dplyr','knitr','openxlsx','ftrCOOL'), repos='https://cloud.r-project.org')"
+    Rscript -e "install.packages(c('ftrCOOL', 'arrow'), repos='https://cloud.r-project.org')"
 fi
 
 # PFAM
@@ -48,6 +47,9 @@ gunzip -c Pfam-A.hmm.gz > pfamdb/Pfam-A.hmm
 # Remove compressed files
 rm Pfam-A.hmm.gz Pfam-A.hmm.dat.gz
 
+# Press the Pfam-A files once into the shared cache every genome run scans against (pfamdb/pressed/Pfam-A_<checksum>)
+python3 ../Scripts/_pfam_cache.py pfamdb
+
 # Clone pfam_scan
 git clone https://github.com/aziele/pfam_scan
 
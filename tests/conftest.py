@@ -0,0 +1,61 @@
+import os
+import sys
+import stat
+import random
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO, "Scripts"))
+sys.path.insert(0, os.path.join(REPO, "Classify"))
+
+COMPLEMENT = str.maketrans("ACGT", "TGCA")
+
+
+
+def random_sequence(rng, length):
+    return "".join(rng.choice("ACGT") for _ in range(length))
+
+
+def substituted_copy(rng, sequence, identity):
+    # A copy of 'sequence' with round((1 - identity) * length) bases substituted (each by another base)
+    bases = list(sequence)
+    for position in rng.sample(range(len(bases)), round((1 - identity) * len(bases))):
+        bases[position] = rng.choice([base for base in "ACGT" if base != bases[position]])
+    return "".join(bases)
+
+
+def te_library(seed, families=12, short_lengths=(80, 400), long_lengths=(500, 1500)):
+    """
+    A random TE library: families of a random ancestor and substituted copies of it (some on the reverse strand) - half of the families SINE/MITE-sized with 1-3 copies
+    at 80-86% identity to the ancestor, half longer with 1-5 copies at 85-99%. Returns (ID, sequence) pairs in a shuffled order.
+    """
+    rng = random.Random(seed)
+    records = []
+    for family in range(families):
+        short = family % 2 == 0
+        ancestor = random_sequence(rng, rng.randint(*(short_lengths if short else long_lengths)))
+        records.append((f"TOOL_family-{family}_ancestor", ancestor))
+        for member in range(rng.randint(1, 3) if short else rng.randint(1, 5)):
+            copy = substituted_copy(rng, ancestor, rng.uniform(0.80, 0.86) if short else rng.uniform(0.85, 0.99))
+            if rng.random() < 0.3:
+                copy = copy.translate(COMPLEMENT)[::-1]
+            records.append((f"TOOL_family-{family}_copy-{member}", copy))
+    rng.shuffle(records)
+    return records
+
+
+def write_fasta(path, records):
+    with open(path, "w") as fasta:
+        for record_id, sequence in records:
+            fasta.write(f">{record_id}\n{sequence}\n")
+    return str(path)
+
+
+
+@pytest.fixture
+def stand_in_cdhit(tmp_path):
+    # An executable that runs tests/stand_in_cdhit.py with this Python (it stands in for both cd-hit-est and cd-hit-est-2d)
+    program = tmp_path / "cd-hit-est"
+    program.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.join(REPO, "tests", "stand_in_cdhit.py")}" "$@"\n')
+    program.chmod(program.stat().st_mode | stat.S_IEXEC)
+    return str(program)
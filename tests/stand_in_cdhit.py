@@ -0,0 +1,101 @@
+# FUNCTIONALITY: A stand-in for cd-hit-est and cd-hit-est-2d, for the tests (cd-hit itself is not needed to run them).
+               # It clusters greedily the way cd-hit does: the sequences longest first (ties in input order), each one joining the most similar representative that meets '-c' (as with '-g 1'),
+               # or becoming a representative itself. The identity of two sequences is the fraction of matching bases over the shorter one, compared from their first base on either strand -
+               # the test libraries are made of substituted copies, so that is their alignment. It writes the output FASTA (the representatives in input order) and the .clstr file in cd-hit's format.
+               # With '-i2' it works as cd-hit-est-2d: the sequences of '-i2' join the most similar representative of '-i' that is at least as long, and the ones that join none are written to the output FASTA.
+               #
+               #   stand_in_cdhit.py -i <input.fa> -o <output> -c <identity> [-i2 <second input.fa>] [other cd-hit options, ignored]
+
+
+
+import sys
+
+
+
+COMPLEMENT = str.maketrans("ACGTacgt", "TGCAtgca")
+
+
+
+def read_fasta(fasta):
+    # (ID, header line, sequence) of every record, in file order
+    records = []
+    with open(fasta, "r") as fasta_file:
+        for line in fasta_file:
+            line = line.rstrip("\n")
+            if line.startswith(">"):
+                records.append([line[1:].split()[0], line, []])
+            elif records:
+                records[-1][2].append(line.strip())
+    return [(record_id, header, "".join(parts)) for record_id, header, parts in records]
+
+
+def identity(representative, sequence):
+    # Best identity of 'sequence' against 'representative' (at least as long) on either strand, and the strand
+    best = (-1.0, "+")
+    for strand, query in (("+", sequence), ("-", sequence.translate(COMPLEMENT)[::-1])):
+        matches = sum(a == b for a, b in zip(representative, query))
+        best = max(best, (matches / max(len(query), 1), strand), key=lambda hit: hit[0])
+    return best
+
+
+def greedy_clusters(records, threshold):
+    # cd-hit's greedy clustering: [representative position, [(member position, identity, strand), ...]] in the order the clusters are found
+    clusters = []
+    for i in sorted(range(len(records)), key=lambda i: -len(records[i][2])):
+        hits = [(identity(records[cluster[0]][2], records[i][2]), c) for c, cluster in enumerate(clusters)]
+        hits = [(hit, c) for hit, c in hits if hit[0] >= threshold]
+        if hits:
+            (best, strand), c = max(hits, key=lambda hit: (hit[0][0], -hit[1]))
+            clusters[c][1].append((i, best, strand))
+        else:
+            clusters.append([i, []])
+    return clusters
+
+
+def write_clstr(clstr_file, clusters, records):
+    # cd-hit's .clstr format: the members of every cluster in input order
+    with open(clstr_file, "w") as clstr:
+        for number, (representative, members) in enumerate(clusters):
+            clstr.write(f">Cluster {number}\n")
+            lines = [(representative, "*")] + [(i, f"at {strand}/{best * 100:.2f}%") for i, best, strand in members]
+            for index, (i, tail) in enumerate(sorted(lines)):
+                clstr.write(f"{index}\t{len(records[i][2])}nt, >{records[i][0]}... {tail}\n")
+
+
+def write_fasta(fasta, positions, records):
+    with open(fasta, "w") as fasta_file:
+        for i in sorted(positions):
+            fasta_file.write(f"{records[i][1]}\n{records[i][2]}\n")
+
+
+def main(argv):
+    options = dict(zip(argv[::2], argv[1::2]))
+    records = read_fasta(options["-i"])
+    threshold = float(options.get("-c", "0.9"))
+
+    if "-i2" not in options:
+        clusters = greedy_clusters(records, threshold)
+        write_clstr(f"{options['-o']}.clstr", clusters, records)
+        write_fasta(options["-o"], [representative for representative, _ in clusters], records)
+        return
+
+    # cd-hit-est-2d - the clusters of the first file's sequences, with the second file's sequences that join them
+    second = read_fasta(options["-i2"])
+    both = records + second
+    clusters = [[i, []] for i in sorted(range(len(records)), key=lambda i: -len(records[i][2]))]
+    unmatched = []
+    for j, (_, _, sequence) in enumerate(second, start=len(records)):
+        hits = [(identity(records[cluster[0]][2], sequence), c) for c, cluster in enumerate(clusters) if len(records[cluster[0]][2]) >= len(sequence)]
+        hits = [(hit, c) for hit, c in hits if hit[0] >= threshold]
+        if hits:
+            (best, strand), c = max(hits, key=lambda hit: (hit[0][0], -hit[1]))
+            clusters[c][1].append((j, best, strand))
+        else:
+            unmatched.append(j)
+    write_clstr(f"{options['-o']}.clstr", clusters, both)
+    write_fasta(options["-o"], unmatched, both)
+
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
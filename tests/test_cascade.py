@@ -0,0 +1,54 @@
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import LabelEncoder
+from _feature_engine import first_stage_features
+from _sequence_store import dataset_store, save_dataset_store
+from classify import main___classify, main___first_stage_classify, report_cascade
+
+
+
+@pytest.fixture
+def first_stage(tmp_path):
+    # A first-stage model of two classes told apart by GC content, and its label encoder
+    rng = np.random.default_rng(0)
+    sequences = ["".join(rng.choice(list("AT" if i % 2 else "GC") * 3 + list("ACGT"), 200)) for i in range(40)]
+    label_encoder = LabelEncoder().fit(["LTR", "SINE"])
+    targets = label_encoder.transform(["LTR" if i % 2 else "SINE" for i in range(40)])
+    model = RandomForestClassifier(n_estimators=10, random_state=0).fit(first_stage_features(sequences).to_numpy(), targets)
+    joblib.dump(model, tmp_path / "FIRST_STAGE_MODEL_x.pkl")
+    joblib.dump(label_encoder, tmp_path / "LABEL_ENCODER_x.pkl")
+    return tmp_path / "FIRST_STAGE_MODEL_x.pkl", tmp_path / "LABEL_ENCODER_x.pkl", sequences
+
+
+def preprocessed(tmp_path, sequences):
+    dataset = tmp_path / "preprocessed_classification_dataset_x.csv"
+    df = pd.DataFrame({"Sequence_ID": [f"s{i}" for i in range(len(sequences))], "sequence_content": sequences})
+    df.to_csv(dataset, index=False)
+    save_dataset_store(df, dataset)
+    return dataset
+
+
+def test_first_stage_splits_the_sequences(tmp_path, first_stage):
+    model, label_encoder, sequences = first_stage
+    remaining_dataset = tmp_path / "cascade_remaining_x.csv"
+    early_exits, remaining = main___first_stage_classify(preprocessed(tmp_path, sequences[:10]), model, label_encoder, 0.7, remaining_dataset)
+    assert sorted(early_exits["Sequence_ID"].tolist() + remaining["Sequence_ID"].tolist()) == sorted(f"s{i}" for i in range(10))
+    assert list(dataset_store(remaining_dataset)) == pd.read_csv(remaining_dataset)["sequence_content"].tolist()
+
+
+def test_empty_dataset(tmp_path, monkeypatch, first_stage):
+    model, label_encoder, _ = first_stage
+    monkeypatch.chdir(tmp_path)
+    remaining_dataset = tmp_path / "cascade_remaining_x.csv"
+    early_exits, remaining = main___first_stage_classify(preprocessed(tmp_path, []), model, label_encoder, 0.7, remaining_dataset)
+    assert len(early_exits) == 0 and list(early_exits.columns) == ["Sequence_ID", "Predicted_Class", "seq_length"]
+    assert len(remaining) == 0 and len(pd.read_csv(remaining_dataset)) == 0
+    assert len(dataset_store(remaining_dataset)) == 0
+
+    # The steps after it run on the empty result as well (the first-stage model stands in for the full model)
+    results = main___classify(None, model, label_encoder, 0.7, early_exits)
+    assert len(results) == 0 and len(pd.read_csv(tmp_path / "AI_Classification_Results" / "classification_results_threshold_0.70.csv")) == 0
+    report_cascade(early_exits, remaining, 0.0, 0.0)
@@ -0,0 +1,95 @@
+# Parity of the python feature backend with ftrCOOL: every native family is compared with the features ftrCool_feature_extraction.R writes for the same sequences.
+# With Rscript and ftrCOOL installed, R is run on the start-up parity sequences of _feature_engine.py (the same check the python backend makes before it runs).
+# Otherwise the R output checked in as tests/fixtures/ftrcool_native_features.csv is used - regenerate it (with ftrCOOL installed) by running, from the top of the repository:
+#   Rscript Train/ftrCool_feature_extraction.R tests/fixtures/ftrcool_sequences.csv --output=tests/fixtures/ftrcool_native_features.csv \
+#       --families=KNUComposition_DNA,CkSNUCpair_DNA,ASDC_DNA,CodonUsage_DNA,ExpectedValKmerNUC_DNA,Mismatch_DNA,CodonFraction,MMI_DNA,PseEIIP,NUCKpartComposition_DNA,Zcurve36bit_DNA,Zcurve144bit_DNA,Zcurve12bit_DNA,Zcurve48bit_DNA,Zcurve9bit_DNA
+# With neither, the parity tests are skipped - the python backend still refuses to run families that do not match ftrCOOL on the machine it runs on.
+
+import os
+import shutil
+import subprocess
+import pandas as pd
+import pytest
+from _feature_engine import ENGINE_VERSION, NATIVE_FAMILIES, backend_mismatch, backend_record_path, extract_features, family_tag, ftrcool_version, native_family_mismatches, \
+    native_parity_failures, save_backend_record
+from _sequence_store import PackedSequences
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, "tests", "fixtures")
+SEQUENCES = os.path.join(FIXTURES, "ftrcool_sequences.csv")
+R_FEATURES = os.path.join(FIXTURES, "ftrcool_native_features.csv")
+R_SCRIPT = os.path.join(ROOT, "Train", "ftrCool_feature_extraction.R")
+
+
+
+def ftrcool_installed():
+    if shutil.which("Rscript") is None:
+        return False
+    return subprocess.run(["Rscript", "-e", "library(ftrCOOL)"], capture_output=True).returncode == 0
+
+
+@pytest.fixture(scope="module")
+def mismatches():
+    # {family: reason} of every native family that does not reproduce ftrCOOL
+    if ftrcool_installed():
+        return native_parity_failures(R_SCRIPT)
+    if os.path.exists(R_FEATURES):
+        return native_family_mismatches(pd.read_csv(SEQUENCES)["sequence_content"].tolist(), pd.read_csv(R_FEATURES), list(NATIVE_FAMILIES))
+    pytest.skip(f"neither ftrCOOL nor its output in {R_FEATURES} is available - see the top of this file")
+
+
+@pytest.mark.parametrize("family", list(NATIVE_FAMILIES))
+def test_native_family_matches_ftrcool(family, mismatches):
+    assert family not in mismatches, mismatches.get(family)
+
+
+def test_mismatching_family_is_reported():
+    sequences = pd.read_csv(SEQUENCES)["sequence_content"].tolist()
+    r_features = extract_features(sequences, ["PseEIIP", "Zcurve9bit_DNA"])
+    r_features.insert(0, "row_index", range(1, len(sequences) + 1))
+    r_features.iloc[2, 5] += 0.01
+    assert list(native_family_mismatches(sequences, r_features, ["PseEIIP", "Zcurve9bit_DNA"])) == ["PseEIIP"]
+
+
+def test_packed_and_string_inputs_agree():
+    sequences = pd.read_csv(SEQUENCES)["sequence_content"].tolist()
+    pd.testing.assert_frame_equal(extract_features(PackedSequences.from_strings(sequences)), extract_features(sequences))
+
+
+def test_python_backend_refuses_families_that_do_not_match(tmp_path, monkeypatch):
+    import _feature_engine
+    monkeypatch.setattr(_feature_engine, "native_parity_failures", lambda r_script, families, extra_r_args: {"PseEIIP": "values differ"})
+    with pytest.raises(SystemExit):
+        _feature_engine.main___python_feature_extraction(SEQUENCES, tmp_path / "out.csv", R_SCRIPT, families=["PseEIIP"])
+    assert not (tmp_path / "out.csv").exists()
+
+
+def test_classification_backend_must_match_training(tmp_path, monkeypatch):
+    import _feature_engine
+    scaler = tmp_path / "SCALER_training.pkl"
+    assert backend_mismatch(scaler, "r") is None and backend_mismatch(scaler, "python") # No record: trained before the python backend, on R features
+
+    save_backend_record(scaler, "python")
+    assert os.path.basename(backend_record_path(scaler)) == "FEATURE_BACKEND_training.json"
+    assert backend_mismatch(scaler, "python") is None
+    assert backend_mismatch(scaler, "r")
+    monkeypatch.setattr(_feature_engine, "ENGINE_VERSION", "changed")
+    assert backend_mismatch(scaler, "python")
+
+
+def test_ftrcool_families_are_tagged_with_the_extractor_version(tmp_path, monkeypatch):
+    # A stand-in Rscript that answers --version like ftrCool_feature_extraction.R
+    rscript = tmp_path / "Rscript"
+    rscript.write_text('#!/bin/sh\necho "STEP 3 banner"\necho "ftrCOOL-$FTRCOOL_VERSION-params1"\n')
+    rscript.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+
+    tags = []
+    for version in ("2.0.0", "2.1.0"):
+        monkeypatch.setenv("FTRCOOL_VERSION", version)
+        ftrcool_version.cache_clear()
+        tags.append(family_tag("r", "KNUComposition_DNA", R_SCRIPT))
+        assert family_tag("python", "DPCP_DNA", R_SCRIPT) == tags[-1]
+    assert tags == ["ftrCOOL-2.0.0-params1", "ftrCOOL-2.1.0-params1"]
+    assert family_tag("python", "KNUComposition_DNA", R_SCRIPT) == f"python-{ENGINE_VERSION}"
+    ftrcool_version.cache_clear()
@@ -0,0 +1,38 @@
+import pandas as pd
+import pytest
+import _feature_exchange
+from _feature_exchange import exchange_path, read_table, resolve_exchange_format, write_table
+
+
+
+def _installed(monkeypatch, pyarrow, r_arrow):
+    monkeypatch.setattr(_feature_exchange.importlib.util, "find_spec", lambda name: object() if pyarrow else None)
+    monkeypatch.setattr(_feature_exchange, "r_has_arrow", lambda: r_arrow)
+
+
+def test_auto_falls_back_to_csv(monkeypatch):
+    _installed(monkeypatch, pyarrow=True, r_arrow=False)
+    assert resolve_exchange_format("auto") == "csv"
+    _installed(monkeypatch, pyarrow=True, r_arrow=True)
+    assert resolve_exchange_format("auto") == "feather"
+
+
+@pytest.mark.parametrize("pyarrow, r_arrow", [(False, True), (True, False), (False, False)])
+def test_explicit_feather_fails_when_unavailable(monkeypatch, pyarrow, r_arrow):
+    _installed(monkeypatch, pyarrow, r_arrow)
+    with pytest.raises(SystemExit):
+        resolve_exchange_format("feather")
+
+
+def test_csv_is_never_checked(monkeypatch):
+    _installed(monkeypatch, pyarrow=False, r_arrow=False)
+    assert resolve_exchange_format("csv") == "csv"
+
+
+@pytest.mark.parametrize("exchange_format", ["csv", "feather"])
+def test_read_table_columns(tmp_path, exchange_format):
+    pytest.importorskip("pyarrow")
+    path = exchange_path(str(tmp_path / "PREPROCESSED_x.csv"), exchange_format)
+    write_table(pd.DataFrame({"Sequence_ID": ["a", "b"], "sequence_content": ["ACGT", "GG"], "TE_Order": ["LTR", "SINE"]}), path)
+    assert list(read_table(path, columns=lambda c: c != "sequence_content").columns) == ["Sequence_ID", "TE_Order"]
+    assert read_table(path)["sequence_content"].tolist() == ["ACGT", "GG"]
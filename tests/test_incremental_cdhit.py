@@ -0,0 +1,70 @@
+import random
+import pytest
+import _incremental_cdhit
+from conftest import te_library, write_fasta, substituted_copy
+from _partition_cdhit import partitioned_cdhit, read_fasta
+from _incremental_cdhit import incremental_cdhit
+
+
+
+def _existing_clustering(tmp_path, seed, cdhit):
+    # Both cd-hit rounds on a random library - returns the FINAL_cdhit FASTA and the (ID, sequence) records of the library
+    library = te_library(seed)
+    outputs = [str(tmp_path / "Clustered_COMBINED_TE_SEQUENCES_old"), str(tmp_path / "FINAL_cdhit_old")]
+    partitioned_cdhit(write_fasta(tmp_path / "combined.fa", library), outputs, 1, 0, cdhit)
+    return outputs[1], library
+
+
+def _new_sequences(seed, library):
+    # Diverged copies of existing sequences (short ones at 81-84% identity, which the sketch often misses) and a few unrelated families
+    rng = random.Random(seed + 1000)
+    records = []
+    for n, (_, sequence) in enumerate(rng.sample(library, 12)):
+        records.append((f"NEW_copy-{n}", substituted_copy(rng, sequence, rng.uniform(0.81, 0.84) if len(sequence) < 500 else rng.uniform(0.85, 0.95))))
+    records += [(f"NEW_{record_id}", sequence) for record_id, sequence in te_library(seed + 2000, families=3)]
+    return records
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_incremental_matches_all_representative_alignment(tmp_path, stand_in_cdhit, monkeypatch, seed):
+    final_fasta, library = _existing_clustering(tmp_path, seed, stand_in_cdhit)
+    new_fasta = write_fasta(tmp_path / "new.fa", _new_sequences(seed, library))
+    incremental_cdhit(final_fasta, new_fasta, str(tmp_path / "FINAL_cdhit_indexed"), cdhit=stand_in_cdhit, cdhit_2d=stand_in_cdhit)
+
+    # The reference: every new sequence aligned against every representative at least as long
+    def every_representative(rep_sequences, new_sequences, *args):
+        return [[r for r, rep in enumerate(rep_sequences) if len(rep) >= len(new)] for new in new_sequences]
+    monkeypatch.setattr(_incremental_cdhit, "candidate_representatives", every_representative)
+    incremental_cdhit(final_fasta, new_fasta, str(tmp_path / "FINAL_cdhit_reference"), cdhit=stand_in_cdhit, cdhit_2d=stand_in_cdhit)
+
+    assert (tmp_path / "FINAL_cdhit_indexed.clstr").read_bytes() == (tmp_path / "FINAL_cdhit_reference.clstr").read_bytes()
+    assert (tmp_path / "FINAL_cdhit_indexed").read_bytes() == (tmp_path / "FINAL_cdhit_reference").read_bytes()
+
+    # Every member of the existing clustering and every new sequence is in exactly one cluster
+    existing_ids = _incremental_cdhit.read_clstr(f"{final_fasta}.clstr")[1]
+    member_ids = _incremental_cdhit.read_clstr(str(tmp_path / "FINAL_cdhit_indexed.clstr"))[1]
+    assert sorted(member_ids) == sorted(existing_ids + read_fasta(new_fasta)[0])
+
+
+def test_new_ids_already_clustered_are_rejected(tmp_path, stand_in_cdhit):
+    final_fasta, library = _existing_clustering(tmp_path, 0, stand_in_cdhit)
+    new_fasta = write_fasta(tmp_path / "new.fa", library[:1])
+    with pytest.raises(ValueError):
+        incremental_cdhit(final_fasta, new_fasta, str(tmp_path / "FINAL_cdhit_new"), cdhit=stand_in_cdhit, cdhit_2d=stand_in_cdhit)
+
+
+def test_sequence_whose_candidates_miss_its_match(tmp_path, stand_in_cdhit):
+    # A copy of representative A with every 7th base substituted (86% identity - no spaced k-mer of A survives) and its end replaced by a stretch of
+    # representative B: its only candidate is B, which it does not match, so it has to be found by the fallback run against every representative
+    rng = random.Random(7)
+    a, b = "".join(rng.choice("ACGT") for _ in range(1000)), "".join(rng.choice("ACGT") for _ in range(1200))
+    copy = "".join(rng.choice("ACGT".replace(base, "")) if i % 7 == 3 else base for i, base in enumerate(a))
+    copy = copy[:940] + b[100:160]
+    outputs = [str(tmp_path / "Clustered_COMBINED_TE_SEQUENCES_old"), str(tmp_path / "FINAL_cdhit_old")]
+    partitioned_cdhit(write_fasta(tmp_path / "combined.fa", [("A", a), ("B", b)]), outputs, 1, 0, stand_in_cdhit)
+    assert _incremental_cdhit.candidate_representatives([a.encode(), b.encode()], [copy.encode()]) == [[1]]
+
+    new_fasta = write_fasta(tmp_path / "new.fa", [("NEW_copy", copy)])
+    assert incremental_cdhit(outputs[1], new_fasta, str(tmp_path / "FINAL_cdhit_new"), cdhit=stand_in_cdhit, cdhit_2d=stand_in_cdhit) == (1, 0)
+    clusters = _incremental_cdhit.read_clstr(str(tmp_path / "FINAL_cdhit_new.clstr"))[0]
+    assert sorted(sorted(_incremental_cdhit._member_id(line) for line in lines) for _, lines in clusters) == [["A", "NEW_copy"], ["B"]]
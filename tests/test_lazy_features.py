@@ -0,0 +1,74 @@
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.feature_selection import SelectKBest, f_classif
+from sklearn.preprocessing import MinMaxScaler
+import preprocessing_after_ftrCool
+from _feature_engine import extract_features, run_feature_backend, sparse_kmer_names
+from _sequence_store import save_dataset_store
+
+FAMILIES = ["KNUComposition_DNA", "Zcurve9bit_DNA"]
+
+
+
+@pytest.fixture
+def trained(tmp_path):
+    # A scaler and selector fitted on two ftrCOOL families plus the sparse 5-mer columns, as train_model.py leaves them
+    rng = np.random.default_rng(0)
+    sequences = ["".join(rng.choice(list("ACGT"), 120)) for _ in range(40)]
+    labels = np.arange(40) % 2
+    kmers = pd.DataFrame(rng.random((40, 8)), columns=sparse_kmer_names(5)[:8])
+    training = pd.concat([pd.DataFrame({"seq_length": [120.0] * 40}), extract_features(sequences, FAMILIES), kmers], axis=1)
+    scaler = MinMaxScaler().fit(training)
+    selector = SelectKBest(f_classif, k=10).fit(scaler.transform(training), labels)
+    joblib.dump(scaler, tmp_path / "scaler.pkl")
+    joblib.dump(selector, tmp_path / "selector.pkl")
+    return training.columns, selector.get_support(), sequences
+
+
+def test_lazy_mode_computes_only_the_selected_kmers(tmp_path, monkeypatch, trained):
+    columns, mask, sequences = trained
+    monkeypatch.chdir(tmp_path)
+    preprocessed = tmp_path / "preprocessed.csv"
+    pd.DataFrame({"Sequence_ID": [f"s{i}" for i in range(5)], "sequence_content": sequences[:5]}).to_csv(preprocessed, index=False)
+    save_dataset_store(pd.read_csv(preprocessed), preprocessed)
+
+    # Lazy extraction - only the selected non-k-mer columns
+    selected = [c for c, kept in zip(columns, mask) if kept]
+    extracted = extract_features(sequences[:5], FAMILIES)
+    extracted = pd.concat([pd.DataFrame({"row_index": range(1, 6), "Sequence_ID": [f"s{i}" for i in range(5)], "seq_length": [120.0] * 5}), extracted], axis=1)
+    extracted = extracted[["row_index", "Sequence_ID"] + [c for c in extracted.columns if c in selected]]
+    extracted.to_csv(tmp_path / "extracted.csv", index=False)
+
+    requested = []
+    original = preprocessing_after_ftrCool.sparse_kmer_columns
+    monkeypatch.setattr(preprocessing_after_ftrCool, "sparse_kmer_columns", lambda seqs, names: requested.append(list(names)) or original(seqs, names))
+    preprocessing_after_ftrCool.main___preprocessing_after_ftr_cool(tmp_path / "extracted.csv", "x", tmp_path / "scaler.pkl", tmp_path / "selector.pkl", preprocessed)
+
+    assert requested == [[c for c in selected if c.endswith("SparseKmer5")]]
+    assert list(pd.read_csv(tmp_path / "FINAL_x.csv").columns) == ["Sequence_ID"] + selected
+
+
+def test_no_ftrcool_family_needed(tmp_path, monkeypatch, trained):
+    # The selector keeps only seq_length and sparse k-mer columns - no family is extracted, R is never run, and no sequence is dropped
+    columns, _, sequences = trained
+    selector = joblib.load(tmp_path / "selector.pkl")
+    selector.k = 9
+    selector.scores_ = np.array([1.0 if c == "seq_length" or c.endswith("SparseKmer5") else 0.0 for c in columns])
+    joblib.dump(selector, tmp_path / "selector.pkl")
+    families = preprocessing_after_ftrCool.selected_feature_families(tmp_path / "scaler.pkl", tmp_path / "selector.pkl")
+    assert families == []
+
+    monkeypatch.chdir(tmp_path)
+    preprocessed = tmp_path / "preprocessed.csv"
+    pd.DataFrame({"Sequence_ID": [f"s{i}" for i in range(5)], "sequence_content": sequences[:5]}).to_csv(preprocessed, index=False)
+    run_feature_backend("r", preprocessed, tmp_path / "extracted.csv", tmp_path / "missing.R", families=families)
+    extracted = pd.read_csv(tmp_path / "extracted.csv")
+    assert list(extracted.columns) == ["row_index", "Sequence_ID", "seq_length"]
+    assert extracted["seq_length"].tolist() == [120] * 5
+
+    preprocessing_after_ftrCool.main___preprocessing_after_ftr_cool(tmp_path / "extracted.csv", "x", tmp_path / "scaler.pkl", tmp_path / "selector.pkl", preprocessed)
+    final = pd.read_csv(tmp_path / "FINAL_x.csv")
+    assert final["Sequence_ID"].tolist() == [f"s{i}" for i in range(5)]
+    assert list(final.columns) == ["Sequence_ID"] + [c for c in columns if c == "seq_length" or c.endswith("SparseKmer5")]
@@ -0,0 +1,115 @@
+# Regression test of merge.py: the group-wise clean_pfam / optimize_row_placement must write the same merged CSV as the row-by-row versions they replaced,
+# which are kept below as the reference. The old clean_pfam joined the protein names of a sequence from a set, so their order within a cell was arbitrary
+# (it changed with the hash seed of every run) - the cells are compared as the same names in sorted order, everything else byte for byte.
+
+import random
+from collections import defaultdict
+import pandas as pd
+import pytest
+from _cluster_table import ClusterTable
+from merge import clean_pfam, merge_dataframes, optimize_row_placement
+
+COLUMNS = ["cluster", "length (nucleotides [nt] long)", "Pipeline Used", "Sequence Information", "location", "similarity (%)",
+           "Representative Sequence?", "Pipeline_Count", "Unknown_Count", "family_count"]
+UNKNOWN_TEXTS = ["N/A", "UNKNOWN PRESENT: Undiscovered", "UNKNOWN PRESENT: Discovered"]
+DOMAINS = ["RVT_1", "rve", "RNase_H", "Transposase_21", "DDE_1", "Helitron_like_N", "gag_pre-integrs"]
+
+
+
+def baseline_clean_pfam(pfam_df):
+    pfam_df = pfam_df[['seq_id', 'hmm_name']].copy()
+    pfam_df = pfam_df.rename(columns={'seq_id': 'Sequence Information'})
+    pfam_dict = defaultdict(set)
+    for seq_id, protein_name in zip(pfam_df['Sequence Information'], pfam_df['hmm_name']):
+        pfam_dict[seq_id].add(protein_name)
+    for seq_id in pfam_dict:
+        pfam_dict[seq_id] = ', '.join(pfam_dict[seq_id])
+    filtered_pfam_df = pd.DataFrame.from_dict(pfam_dict, orient='index', columns=['Proteins'])
+    filtered_pfam_df.reset_index(inplace=True)
+    filtered_pfam_df.rename(columns={'index': 'Sequence Information'}, inplace=True)
+    return filtered_pfam_df
+
+
+def baseline_optimize_row_placement(merged_df, merged_rows):
+    clusters = merged_rows['cluster'].unique()
+    matching_rows_dict = {cluster: merged_df[merged_df['cluster'] == cluster] for cluster in clusters}
+    for cluster, cluster_df in matching_rows_dict.items():
+        undiscovered_row = cluster_df[cluster_df['Unknown_Count'] == "UNKNOWN PRESENT: Undiscovered"]
+        if not undiscovered_row.empty:
+            protein_row = cluster_df[cluster_df['Proteins'].notna() & (cluster_df['Proteins'] != '')].iloc[0]
+            merged_df.loc[undiscovered_row.index, 'Proteins'] = protein_row['Proteins']
+            merged_df.loc[cluster_df[cluster_df['Unknown_Count'] != "UNKNOWN PRESENT: Undiscovered"].index, 'Proteins'] = None
+    return merged_df
+
+
+
+def complete_results(rng, clusters):
+    # A COMPLETE_TE_RESULTS table: clusters of 1-5 members (the representative first), the aggregates and unknown status on the last row of each, then the proportion row
+    rows = []
+    for number in range(clusters):
+        size = rng.randint(1, 5)
+        for member in range(size):
+            last = member == size - 1
+            rows.append([f"Cluster {number}", rng.randint(80, 8000), "EARLGREY", f"rnd-{number}_family-{member}#Unknown",
+                         "*" if member == 0 else "at 1:80:1:80/+", None if member == 0 else "90.00%", "YES" if member == 0 else "No",
+                         "EARLGREY: 1" if last else None, rng.choice(UNKNOWN_TEXTS) if last else None, None])
+    rows.append([None] * 8 + ["Proportion of Unknowns found through clustering: 0.5", None])
+    return pd.DataFrame(rows, columns=COLUMNS)
+
+
+def pfam_hits(rng, complete_df):
+    # Pfam hits of about half the sequences: several ORFs (and domains) per sequence, and the same hit repeated - the other sequences have none
+    hits = []
+    for name in complete_df["Sequence Information"].dropna():
+        if rng.random() < 0.5:
+            for orf in range(rng.randint(1, 3)):
+                for domain in rng.sample(DOMAINS, rng.randint(1, 3)):
+                    hits.extend([[name, f"{name}_ORF{orf}", domain, 1e-20]] * rng.randint(1, 2))
+    rng.shuffle(hits)
+    return pd.DataFrame(hits, columns=["seq_id", "orf_id", "hmm_name", "e_value"])
+
+
+def merged_csv(tmp_path, complete_df, pfam_df, baseline):
+    # merge.py's main(), without the typed copy and the results database - with the baseline or the current functions
+    complete_csv, pfam_csv = tmp_path / "COMPLETE_TE_RESULTS_test.csv", tmp_path / "pfam.csv"
+    complete_df.to_csv(complete_csv, index=False)
+    pfam_df.to_csv(pfam_csv, index=False)
+    complete_df, pfam_df = pd.read_csv(complete_csv), pd.read_csv(pfam_csv)
+
+    if baseline:
+        merged_df, merged_rows = merge_dataframes(complete_df, baseline_clean_pfam(pfam_df))
+        final_df = baseline_optimize_row_placement(merged_df, merged_rows)
+    else:
+        merged_df, merged_rows = merge_dataframes(complete_df, clean_pfam(pfam_df))
+        final_df = optimize_row_placement(merged_df, merged_rows, ClusterTable.from_results(complete_df))
+
+    final_df["Proteins"] = final_df["Proteins"].map(lambda proteins: ", ".join(sorted(proteins.split(", "))) if isinstance(proteins, str) else proteins)
+    output = tmp_path / ("baseline.csv" if baseline else "current.csv")
+    final_df.to_csv(output, index=False)
+    return output.read_bytes()
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_merged_csv_matches_the_baseline(tmp_path, seed):
+    rng = random.Random(seed)
+    complete_df = complete_results(rng, 25)
+    pfam_df = pfam_hits(rng, complete_df)
+    assert merged_csv(tmp_path, complete_df, pfam_df, baseline=False) == merged_csv(tmp_path, complete_df, pfam_df, baseline=True)
+
+
+def test_protein_placement(tmp_path):
+    rng = random.Random(0)
+    complete_df = complete_results(rng, 6)
+    complete_df.loc[complete_df["Unknown_Count"].notna(), "Unknown_Count"] = "UNKNOWN PRESENT: Undiscovered"
+    names = complete_df["Sequence Information"].dropna().tolist()
+    # Duplicate hits and two ORFs on the first sequence, one hit on the second - the third has none
+    pfam_df = pd.DataFrame([[names[0], "o1", "RVT_1", 0.0], [names[0], "o1", "RVT_1", 0.0], [names[0], "o2", "rve", 0.0], [names[1], "o3", "DDE_1", 0.0]],
+                           columns=["seq_id", "orf_id", "hmm_name", "e_value"])
+    current = merged_csv(tmp_path, complete_df, pfam_df, baseline=False)
+    assert current == merged_csv(tmp_path, complete_df, pfam_df, baseline=True)
+
+    final_df = pd.read_csv(tmp_path / "current.csv")
+    cluster = final_df["cluster"] == final_df.loc[0, "cluster"]
+    last = final_df.index[cluster][-1]
+    assert final_df.loc[last, "Proteins"] == "RVT_1, rve"
+    assert final_df.loc[cluster & (final_df.index != last), "Proteins"].isna().all()
@@ -0,0 +1,38 @@
+import pytest
+import numpy as np
+from conftest import te_library, write_fasta, substituted_copy, random_sequence
+from _partition_cdhit import partitioned_cdhit, sequence_components
+
+
+
+def _outputs(directory):
+    return [directory / "Clustered_COMBINED_TE_SEQUENCES_test", directory / "FINAL_cdhit_test"]
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_partitioned_rounds_match_whole_file(tmp_path, stand_in_cdhit, seed):
+    fasta = write_fasta(tmp_path / "combined.fa", te_library(seed))
+    (tmp_path / "whole").mkdir()
+    (tmp_path / "partitioned").mkdir()
+    partitioned_cdhit(fasta, [str(path) for path in _outputs(tmp_path / "whole")], 4, 0, stand_in_cdhit, partition=False)
+    partitioned_cdhit(fasta, [str(path) for path in _outputs(tmp_path / "partitioned")], 4, 0, stand_in_cdhit, partition=True)
+
+    for whole, partitioned in zip(_outputs(tmp_path / "whole"), _outputs(tmp_path / "partitioned")):
+        assert partitioned.read_bytes() == whole.read_bytes()
+        assert partitioned.with_name(partitioned.name + ".clstr").read_bytes() == whole.with_name(whole.name + ".clstr").read_bytes()
+
+
+def test_short_sequences_share_one_component():
+    import random
+    rng = random.Random(0)
+    short_pairs = []
+    for _ in range(50): # 100 nt pairs at 82% identity - the sketch alone misses about half of them
+        ancestor = random_sequence(rng, 100)
+        short_pairs += [ancestor, substituted_copy(rng, ancestor, 0.82)]
+    long_sequence = random_sequence(rng, 2000)
+    sequences = [sequence.encode() for sequence in short_pairs + [long_sequence]]
+
+    components = sequence_components(sequences)
+    assert len(set(components[:-1].tolist())) == 1
+    assert components[-1] != components[0]
+    assert len(np.unique(sequence_components(sequences, short_nt=0))) > 2
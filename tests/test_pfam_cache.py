@@ -0,0 +1,37 @@
+import json
+import os
+import pytest
+import _pfam_cache
+
+
+def cache_dir(tmp_path):
+    # A pressed cache directory with its manifest, without running hmmpress
+    pressed_dir = tmp_path / "Pfam-A_test"
+    pressed_dir.mkdir()
+    names = _pfam_cache.SOURCE_FILES + [_pfam_cache.SOURCE_FILES[0] + extension for extension in _pfam_cache.PRESSED_EXTENSIONS]
+    for name in names:
+        (pressed_dir / name).write_bytes(name.encode("ascii") * 10)
+    files = {name: [os.path.getsize(pressed_dir / name), _pfam_cache._checksum(pressed_dir / name)] for name in names}
+    (pressed_dir / _pfam_cache.MANIFEST).write_text(json.dumps({"files": files}))
+    return pressed_dir
+
+
+def corrupt(path):
+    # Same size, other content
+    content = path.read_bytes()
+    path.write_bytes(content[::-1] if content[::-1] != content else b"x" * len(content))
+
+
+@pytest.mark.parametrize("extension", _pfam_cache.ALWAYS_VERIFIED)
+def test_index_and_filter_checksums_are_checked_on_every_run(tmp_path, extension):
+    pressed_dir = cache_dir(tmp_path)
+    assert _pfam_cache._valid(pressed_dir, verify=False)
+    corrupt(pressed_dir / f"Pfam-A.hmm{extension}")
+    assert not _pfam_cache._valid(pressed_dir, verify=False)
+
+
+def test_profiles_are_only_checksummed_with_verify(tmp_path):
+    pressed_dir = cache_dir(tmp_path)
+    corrupt(pressed_dir / "Pfam-A.hmm.h3m")
+    assert _pfam_cache._valid(pressed_dir, verify=False)
+    assert not _pfam_cache._valid(pressed_dir, verify=True)
@@ -0,0 +1,35 @@
+import itertools
+import _pfam_hit_cache
+from _pfam_hit_cache import PfamHitCache, orf_key
+
+ROWS = "ORF,0,100,RVT_1,PF00078.30,1e-30\n" * 10
+
+
+
+def test_least_recently_used_orfs_are_evicted(tmp_path, monkeypatch):
+    clock = itertools.count()
+    monkeypatch.setattr(_pfam_hit_cache.time, "time", lambda: next(clock)) # Every put / lookup a tick later
+    keys = [orf_key(f"MKV{i}".encode()) for i in range(6)]
+    cache = PfamHitCache(tmp_path, max_gb=5 * len(ROWS) / 1024 ** 3) # Room for 5 ORFs - evicted down to 90% of that, 4 ORFs
+    try:
+        cache.put_many("release", "header\n", {key: ROWS for key in keys[:3]})
+        for key in keys[3:]:
+            cache.put_many("release", None, {key: ROWS})
+        cache.get_many("release", keys[:2]) # The first two ORFs were looked up again - the third, then the fourth, are now the least recently used
+        assert cache.size_bytes() == 6 * len(ROWS)
+
+        cache.evict()
+        assert set(cache.get_many("release", keys)) == {keys[0], keys[1], keys[4], keys[5]}
+        assert cache.header("release") == "header\n"
+    finally:
+        cache.close()
+
+
+def test_cache_under_its_limit_is_kept(tmp_path):
+    cache = PfamHitCache(tmp_path)
+    try:
+        cache.put_many("release", "header\n", {orf_key(b"MKV"): ROWS, orf_key(b"MKL"): ""}) # An ORF without hits is cached as well
+        cache.evict()
+        assert cache.get_many("release", [orf_key(b"MKV"), orf_key(b"MKL")]) == {orf_key(b"MKV"): ROWS, orf_key(b"MKL"): ""}
+    finally:
+        cache.close()
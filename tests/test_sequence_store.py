@@ -0,0 +1,74 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+import pytest
+from _sequence_store import PackedSequences, dataset_store, save_dataset_store, store_path
+import _feature_engine
+from _feature_engine import main___python_feature_extraction
+
+SEQUENCES = ["ACGTNNACGT", "", "acgtRYacgt", "GATTACA", "NNNN", "ACGTACGTACGTA"]
+IDS = ["a", "b", "c", "d", "e", "f"]
+
+
+
+def test_round_trip_and_subset():
+    store = PackedSequences.from_strings(SEQUENCES, IDS)
+    assert list(store) == SEQUENCES
+    assert store.ids == IDS
+    assert store.lengths.tolist() == [len(s) for s in SEQUENCES]
+
+    rows = [5, 0, 2, 1, 2]
+    subset = store.subset(rows)
+    assert list(subset) == [SEQUENCES[r] for r in rows]
+    assert subset.ids == [IDS[r] for r in rows]
+    assert subset.ambiguous_counts().tolist() == store.ambiguous_counts()[rows].tolist()
+    assert np.array_equal(subset.codes(), np.concatenate([store.codes(r, r + 1) for r in rows]))
+
+
+def test_saved_store_is_memory_mapped(tmp_path):
+    store = PackedSequences.from_strings(SEQUENCES, IDS)
+    store.save(tmp_path / "x.seqstore")
+    loaded = PackedSequences.load(tmp_path / "x.seqstore")
+    assert isinstance(loaded.packed, np.memmap)
+    assert list(loaded) == SEQUENCES
+    assert list(loaded.subset([3, 4])) == SEQUENCES[3:5]
+
+
+def test_dataset_store_uses_the_saved_store_unless_stale(tmp_path):
+    dataset = tmp_path / "PREPROCESSED_x.csv"
+    df = pd.DataFrame({"Sequence_ID": IDS, "sequence_content": SEQUENCES})
+    df.to_csv(dataset, index=False)
+    save_dataset_store(df, dataset)
+    assert store_path(dataset) == str(tmp_path / "PREPROCESSED_x.seqstore")
+    assert isinstance(dataset_store(dataset).packed, np.memmap)
+
+    # A dataset rewritten after its store was saved is read and packed again
+    df.iloc[2:4].to_csv(dataset, index=False)
+    os.utime(dataset, (time.time() + 10, time.time() + 10))
+    rebuilt = dataset_store(dataset)
+    assert not isinstance(rebuilt.packed, np.memmap)
+    assert list(rebuilt) == SEQUENCES[2:4]
+
+
+@pytest.mark.parametrize("with_sequences", [False, True])
+def test_python_backend_reads_the_store(tmp_path, monkeypatch, with_sequences):
+    monkeypatch.setattr(_feature_engine, "native_parity_failures", lambda r_script, families, extra_r_args: {}) # No ftrCOOL to check against here
+    rng = np.random.default_rng(0)
+    sequences = ["".join(rng.choice(list("ACGT"), n)) for n in (30, 75, 120, 64)]
+    df = pd.DataFrame({"Sequence_ID": ["s1", "s2", "s3", "s4"], "sequence_content": sequences, "TE_Order": ["LTR", "SINE", "LTR", "DNA"]})
+    families = ["KNUComposition_DNA", "Zcurve9bit_DNA"]
+
+    without_store = tmp_path / "without" / "PREPROCESSED_x.csv"
+    with_store = tmp_path / "with" / "PREPROCESSED_x.csv"
+    for dataset in (without_store, with_store):
+        dataset.parent.mkdir()
+        df.to_csv(dataset, index=False)
+    save_dataset_store(df, with_store)
+
+    for dataset in (without_store, with_store):
+        main___python_feature_extraction(dataset, dataset.parent / "extracted.csv", None, families=families, with_sequences=with_sequences)
+    extracted = pd.read_csv(with_store.parent / "extracted.csv")
+    pd.testing.assert_frame_equal(extracted, pd.read_csv(without_store.parent / "extracted.csv"))
+    assert extracted["seq_length"].tolist() == [len(s) for s in sequences]
+    assert ("sequence_content" in extracted.columns) == with_sequences
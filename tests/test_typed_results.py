@@ -0,0 +1,49 @@
+import pandas as pd
+import pytest
+from _cluster_table import ClusterTable
+from _typed_results import read_typed_results, typed_results_path, unknowns_proportion, write_typed_results
+
+pytest.importorskip("pyarrow")
+from create_classification_dataset import representative_seq_puller, typed_representative_seq_puller
+
+COLUMNS = ["cluster", "length (nucleotides [nt] long)", "Pipeline Used", "Sequence Information", "location", "similarity (%)",
+           "Representative Sequence?", "Pipeline_Count", "Unknown_Count", "family_count"]
+ROWS = [
+    ["Cluster 0", 76, "EARLGREY", "rnd-5_family-6073#Unknown", "at 73:7:4348:4413/-", "86.57%", "No", None, None, None],
+    ["Cluster 0", 7005, "HELIANO", "insertion_Helitron_nonauto_11", "*", None, "YES", "EARLGREY: 1, HELIANO: 1", "UNKNOWN PRESENT: Undiscovered", "non_autonomous_helitron: 1"],
+    ["Cluster 1", 6632, "HELIANO", "insertion_Helitron_nonauto_22", "*", None, "YES", "HELIANO: 1", "N/A", "non_autonomous_helitron: 1"],
+    ["Cluster 2", 6237, "EARLGREY", "rnd-1_family-40#Unknown", "*", None, "YES", "EARLGREY: 1", "UNKNOWN PRESENT: Undiscovered", None],
+    ["Cluster 3", 5973, "HITE", "TE_1#DNA/hAT", "*", None, "YES", None, None, None],
+    ["Cluster 3", 1110, "EARLGREY", "rnd-4_family-205#Unknown", "at 1:1110:4526:5634/+", "87.99%", "No", "EARLGREY: 1, HITE: 1", "UNKNOWN PRESENT: Undiscovered", "DNA/hAT: 1, LINE/L1: 1"],
+    ["Cluster 4", 900, "MITEFINDER", "MITE_7", "*", None, "YES", None, None, None],
+    ["Cluster 4", 850, "EARLGREY", "rnd-2_family-9#Unknown", "at 1:850:1:850/+", "91.00%", "No", "EARLGREY: 1, MITEFINDER: 1", "UNKNOWN PRESENT: Undiscovered", "MITE: 1"],
+    [None, None, None, None, None, None, None, None, "Proportion of Unknowns found through clustering: 0.25", None],
+]
+
+
+
+@pytest.fixture
+def results(tmp_path):
+    df = pd.DataFrame(ROWS, columns=COLUMNS)
+    complete_csv = tmp_path / "COMPLETE_TE_RESULTS_test.csv"
+    df.to_csv(complete_csv, index=False)
+    df = pd.read_csv(complete_csv) # The csv as the readers see it
+    write_typed_results(df, str(complete_csv))
+    return df, typed_results_path(str(complete_csv))
+
+
+def test_typed_columns(results):
+    _, parquet = results
+    typed = read_typed_results(parquet, columns=["cluster", "identity", "family_count"])
+    assert list(typed.columns) == ["cluster", "identity", "family_count"]
+    assert typed["cluster"].tolist() == [0, 0, 1, 2, 3, 3, 4, 4]
+    assert [list(counts) if counts is not None else None for counts in typed["family_count"]] == [
+        None, [("non_autonomous_helitron", 1)], [("non_autonomous_helitron", 1)], [], None, [("DNA/hAT", 1), ("LINE/L1", 1)], None, [("MITE", 1)]]
+    assert unknowns_proportion(parquet) == "Proportion of Unknowns found through clustering: 0.25"
+
+
+def test_typed_puller_matches_the_cluster_table(results):
+    df, parquet = results
+    expected = representative_seq_puller(ClusterTable.from_results(df))
+    assert expected == ["insertion_Helitron_nonauto_11", "rnd-1_family-40#Unknown", "MITE_7"]
+    assert typed_representative_seq_puller(parquet) == expected